@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from records import to_jsonable
+from metrics import registry
+
+# Port of the JSON API when embedded in the Streamlit process (0 disables it)
+API_PORT = int(os.environ.get("SCRAPEGPT_API_PORT", 0))
+
+# Address the API listens on
+API_HOST = os.environ.get("SCRAPEGPT_API_HOST", "127.0.0.1")
+
+# Seconds a request may take before it gets a 504 (the work itself finishes and is cached)
+API_TIMEOUT = float(os.environ.get("SCRAPEGPT_API_TIMEOUT", 60))
+
+# Requests one client may have in flight; further ones get a 429
+CLIENT_CONCURRENCY = int(os.environ.get("SCRAPEGPT_API_CLIENT_CONCURRENCY", 4))
+
+# Threads running the (blocking) pipeline for API requests
+API_WORKERS = int(os.environ.get("SCRAPEGPT_API_WORKERS", 16))
+
+# Seconds allowed for a client to send its request headers
+HEADER_TIMEOUT = 10
+
+# Upper bounds for the per-request limits
+MAX_LIMITS = {'links': 50, 'videos': 20, 'images': 50, 'search_limit': 500}
+DEFAULT_LIMITS = {'links': 10, 'videos': 5, 'images': 12, 'search_limit': 500}
+
+STATUS_TEXT = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    429: 'Too Many Requests', 500: 'Internal Server Error', 504: 'Gateway Timeout',
+}
+
+api_requests = registry.counter(
+    'scrapegpt_api_requests_total', 'API requests by endpoint and status.', ('endpoint', 'status'))
+
+class ClientLimiter:
+    """
+    Caps the requests each client has in flight.
+
+    A slot is held until the pipeline call itself finishes, not just until
+    the client got its 504, so a client that keeps timing out cannot pile
+    up more than its share of worker threads.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, client):
+        """
+        Take a slot for a client.
+
+        Returns:
+            bool: False if the client is at its limit.
+        """
+        with self._lock:
+            count = self._in_flight.get(client, 0)
+            if count >= self.limit:
+                return False
+            self._in_flight[client] = count + 1
+            return True
+
+    def release(self, client):
+        """Give a client's slot back."""
+        with self._lock:
+            count = self._in_flight.get(client, 0) - 1
+            if count > 0:
+                self._in_flight[client] = count
+            else:
+                self._in_flight.pop(client, None)
+
+class APIServer:
+    """
+    Minimal asyncio HTTP/1.1 server exposing generate_response as JSON.
+
+    Endpoints:
+        GET /answer?q=...&links=&videos=&images=&search_limit=
+            The full response as JSON. With stream=1 (or Accept:
+            text/event-stream) parts are sent as Server-Sent Events as the
+            pipeline produces them: search_results, videos, images, text,
+            then a final done event with the whole response.
+        GET /health
+        GET /metrics
+
+    The pipeline runs on a thread pool in this process, so it shares the
+    response cache, scraper caches and HTTP connection pools with
+    everything else running here (e.g. the Streamlit sessions).
+    """
+
+    def __init__(self, timeout=API_TIMEOUT, client_concurrency=CLIENT_CONCURRENCY, workers=API_WORKERS):
+        """
+        Args:
+            timeout (float): Seconds before a request gets a timeout response.
+            client_concurrency (int): Requests one client may have in flight.
+            workers (int): Threads running the pipeline.
+        """
+        self.timeout = timeout
+        self.limiter = ClientLimiter(client_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-worker")
+
+    async def handle(self, reader, writer):
+        """Serve one connection (one request; the connection is then closed)."""
+        endpoint, status = 'unknown', 500
+        try:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HEADER_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+
+            lines = head.decode('latin-1').split('\r\n')
+            try:
+                method, target, _ = lines[0].split(' ', 2)
+            except ValueError:
+                status = await self._send_json(writer, 400, {'error': 'malformed request line'})
+                return
+            headers = {}
+            for line in lines[1:]:
+                name, sep, value = line.partition(':')
+                if sep:
+                    headers[name.strip().lower()] = value.strip()
+
+            url = urlsplit(target)
+            endpoint = url.path if url.path in ('/answer', '/health', '/metrics') else 'unknown'
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+            if method != 'GET':
+                status = await self._send_json(writer, 405, {'error': 'only GET is supported'})
+            elif url.path == '/answer':
+                status = await self._answer(writer, params, headers, writer.get_extra_info('peername'))
+            elif url.path == '/health':
+                status = await self._send_json(writer, 200, {'status': 'ok'})
+            elif url.path == '/metrics':
+                status = await self._send(writer, 200, registry.render().encode('utf-8'),
+                                          'text/plain; version=0.0.4; charset=utf-8')
+            else:
+                status = await self._send_json(writer, 404, {'error': 'not found'})
+        except ConnectionError:
+            # The client went away
+            status = 499
+        except Exception as e:
+            print(f"Error handling API request: {e}")
+        finally:
+            api_requests.labels(endpoint, str(status)).inc()
+            writer.close()
+
+    def _parse_limits(self, params):
+        limits = {}
+        for name, default in DEFAULT_LIMITS.items():
+            value = params.get(name, default)
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be an integer")
+            limits[name] = max(0, min(value, MAX_LIMITS[name]))
+        return {
+            'links_limit': limits['links'],
+            'videos_limit': limits['videos'],
+            'images_limit': limits['images'],
+            'search_limit': max(1, limits['search_limit']),
+        }
+
+    async def _answer(self, writer, params, headers, peer):
+        query = ' '.join(params.get('q', '').split())
+        if not query:
+            return await self._send_json(writer, 400, {'error': 'missing q parameter'})
+        try:
+            limits = self._parse_limits(params)
+        except ValueError as e:
+            return await self._send_json(writer, 400, {'error': str(e)})
+
+        # Internal callers can identify themselves; otherwise the peer address is the client
+        client = headers.get('x-client-id') or (peer[0] if peer else 'unknown')
+        if not self.limiter.acquire(client):
+            return await self._send_json(writer, 429, {'error': 'too many concurrent requests'})
+
+        stream = params.get('stream') in ('1', 'true') or 'text/event-stream' in headers.get('accept', '')
+        loop = asyncio.get_running_loop()
+        partials = asyncio.Queue() if stream else None
+
+        def on_partial(field, value):
+            # Called on the worker thread; hand the part over to the event loop
+            loop.call_soon_threadsafe(partials.put_nowait, (field, to_jsonable(value)))
+
+        # Imported here so the server module loads without the scrapers
+        from job_queue import traced_generate_response
+
+        call = functools.partial(traced_generate_response, query, **limits)
+        if stream:
+            call = functools.partial(call, on_partial=on_partial)
+        future = loop.run_in_executor(self.executor, call)
+        # The slot is freed when the pipeline finishes, even if the client has been answered with a timeout
+        future.add_done_callback(lambda _: self.limiter.release(client))
+
+        if stream:
+            return await self._stream(writer, future, partials, loop)
+
+        try:
+            response = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            return await self._send_json(writer, 504, {'error': f'timed out after {self.timeout:g}s'})
+        except Exception as e:
+            return await self._send_json(writer, 500, {'error': str(e)})
+        return await self._send_json(writer, 200, {'query': query, 'response': to_jsonable(response)})
+
+    async def _stream(self, writer, future, partials, loop):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        await writer.drain()
+
+        future.add_done_callback(lambda _: partials.put_nowait((None, None)))
+        deadline = loop.time() + self.timeout
+        while True:
+            try:
+                field, value = await asyncio.wait_for(partials.get(), max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                await self._send_event(writer, 'error', {'error': f'timed out after {self.timeout:g}s'})
+                return 504
+            if field is not None:
+                await self._send_event(writer, field, value)
+                continue
+
+            # The pipeline finished
+            if future.exception() is not None:
+                await self._send_event(writer, 'error', {'error': str(future.exception())})
+                return 500
+            await self._send_event(writer, 'done', to_jsonable(future.result()))
+            return 200
+
+    async def _send_event(self, writer, event, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        writer.write(f"event: {event}\ndata: {payload}\n\n".encode('utf-8'))
+        await writer.drain()
+
+    async def _send_json(self, writer, status, data):
+        return await self._send(writer, status, json.dumps(data, ensure_ascii=False).encode('utf-8'),
+                                'application/json; charset=utf-8')
+
+    async def _send(self, writer, status, body, content_type):
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+        return status
+
+    async def serve(self, host, port):
+        """Listen on host:port until cancelled."""
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+_thread = None
+_thread_lock = threading.Lock()
+
+def start_api_server(port=API_PORT, host=API_HOST):
+    """
+    Serve the API from a daemon thread inside the current process (once per process).
+
+    Used by the Streamlit app so API requests share its caches and connection pools.
+
+    Args:
+        port (int): Port to listen on; 0 disables the server.
+        host (str): Address to bind.
+
+    Returns:
+        bool: True if the server was started (or already running).
+    """
+    global _thread
+    if not port:
+        return False
+
+    with _thread_lock:
+        if _thread is not None:
+            return True
+
+        def run():
+            try:
+                asyncio.run(APIServer().serve(host, port))
+            except OSError as e:
+                # Another process (e.g. a second Streamlit worker) may already serve the port
+                print(f"Could not start API server on {host}:{port}: {e}")
+
+        _thread = threading.Thread(target=run, name="api-server", daemon=True)
+        _thread.start()
+        print(f"Serving API on http://{host}:{port}/answer")
+        return True
+
+if __name__ == "__main__":
+    # Standalone: python api_server.py [--host 127.0.0.1] [--port 8000]
+    parser = argparse.ArgumentParser(description="Serve ScrapeGPT answers over HTTP.")
+    parser.add_argument('--host', default=API_HOST, help="Address to bind")
+    parser.add_argument('--port', type=int, default=API_PORT or 8000, help="Port to listen on")
+    args = parser.parse_args()
+
+    print(f"Serving API on http://{args.host}:{args.port}/answer")
+    try:
+        asyncio.run(APIServer().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
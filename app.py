@@ -20,12 +20,21 @@ from database import (
     clear_user_queries
 )
 from utils import get_user_avatar, format_time
-from ui_components import (
-    render_chat_message,
-    render_search_results,
-    render_videos_section,
-    render_images_section
-)
+from extraction_pool import warm_up
+from job_queue import job_queue, submit_response_job, DONE
+from prefetcher import prefetcher, PREFETCH_ENABLED, PREFETCH_USER_HISTORY
+from ui_components import render_chat_history
+from session_store import SessionStore
+from tracing import trace, DEBUG_PANEL, stage_stats, recent_traces, format_trace
+from metrics import start_metrics_server
+from api_server import start_api_server
+import profiler
+
+ASSISTANT_AVATAR = "https://images.unsplash.com/photo-1534527489986-3e3394ca569c"
+
+def add_message(role, content, time):
+    """Append a message to the session's chat (see SessionStore.add_message)."""
+    st.session_state.store.add_message(role, content, time)
 
 # Initialize the app
 st.set_page_config(
@@ -38,19 +47,49 @@ st.set_page_config(
 # Initialize database
 create_tables()
 
+@st.cache_resource
+def start_extraction_pool():
+    """Start the HTML extraction worker processes once per server process."""
+    warm_up()
+    return True
+
+start_extraction_pool()
+
+@st.cache_resource
+def start_prefetcher():
+    """Start the background cache prefetcher once per server process."""
+    if PREFETCH_ENABLED:
+        prefetcher.start()
+    return True
+
+start_prefetcher()
+
+@st.cache_resource
+def start_metrics():
+    """Serve Prometheus metrics from a side HTTP server once per server process."""
+    return start_metrics_server()
+
+start_metrics()
+
+@st.cache_resource
+def start_api():
+    """Serve the JSON API from this process (if SCRAPEGPT_API_PORT is set) so it shares the caches."""
+    return start_api_server()
+
+start_api()
+
 # Session state initialization
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "store" not in st.session_state:
+    # Messages and cached responses, spilled to disk once over the session's memory budget
+    st.session_state.store = SessionStore()
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
 if "username" not in st.session_state:
     st.session_state.username = ""
 if "user_avatar" not in st.session_state:
     st.session_state.user_avatar = ""
-if "cache" not in st.session_state:
-    st.session_state.cache = {}
-if "chat_id" not in st.session_state:
-    st.session_state.chat_id = 1  # For tracking multiple chat sessions
+if "pending_job" not in st.session_state:
+    st.session_state.pending_job = None  # Response job still being generated
 
 # App title and description
 st.markdown("""
@@ -75,6 +114,11 @@ with st.sidebar:
         # Always refresh user avatar to get the most current version
         st.session_state.user_avatar = get_user_avatar(username)
         
+        # Warm the cache with the user's recent questions once per login
+        if PREFETCH_ENABLED and PREFETCH_USER_HISTORY and st.session_state.get("history_prefetched") != username:
+            prefetcher.queue_user_history(username)
+            st.session_state.history_prefetched = username
+        
         # Display user info
         col1, col2 = st.columns([1, 3])
         with col1:
@@ -133,7 +177,8 @@ with st.sidebar:
         # Search history
         st.markdown("---")
         st.markdown("## 📚 Search History")
-        user_queries = get_user_queries(username)
+        with trace("db.get_user_queries"):
+            user_queries = get_user_queries(username)
         
         if user_queries:
             for query in user_queries:
@@ -146,12 +191,39 @@ with st.sidebar:
                     if st.button("Ask Again", key=f"ask_again_{query[0]}"):
                         # Insert the question into the chat
                         new_query = query_text
-                        st.session_state.messages.append({"role": "user", "content": new_query, "time": datetime.now().strftime("%H:%M")})
+                        add_message("user", new_query, datetime.now().strftime("%H:%M"))
                         st.rerun()
                 
                 st.markdown("---")
         else:
             st.info("No search history yet.")
+        
+        # Session memory use (older answers are moved to disk past the budget)
+        memory = st.session_state.store.stats()
+        st.caption(
+            f"Session memory: {memory['memory_bytes'] // 1024} KB in memory, "
+            f"{memory['disk_bytes'] // 1024} KB on disk ({memory['disk_items']} answers)"
+        )
+        
+        # Stack sampling of live turns, for the admins listed in SCRAPEGPT_PROFILER_ADMINS
+        if username in profiler.PROFILER_ADMINS:
+            profiling = st.toggle("🔥 Sample CPU profiles", value=profiler.is_enabled())
+            if profiling != profiler.is_enabled():
+                profiler.set_enabled(profiling)
+            if profiling:
+                st.caption(f"Writing collapsed stacks to {profiler.PROFILE_DIR}/")
+                if st.button("Write aggregate profile"):
+                    st.caption(f"Wrote {profiler.write_aggregate()}")
+        
+        # Per-stage timings and the latest chat turn's span tree
+        if DEBUG_PANEL:
+            with st.expander("🐞 Tracing"):
+                stats = stage_stats()
+                if stats:
+                    st.table([{"stage": name, **values} for name, values in stats.items()])
+                turns = [t for t in recent_traces() if t["name"] == "chat_turn"]
+                if turns:
+                    st.code(format_trace(turns[0]), language=None)
     
     # App info
   
@@ -163,49 +235,79 @@ if st.session_state.authenticated:
     with col1:
         if st.button("🆕 New Chat", key="new_chat"):
             # Clear messages but keep the chat history in database
-            st.session_state.messages = []
-            st.session_state.chat_id += 1
+            st.session_state.store.new_chat()
+            st.session_state.pop("fragment_cache", None)
+            st.session_state.pending_job = None
             st.rerun()
             
     with col3:
         if st.button("🗑️ Delete History", key="delete_history"):
             # Clear both messages and database history
-            st.session_state.messages = []
+            st.session_state.store.clear()
+            st.session_state.pop("fragment_cache", None)
+            st.session_state.pending_job = None
             clear_user_queries(st.session_state.username)
-            st.session_state.chat_id += 1
             st.rerun()
     
     # Display a divider
     st.markdown("<hr>", unsafe_allow_html=True)
     
-    # Display chat messages
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            render_chat_message(
-                message["content"],
-                is_user=True,
-                avatar_url=st.session_state.user_avatar,
-                time=message.get("time", "")
-            )
+    # Display chat messages; only the latest turns are rendered in full
+    with trace("render", messages=len(st.session_state.store.messages)), profiler.profile("render"):
+        render_chat_history(
+            st.session_state.store.messages,
+            user_avatar=st.session_state.user_avatar,
+            assistant_avatar=ASSISTANT_AVATAR
+        )
+    
+    # Wait for a response job that is still running (it keeps running across reruns)
+    pending_job = st.session_state.pending_job
+    if pending_job:
+        job = job_queue.get(pending_job["id"])
+        if job is None:
+            # The job was lost (e.g. server restart) or its result expired
+            if not pending_job.get("resubmitted"):
+                # Queue the query again once rather than leaving it unanswered
+                st.session_state.pending_job = {
+                    **pending_job,
+                    "id": submit_response_job(
+                        query=pending_job["query"],
+                        links_limit=st.session_state.links_limit,
+                        videos_limit=st.session_state.videos_limit,
+                        images_limit=st.session_state.images_limit,
+                        search_limit=st.session_state.search_limit
+                    ),
+                    "resubmitted": True
+                }
+            else:
+                st.session_state.pending_job = None
+                add_message(
+                    "assistant",
+                    {"text": f"Sorry, the search for '{pending_job['query']}' was interrupted. Please try again."},
+                    pending_job["time"]
+                )
+            st.rerun()
         else:
-            render_chat_message(
-                message["content"]["text"],
-                is_user=False,
-                avatar_url="https://images.unsplash.com/photo-1534527489986-3e3394ca569c",
-                time=message.get("time", "")
-            )
+            status = st.empty()
+            with st.spinner("Searching the web..."):
+                while not job.wait(timeout=0.5):
+                    # Touching the UI lets Streamlit interrupt this wait when the user interacts
+                    status.caption(f"Working on it... {int(time.time() - job.created_at)}s")
+            status.empty()
             
-            # Display search results if any
-            if "search_results" in message["content"]:
-                render_search_results(message["content"]["search_results"])
+            st.session_state.pending_job = None
+            if job.status == DONE:
+                response = job.result
+                # Cache the response
+                st.session_state.store.cache_set(pending_job["query"], response)
+            else:
+                response = {"text": f"Sorry, something went wrong while searching for '{pending_job['query']}'. Please try again."}
             
-            # Display videos if any
-            if "videos" in message["content"]:
-                render_videos_section(message["content"]["videos"])
+            # Add assistant message to chat
+            add_message("assistant", response, pending_job["time"])
             
-            # Display images if any
-            if "images" in message["content"]:
-                render_images_section(message["content"]["images"])
+            # Rerun to update the UI
+            st.rerun()
     
     # User input
     user_query = st.chat_input("Ask something...")
@@ -213,53 +315,33 @@ if st.session_state.authenticated:
     if user_query:
         # Add user message to chat
         current_time = datetime.now().strftime("%H:%M")
-        st.session_state.messages.append({"role": "user", "content": user_query, "time": current_time})
+        add_message("user", user_query, current_time)
         
         # Save query to database
-        save_query(st.session_state.username, user_query)
+        with trace("db.save_query"):
+            save_query(st.session_state.username, user_query)
         
         # Check if we have a cached response
-        if user_query in st.session_state.cache:
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": st.session_state.cache[user_query],
-                "time": current_time
-            })
+        cached_response = st.session_state.store.cache_get(user_query)
+        if cached_response is not None:
+            add_message("assistant", cached_response, current_time)
             st.rerun()
         
-        # Show a spinner while processing
-        with st.spinner("Searching the web..."):
-            # Import the content generator only when needed
-            from content_generator import generate_response
-            
-            # Get the search limits from session state
-            search_limit = st.session_state.search_limit
-            links_limit = st.session_state.links_limit
-            videos_limit = st.session_state.videos_limit
-            images_limit = st.session_state.images_limit
-            
-            # Generate comprehensive response with facts, text, videos and images
-            # using the customized search limits
-            response = generate_response(
+        # Queue the work so it survives reruns; identical in-flight queries share one job
+        st.session_state.pending_job = {
+            "id": submit_response_job(
                 query=user_query,
-                links_limit=links_limit,
-                videos_limit=videos_limit,
-                images_limit=images_limit,
-                search_limit=search_limit
-            )
-            
-            # Cache the response
-            st.session_state.cache[user_query] = response
-            
-            # Add assistant message to chat
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": response,
-                "time": current_time
-            })
-            
-            # Rerun to update the UI
-            st.rerun()
+                links_limit=st.session_state.links_limit,
+                videos_limit=st.session_state.videos_limit,
+                images_limit=st.session_state.images_limit,
+                search_limit=st.session_state.search_limit
+            ),
+            "query": user_query,
+            "time": current_time
+        }
+        
+        # Rerun to show the question while the answer is being generated
+        st.rerun()
 else:
     # If not authenticated, display a welcome message
     st.info("👈 Please sign in or create an account to start chatting")
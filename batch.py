@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from content_generator import generate_response, normalize_query
+from records import to_jsonable
+from tracing import trace
+
+# Parquet rows buffered before a row group is written
+PARQUET_BATCH_ROWS = 100
+
+# Seconds between progress reports
+REPORT_INTERVAL = 10
+
+def read_queries(path):
+    """
+    Read queries from a file: one per line, or JSONL objects with a "query" field.
+
+    Blank lines, comment lines starting with '#' and repeated queries are skipped.
+
+    Args:
+        path (str): The input file ('-' for stdin).
+
+    Returns:
+        list: The queries, in file order.
+    """
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        queries = []
+        seen = set()
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                line = str(json.loads(line).get('query', '')).strip()
+            key = normalize_query(line)
+            if key and key not in seen:
+                seen.add(key)
+                queries.append(line)
+        return queries
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+class RateLimiter:
+    """Token bucket allowing `rate` query starts per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        """
+        Args:
+            rate (float): Queries started per second (None or 0 for no limit).
+            burst (int): Queries that may start back to back.
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a query may start."""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+class Checkpoint:
+    """
+    Append-only record of the queries already answered, stored next to the output.
+
+    A query is checkpointed only after its result has been flushed to the
+    output, so an interrupted run loses nothing; at worst the last few
+    queries are answered (and written) twice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __contains__(self, query):
+        return normalize_query(query) in self.done
+
+    def add(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            self.done.add(key)
+            self._file.write(key + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class JSONLWriter:
+    """Streams result rows to a JSONL file, one flushed line per query."""
+
+    def __init__(self, path, append=True):
+        """
+        Args:
+            path (str): The output file.
+            append (bool): Add to an existing file (otherwise truncate it).
+        """
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, row):
+        line = json.dumps(row, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class ParquetWriter:
+    """
+    Streams result rows into a directory of Parquet files, one file per run.
+
+    Rows are written in row groups of PARQUET_BATCH_ROWS, so a run that is
+    interrupted keeps everything up to its last flushed group; the
+    directory reads back as one dataset (pyarrow.dataset / pandas).
+    """
+
+    def __init__(self, path, append=True):
+        """
+        Args:
+            path (str): The output directory.
+            append (bool): Keep the parts of earlier runs (otherwise delete them).
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+
+        self._pa = pa
+        result = pa.struct([('title', pa.string()), ('description', pa.string()), ('url', pa.string())])
+        video = pa.struct([
+            ('id', pa.string()), ('title', pa.string()), ('url', pa.string()),
+            ('thumbnail', pa.string()), ('embed_url', pa.string()),
+        ])
+        self.schema = pa.schema([
+            ('query', pa.string()),
+            ('text', pa.string()),
+            ('search_results', pa.list_(result)),
+            ('videos', pa.list_(video)),
+            ('images', pa.list_(pa.string())),
+            ('elapsed', pa.float64()),
+        ])
+
+        os.makedirs(path, exist_ok=True)
+        if not append:
+            for name in os.listdir(path):
+                if name.startswith('part-') and name.endswith('.parquet'):
+                    os.remove(os.path.join(path, name))
+        part = os.path.join(path, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.parquet")
+        self._writer = pq.ParquetWriter(part, self.schema)
+        self._rows = []
+        self._lock = threading.Lock()
+        # Rows only count as written (and get checkpointed) once their row group is flushed
+        self._pending_queries = []
+        self.on_flush = None
+
+    def write(self, row):
+        response = row.get('response') or {}
+        flat = {
+            'query': row['query'],
+            'text': response.get('text'),
+            'search_results': response.get('search_results') or [],
+            'videos': response.get('videos') or [],
+            'images': response.get('images') or [],
+            'elapsed': row['elapsed'],
+        }
+        with self._lock:
+            self._rows.append(flat)
+            self._pending_queries.append(row['query'])
+            if len(self._rows) >= PARQUET_BATCH_ROWS:
+                self._flush()
+
+    def _flush(self):
+        # Called with the lock held
+        if not self._rows:
+            return
+        table = self._pa.Table.from_pylist(self._rows, schema=self.schema)
+        self._writer.write_table(table)
+        flushed = self._pending_queries
+        self._rows = []
+        self._pending_queries = []
+        if self.on_flush:
+            for query in flushed:
+                self.on_flush(query)
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._writer.close()
+
+def answer_query(query, limits):
+    """
+    Answer one query with generate_response.
+
+    Returns:
+        dict: Row with the query, the JSON-ready response and seconds taken;
+        on failure the response is None and 'error' holds the message.
+    """
+    start = time.perf_counter()
+    try:
+        with trace('batch_query', query=query):
+            response = generate_response(query, **limits)
+        return {'query': query, 'response': to_jsonable(response), 'elapsed': time.perf_counter() - start}
+    except Exception as e:
+        print(f"Error answering '{query}': {e}")
+        return {'query': query, 'response': None, 'elapsed': time.perf_counter() - start, 'error': str(e)}
+
+def run_batch(queries, output, fmt='jsonl', concurrency=4, rate=None, burst=1, resume=True,
+              links_limit=10, videos_limit=5, images_limit=12, search_limit=500, report=print):
+    """
+    Answer many queries with bounded concurrency and an optional rate limit.
+
+    Results are streamed to `output` as they finish (JSONL lines, or Parquet
+    row groups in the `output` directory). Finished queries are recorded in
+    `output`.checkpoint, so rerunning the same command skips them. Failed
+    queries are only counted and logged, not written, and are retried on
+    the next run, so each query ends up in the output once.
+
+    Args:
+        queries (list): The queries.
+        output (str): Output JSONL file or Parquet directory.
+        fmt (str): 'jsonl' or 'parquet'.
+        concurrency (int): Queries answered at the same time.
+        rate (float): Maximum queries started per second (None for no limit).
+        burst (int): Queries that may start back to back under the rate limit.
+        resume (bool): Skip queries recorded in the checkpoint (otherwise start over, replacing the output).
+        links_limit (int): Maximum number of links per response
+        videos_limit (int): Maximum number of videos per response
+        images_limit (int): Maximum number of images per response
+        search_limit (int): Maximum number of search results to retrieve
+        report (callable): Receives progress lines (None to stay quiet).
+
+    Returns:
+        dict: Totals: queries answered, skipped and failed, seconds taken and queries per second.
+    """
+    checkpoint_path = output.rstrip('/\\') + '.checkpoint'
+    if not resume and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path)
+
+    todo = [query for query in queries if query not in checkpoint]
+    skipped = len(queries) - len(todo)
+    if report and skipped:
+        report(f"Resuming: {skipped} of {len(queries)} queries already answered")
+
+    if fmt == 'parquet':
+        writer = ParquetWriter(output, append=resume)
+        writer.on_flush = checkpoint.add
+    else:
+        writer = JSONLWriter(output, append=resume)
+
+    limits = {
+        'links_limit': links_limit,
+        'videos_limit': videos_limit,
+        'images_limit': images_limit,
+        'search_limit': search_limit,
+    }
+    limiter = RateLimiter(rate, burst)
+    stats = {'answered': 0, 'failed': 0, 'skipped': skipped, 'latency': 0.0}
+    start = time.monotonic()
+    last_report = start
+
+    def progress():
+        elapsed = time.monotonic() - start
+        done = stats['answered'] + stats['failed']
+        throughput = done / elapsed if elapsed else 0
+        remaining = len(todo) - done
+        eta = remaining / throughput if throughput else 0
+        average = stats['latency'] / done if done else 0
+        return (
+            f"{done}/{len(todo)} answered, {stats['failed']} failed, "
+            f"{throughput:.2f} queries/s, {average:.1f}s avg latency, ETA {eta:.0f}s"
+        )
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch") as executor:
+            pending = set()
+            queue = iter(todo)
+            exhausted = False
+            while pending or not exhausted:
+                # Keep `concurrency` queries in flight; the limiter paces their starts
+                while not exhausted and len(pending) < max(1, concurrency):
+                    query = next(queue, None)
+                    if query is None:
+                        exhausted = True
+                        break
+                    limiter.acquire()
+                    pending.add(executor.submit(answer_query, query, limits))
+
+                if not pending:
+                    break
+                done, pending = wait(pending, timeout=REPORT_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    row = future.result()
+                    stats['latency'] += row['elapsed']
+                    if row.get('error'):
+                        stats['failed'] += 1
+                        continue
+                    writer.write(row)
+                    if fmt != 'parquet':
+                        checkpoint.add(row['query'])
+                    stats['answered'] += 1
+
+                if report and time.monotonic() - last_report >= REPORT_INTERVAL:
+                    report(progress())
+                    last_report = time.monotonic()
+    finally:
+        writer.close()
+        checkpoint.close()
+
+    elapsed = time.monotonic() - start
+    if report:
+        report(progress())
+    done = stats['answered'] + stats['failed']
+    return {
+        'answered': stats['answered'],
+        'failed': stats['failed'],
+        'skipped': skipped,
+        'seconds': elapsed,
+        'queries_per_second': done / elapsed if elapsed else 0,
+    }
+
+def main(argv=None):
+    """Command-line entry point: python batch.py QUERIES -o OUTPUT [options]."""
+    parser = argparse.ArgumentParser(description="Answer a file of queries with ScrapeGPT, without the UI.")
+    parser.add_argument('queries', help="File with one query per line, or JSONL with a \"query\" field ('-' for stdin)")
+    parser.add_argument('-o', '--output', required=True, help="Output JSONL file, or directory for --format parquet")
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), default=None,
+                        help="Output format (default: parquet if the output ends in .parquet, else jsonl)")
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help="Queries answered at the same time")
+    parser.add_argument('--rate', type=float, default=None, help="Maximum queries started per second")
+    parser.add_argument('--burst', type=int, default=1, help="Queries that may start back to back under --rate")
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and answer every query again, replacing the output")
+    parser.add_argument('--links', type=int, default=10, help="Maximum number of links per response")
+    parser.add_argument('--videos', type=int, default=5, help="Maximum number of videos per response")
+    parser.add_argument('--images', type=int, default=12, help="Maximum number of images per response")
+    parser.add_argument('--search-limit', type=int, default=500, help="Maximum number of search results to retrieve")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('parquet' if args.output.rstrip('/\\').endswith('.parquet') else 'jsonl')
+    queries = read_queries(args.queries)
+    print(f"Answering {len(queries)} queries with concurrency {args.concurrency}"
+          + (f" at most {args.rate}/s" if args.rate else ""))
+
+    try:
+        totals = run_batch(
+            queries, args.output, fmt=fmt, concurrency=args.concurrency, rate=args.rate,
+            burst=args.burst, resume=not args.restart, links_limit=args.links,
+            videos_limit=args.videos, images_limit=args.images, search_limit=args.search_limit,
+        )
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume from the checkpoint.")
+        return 130
+
+    print(f"Done: {totals['answered']} answered, {totals['failed']} failed, {totals['skipped']} skipped "
+          f"in {totals['seconds']:.1f}s ({totals['queries_per_second']:.2f} queries/s)")
+    return 1 if totals['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
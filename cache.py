@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    A thread-safe, size-bounded cache whose entries expire after a fixed time.
+
+    Shared at module level so that every Streamlit session in the process
+    benefits from work done by the others.
+    """
+
+    def __init__(self, maxsize=1000, ttl=3600):
+        """
+        Args:
+            maxsize (int): Maximum number of entries before the least recently used is evicted.
+            ttl (float): Seconds an entry stays valid.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            # Mark as recently used
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entries if the cache is full."""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def expires_in(self, key):
+        """
+        Get the number of seconds until an entry expires.
+
+        Returns:
+            float: Seconds left, or None if the key is missing or already expired.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            remaining = entry[1] - time.time()
+            return remaining if remaining > 0 else None
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] > time.time()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,170 @@
+import threading
+import time
+
+import requests
+
+from metrics import registry
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised by scrapers to skip straight to their fallback while a circuit is open."""
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one upstream (search engine, image or video site).
+
+    After `failure_threshold` consecutive failures (captcha pages, 5xx,
+    timeouts) the breaker opens and callers skip the upstream entirely,
+    going straight to their fallback results. After `recovery_timeout`
+    seconds a limited number of half-open probe requests are let through:
+    a successful probe closes the breaker, a failed one opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=3, recovery_timeout=60, half_open_max_calls=1):
+        """
+        Args:
+            name (str): Name of the upstream, used in log messages.
+            failure_threshold (int): Consecutive failures that open the breaker.
+            recovery_timeout (float): Seconds to stay open before probing again.
+            half_open_max_calls (int): Probe requests allowed at once while half-open.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_failure_reason = None
+        self._half_open_calls = 0
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        Check whether a request to the upstream may be made now.
+
+        Returns:
+            bool: False if the breaker is open (the caller should use its fallback).
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    return False
+                # Recovery timeout elapsed, start probing
+                self.state = HALF_OPEN
+                self._half_open_calls = 0
+
+            if self.state == HALF_OPEN:
+                now = time.monotonic()
+                if self._half_open_calls >= self.half_open_max_calls:
+                    # A probe that never reported back must not block the upstream forever
+                    if now - self._probe_started_at < self.recovery_timeout:
+                        return False
+                    self._half_open_calls = 0
+                self._half_open_calls += 1
+                self._probe_started_at = now
+
+            return True
+
+    def record_success(self):
+        """Record a successful request, closing the breaker if it was probing."""
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"Circuit breaker for {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self, reason=""):
+        """
+        Record a failed request (captcha/block page, 5xx, timeout).
+
+        Args:
+            reason (str): Short description of the failure, for logging.
+        """
+        with self._lock:
+            self.failures += 1
+            self.last_failure_reason = reason
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"Circuit breaker for {self.name} opened after {self.failures} failures: {reason}")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._half_open_calls = 0
+
+    def is_open(self):
+        """Check if requests are currently being short-circuited."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.recovery_timeout
+
+# Breakers shared by all sessions in the process, keyed by upstream name
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name, **kwargs):
+    """
+    Get the process-wide circuit breaker for an upstream, creating it if needed.
+
+    Args:
+        name (str): Name of the upstream (e.g. 'duckduckgo', 'bing_images', 'youtube').
+        **kwargs: CircuitBreaker settings, only used when the breaker is created.
+
+    Returns:
+        CircuitBreaker: The shared breaker.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, **kwargs)
+            _breakers[name] = breaker
+        return breaker
+
+def _collect_breaker_states():
+    # Read at scrape time: 1 while an upstream is being short-circuited
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    for breaker in breakers:
+        circuit_open.labels(breaker.name).set(1 if breaker.is_open() else 0)
+
+circuit_open = registry.gauge('scrapegpt_circuit_open', 'Whether an upstream circuit breaker is open.', ('engine',))
+registry.register_collector('circuit_breakers', _collect_breaker_states)
+
+def looks_blocked(html):
+    """
+    Check if a response body is a captcha or block page rather than real content.
+
+    Args:
+        html (str): The response body.
+
+    Returns:
+        bool: True if the page looks like a captcha/anomaly/block page.
+    """
+    text = html[:20000].lower()
+    return any(marker in text for marker in (
+        'captcha', 'unusual traffic', 'anomaly-modal', 'are you a robot', 'access denied'
+    ))
+
+def is_upstream_failure(error):
+    """
+    Check if a request error means the upstream itself is failing.
+
+    Timeouts, connection errors, 5xx responses and the 403/429 replies
+    upstreams send when they block or rate-limit us count; any other 4xx (a
+    dead link, a video that was taken down) says nothing about the upstream's
+    health.
+
+    Args:
+        error (requests.exceptions.RequestException): The error raised by the request.
+
+    Returns:
+        bool: True if the error should be recorded as a breaker failure.
+    """
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(error, 'response', None)
+    return response is not None and (response.status_code >= 500 or response.status_code in (403, 429))
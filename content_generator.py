@@ -1,110 +1,82 @@
 import trafilatura
-from web_scraper import get_search_results, get_website_text
+from web_scraper import get_search_results, get_website_text, get_random_user_agent
+from page_index import search_pages, MIN_LOCAL_PAGES
+from knowledge_base import knowledge_base
+from text_mining import FactMiner
+from ranking import rank_results
+from url_normalizer import url_key
+from http_client import fetch_bytes, HTML_CONTENT_TYPES
 from youtube_scraper import get_youtube_videos
 from image_scraper import get_images
 import re
 import random
+from single_flight import SingleFlight
+from text_sanitizer import sanitize_text
+from cache import TTLCache
+from tracing import traced, annotate
+from metrics import turn_seconds, watch_cache
+import time
 
 # Generate facts and tips based on search results
+@traced('facts')
 def generate_facts_and_tips(query, num_facts=5, search_limit=500):
     """
     Generate facts and tips related to the query using web scraping.
     Returns more facts (5 by default) to provide richer responses.
     Facts are organized in a logical sequence for better readability.
+    Pages extracted in earlier turns are searched first (see page_index);
+    the web is only crawled when they don't yield enough facts.
     
     Args:
         query (str): The search query
         num_facts (int): Number of facts to return (default: 5)
         search_limit (int): Maximum number of search results to retrieve (default: 500)
     """
-    # Common educational topics with prepared content for fallback
-    educational_topics = {
-        "photosynthesis": [
-            "Photosynthesis is the process by which green plants, algae and some bacteria convert light energy from the sun into chemical energy stored in glucose.",
-            "During photosynthesis, plants take in carbon dioxide and water and release oxygen as a byproduct.",
-            "The overall equation for photosynthesis is: 6CO2 + 6H2O + light energy → C6H12O6 + 6O2.",
-            "Chlorophyll, the green pigment in plants, is essential for capturing light energy during photosynthesis.",
-            "Photosynthesis occurs primarily in the chloroplasts of plant cells, specifically in the thylakoid membranes."
-        ],
-        "solar system": [
-            "Our solar system consists of the Sun, eight planets, dwarf planets, moons, asteroids, comets and other celestial bodies.",
-            "The eight planets in order from the Sun are: Mercury, Venus, Earth, Mars, Jupiter, Saturn, Uranus, and Neptune.",
-            "Jupiter is the largest planet in our solar system, while Mercury is the smallest.",
-            "The Sun contains 99.86% of the mass in the solar system.",
-            "Pluto was reclassified as a dwarf planet in 2006 by the International Astronomical Union."
-        ],
-        "machine learning": [
-            "Machine learning is a branch of artificial intelligence that enables computer systems to learn from data and improve without explicit programming.",
-            "The three main types of machine learning are supervised learning, unsupervised learning, and reinforcement learning.",
-            "Supervised learning uses labeled training data to make predictions, while unsupervised learning finds patterns in unlabeled data.",
-            "Neural networks, decision trees, and support vector machines are common machine learning algorithms.",
-            "Deep learning is a subset of machine learning that uses neural networks with multiple layers to analyze complex patterns."
-        ]
-    }
-    
-    # Check if query contains any of the educational topics
-    for topic, prepared_facts in educational_topics.items():
-        if topic in query.lower():
-            return prepared_facts[:num_facts]
+    # Curated facts for well-known topics (see knowledge_base.json)
+    prepared_facts = knowledge_base.lookup(query)
+    annotate(knowledge_base=prepared_facts is not None)
+    if prepared_facts:
+        return prepared_facts[:num_facts]
     
-    # Get search results - using customizable search limit for comprehensive coverage
-    search_results = get_search_results(query, max_results=search_limit)
+    # Keywords a sentence must mention to count as a fact
+    keywords = [word.lower() for word in query.split() if len(word) > 3]
+    if not keywords:  # If no long words, use all words
+        keywords = [word.lower() for word in query.split()]
     
+    # Definition phrases and keywords are compiled once for all pages
+    miner = FactMiner(query, keywords)
     facts = []
     
+    # Answer from pages extracted in earlier turns when the local index has enough
+    # relevant ones; the crawl below then only runs to fill the gaps
+    local_pages = search_pages(keywords, limit=10)
+    used_keys = set()
+    if len(local_pages) >= MIN_LOCAL_PAGES:
+        for page_url, page_text in local_pages:
+            used_keys.add(url_key(page_url))
+            miner.extract(page_text, facts, num_facts)
+            if len(facts) >= num_facts * 2:
+                break
+    annotate(local_pages=len(local_pages), local_facts=len(facts))
+    
+    search_results = []
+    if len(facts) < num_facts * 2:
+        # Get search results - using customizable search limit for comprehensive coverage
+        search_results = get_search_results(query, max_results=search_limit)
+    
     # Extract facts from search results in order of relevance
     # First, extract from top results (likely more relevant)
     for result in search_results[:10]:
+        if len(facts) >= num_facts * 2:
+            break
         try:
             # Get URL with default fallback
             result_url = result.get("url", "#")
-            if result_url != "#":  # Skip placeholder results
+            # Skip placeholder results and pages already used from the index
+            if result_url != "#" and url_key(result_url) not in used_keys:
                 # Get text from the website
                 text = get_website_text(result_url, max_paragraphs=8)
-                
-                # Clean any HTML tags from the text first
-                text = re.sub(r'<.*?>', '', text)
-                
-                # Extract sentences that contain keywords from the query
-                sentences = re.split(r'(?<=[.!?])\s+', text)
-                keywords = [word.lower() for word in query.split() if len(word) > 3]
-                if not keywords:  # If no long words, use all words
-                    keywords = [word.lower() for word in query.split()]
-                
-                # Look for definition-like sentences first (they make good introductory facts)
-                definition_patterns = [
-                    f"{query.lower()} is", 
-                    f"{query.lower()} are", 
-                    f"{query.lower()} refers to",
-                    f"definition of {query.lower()}"
-                ]
-                
-                # First pass - look for definition sentences
-                for sentence in sentences:
-                    if len(sentence) > 30 and any(pattern in sentence.lower() for pattern in definition_patterns):
-                        # Clean up the sentence
-                        clean_sentence = re.sub(r'\s+', ' ', sentence).strip()
-                        # Remove any HTML tags completely
-                        clean_sentence = re.sub(r'<[^>]*>', '', clean_sentence)
-                        if clean_sentence and clean_sentence not in facts:  # Avoid duplicates and empty strings
-                            facts.append(clean_sentence)
-                            if len(facts) >= 2:  # Get up to 2 definition sentences
-                                break
-                
-                # Second pass - add other relevant sentences
-                for sentence in sentences:
-                    if len(sentence) > 30 and any(keyword in sentence.lower() for keyword in keywords):
-                        # Clean up the sentence
-                        clean_sentence = re.sub(r'\s+', ' ', sentence).strip()
-                        # Remove any HTML tags completely
-                        clean_sentence = re.sub(r'<[^>]*>', '', clean_sentence)
-                        if clean_sentence and clean_sentence not in facts:  # Avoid duplicates and empty strings
-                            facts.append(clean_sentence)
-                            if len(facts) >= num_facts * 2:  # Get more than we need so we can select the best
-                                break
-                
-                if len(facts) >= num_facts * 2:
-                    break
+                miner.extract(text, facts, num_facts)
         except Exception as e:
             # Get URL for error message (safely)
             error_url = result.get("url", "unknown URL") if result else "unknown URL"
@@ -116,7 +88,7 @@ def generate_facts_and_tips(query, num_facts=5, search_limit=500):
             description = result.get("description", "")
             if len(description) > 30:
                 # Clean the description of any HTML
-                clean_description = re.sub(r'<[^>]*>', '', description)
+                clean_description = sanitize_text(description)
                 if clean_description and clean_description not in facts:
                     facts.append(clean_description)
     
@@ -178,19 +150,42 @@ def get_webpage_content(url):
         return "No URL provided."
         
     try:
-        downloaded = trafilatura.fetch_url(url)
-        text = trafilatura.extract(downloaded)
+        # Streamed with a size cap; non-HTML responses are rejected from their headers
+        html = fetch_bytes(
+            url,
+            headers={'User-Agent': get_random_user_agent()},
+            timeout=15,
+            allowed_types=HTML_CONTENT_TYPES
+        )
+        text = trafilatura.extract(html)
         return text if text else "Could not extract content from the webpage."
     except Exception as e:
         print(f"Error extracting content from {url}: {e}")
         return "Error extracting content."
 
+# Concurrent identical queries share one crawl
+response_flight = SingleFlight("generate_response")
+
+# Seconds a generated response stays fresh
+RESPONSE_TTL = 3600
+
+# Responses shared by all sessions, keyed by normalized query and limits
+response_cache = TTLCache(maxsize=1000, ttl=RESPONSE_TTL)
+watch_cache('response', response_cache)
+
+def normalize_query(query):
+    """Normalize a query for use in coalescing and cache keys."""
+    return ' '.join(query.lower().split())
+
 # Generate a comprehensive response
-def generate_response(query, links_limit=10, videos_limit=5, images_limit=12, search_limit=500):
+def generate_response(query, links_limit=10, videos_limit=5, images_limit=12, search_limit=500, on_partial=None):
     """
     Generate a comprehensive response based on web search, including 
     text summaries, images and videos.
     Content is organized in a logical sequence for better user experience.
+    Responses are cached process-wide for RESPONSE_TTL seconds, and
+    concurrent calls for the same normalized query and limits wait on a
+    single computation and share its result.
     
     Args:
         query (str): The search query
@@ -198,7 +193,54 @@ def generate_response(query, links_limit=10, videos_limit=5, images_limit=12, se
         videos_limit (int): Maximum number of videos to display (default: 5)
         images_limit (int): Maximum number of images to display (default: 12)
         search_limit (int): Maximum number of search results to retrieve (default: 500)
+        on_partial (callable): Called as on_partial(field, value) when each part of
+            the response is ready, for streaming (not called on a cache hit or when
+            joining another caller's computation)
+    """
+    start = time.perf_counter()
+    key = response_key(query, links_limit, videos_limit, images_limit, search_limit)
+    cached_response = response_cache.get(key)
+    annotate(response_cache='hit' if cached_response is not None else 'miss')
+    if cached_response is not None:
+        turn_seconds.labels('hit').observe(time.perf_counter() - start)
+        return cached_response
+    
+    response = refresh_response(query, links_limit, videos_limit, images_limit, search_limit, on_partial)
+    turn_seconds.labels('miss').observe(time.perf_counter() - start)
+    return response
+
+def response_key(query, links_limit=10, videos_limit=5, images_limit=12, search_limit=500):
+    """Build the response cache / coalescing key for a query and its limits."""
+    return (normalize_query(query), links_limit, videos_limit, images_limit, search_limit)
+
+def refresh_response(query, links_limit=10, videos_limit=5, images_limit=12, search_limit=500, on_partial=None):
     """
+    Generate a response without consulting the cache and store it there.
+    Used by generate_response on a cache miss and by the prefetcher to
+    renew entries before they expire.
+    
+    Returns:
+        dict: The response (see generate_response).
+    """
+    key = response_key(query, links_limit, videos_limit, images_limit, search_limit)
+    
+    def compute():
+        response = _generate_response(query, links_limit, videos_limit, images_limit, search_limit, on_partial)
+        response_cache.set(key, response)
+        return response
+    
+    return response_flight.do(key, compute)
+
+def _generate_response(query, links_limit, videos_limit, images_limit, search_limit, on_partial=None):
+    """Build the response for generate_response (see there)."""
+    def partial(field, value):
+        if on_partial is not None:
+            try:
+                on_partial(field, value)
+            except Exception as e:
+                # A consumer that went away must not fail the shared computation
+                print(f"Error delivering partial {field}: {e}")
+
     # Step 1: Get search results - using search_limit for customizable comprehensive results
     # This needs to be done first as subsequent steps depend on the search results
     search_results = get_search_results(query, max_results=search_limit)
@@ -209,6 +251,13 @@ def generate_response(query, links_limit=10, videos_limit=5, images_limit=12, se
         if result.get("title") and result.get("url") and result.get("description")
     ]
     
+    # Step 1b: Rank the whole result set and pick the links to display
+    # (done before the slower steps so the links can be streamed first)
+    # BM25 over titles and descriptions, with IDF learned from earlier searches
+    # and domain-diversity reranking (see ranking.py)
+    displayed_results = rank_results(query, filtered_search_results, limit=links_limit)
+    partial('search_results', displayed_results)
+    
     # Step 2: Generate facts and tips in a logical sequence
     # Facts will be organized with definitions first, then details
     facts = generate_facts_and_tips(query, search_limit=search_limit)
@@ -216,24 +265,19 @@ def generate_response(query, links_limit=10, videos_limit=5, images_limit=12, se
     # Step 3: Get visual content - this can happen in parallel with text content
     # Get YouTube videos with customizable limit
     videos = get_youtube_videos(query, max_results=videos_limit)
+    partial('videos', videos)
     
     # Get images with customizable limit
     images = get_images(query, max_results=images_limit)
+    partial('images', images)
     
     # Step 4: Format the textual facts in a clean, logical sequence
     facts_text = ""
     if facts:
         facts_text = "Here are some key points I found:\n\n"
         for i, fact in enumerate(facts, 1):
-            # More comprehensive cleaning of HTML tags
-            # First remove any complete HTML tags
-            clean_fact = re.sub(r'<[^>]*>', '', fact)
-            # Then remove any leftover HTML entities or fragment tags
-            clean_fact = re.sub(r'</?\w+.*?>', '', clean_fact)
-            # Clean any HTML entities
-            clean_fact = re.sub(r'&[a-z]+;', '', clean_fact)
-            # Normalize whitespace
-            clean_fact = re.sub(r'\s+', ' ', clean_fact).strip()
+            # Strip tags, decode entities and normalize whitespace
+            clean_fact = sanitize_text(fact)
             
             # Only add the fact if it's not empty after cleaning
             if clean_fact:
@@ -246,31 +290,9 @@ def generate_response(query, links_limit=10, videos_limit=5, images_limit=12, se
     # 1. Introduction
     # 2. Key facts and information
     text = f"{introduction}\n\n{facts_text}"
+    partial('text', text)
     
-    # Step 5: Organize search results by relevance and quality
-    # Sort search results by relevance (keeping the top ones)
-    # with preference for those that have longer, more informative descriptions
-    
-    # First, add a relevance score to each result
-    scored_results = []
-    for i, result in enumerate(filtered_search_results[:min(50, len(filtered_search_results))]):  # Consider up to 50 results
-        score = 100 - i  # Base score by position (higher for earlier results)
-        
-        # Add points for results that contain the exact query in title
-        if query.lower() in result.get('title', '').lower():
-            score += 50
-            
-        # Add points for longer descriptions (likely more informative)
-        desc_length = len(result.get('description', ''))
-        score += min(desc_length / 20, 30)  # Up to 30 points for description length
-        
-        # Add the scored result
-        scored_results.append((result, score))
-        
-    # Sort by score and take top links_limit
-    displayed_results = [r for r, _ in sorted(scored_results, key=lambda x: x[1], reverse=True)][:links_limit]
-    
-    # Step 6: Create the final response object with all content
+    # Step 5: Create the final response object with all content
     # organized in a logical presentation order
     response = {
         "text": text,
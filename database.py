@@ -2,6 +2,7 @@ import sqlite3
 import hashlib
 import os
 from datetime import datetime
+from metrics import db_seconds, time_calls
 
 # Database file
 DB_FILE = "scrapegpt.db"
@@ -73,6 +74,7 @@ def hash_password(password):
     """Create a SHA-256 hash of the password."""
     return hashlib.sha256(password.encode()).hexdigest()
 
+@time_calls(db_seconds, 'insert_user')
 def insert_user(username, email, password, profile_pic=None):
     """Insert a new user into the database."""
     conn = get_db_connection()
@@ -88,6 +90,7 @@ def insert_user(username, email, password, profile_pic=None):
     conn.commit()
     conn.close()
 
+@time_calls(db_seconds, 'check_user_exists')
 def check_user_exists(email):
     """Check if a user with the given email exists."""
     conn = get_db_connection()
@@ -100,6 +103,7 @@ def check_user_exists(email):
     
     return user is not None
 
+@time_calls(db_seconds, 'verify_user')
 def verify_user(email, password):
     """Verify user credentials and return user if valid."""
     conn = get_db_connection()
@@ -127,6 +131,7 @@ def verify_user(email, password):
     
     return user if user else None
 
+@time_calls(db_seconds, 'get_user_id')
 def get_user_id(username):
     """Get user ID from username."""
     conn = get_db_connection()
@@ -139,6 +144,7 @@ def get_user_id(username):
     
     return user['id'] if user else None
 
+@time_calls(db_seconds, 'save_query')
 def save_query(username, query):
     """Save a user query to the database."""
     user_id = get_user_id(username)
@@ -158,6 +164,7 @@ def save_query(username, query):
     
     return True
 
+@time_calls(db_seconds, 'get_user_queries')
 def get_user_queries(username, limit=10):
     """Get recent queries for a user."""
     user_id = get_user_id(username)
@@ -183,6 +190,55 @@ def get_user_queries(username, limit=10):
     
     return queries
 
+@time_calls(db_seconds, 'get_popular_queries')
+def get_popular_queries(limit=20, since_hours=None):
+    """
+    Get the most frequently asked queries across all users.
+    
+    Args:
+        limit (int): Maximum number of queries to return.
+        since_hours (float): Only count queries asked within this many hours (default: all time).
+        
+    Returns:
+        list: Rows of (query, count, last_asked), most frequent first; query is the
+        latest spelling asked, with its original case.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Normalize case and surrounding whitespace so variants are counted together;
+    # next to MAX(), SQLite takes the bare query column from the latest row, so each
+    # group is represented by its most recent original-case spelling
+    if since_hours is None:
+        cursor.execute(
+            """
+            SELECT trim(query) AS query, COUNT(*) AS count, MAX(timestamp) AS last_asked
+            FROM queries
+            GROUP BY lower(trim(query))
+            ORDER BY count DESC, last_asked DESC
+            LIMIT ?
+            """,
+            (limit,)
+        )
+    else:
+        cursor.execute(
+            """
+            SELECT trim(query) AS query, COUNT(*) AS count, MAX(timestamp) AS last_asked
+            FROM queries
+            WHERE timestamp >= datetime('now', ?)
+            GROUP BY lower(trim(query))
+            ORDER BY count DESC, last_asked DESC
+            LIMIT ?
+            """,
+            (f"-{since_hours} hours", limit)
+        )
+    queries = cursor.fetchall()
+    
+    conn.close()
+    
+    return queries
+
+@time_calls(db_seconds, 'clear_user_queries')
 def clear_user_queries(username):
     """Delete all queries for a specific user."""
     user_id = get_user_id(username)
@@ -202,6 +258,7 @@ def clear_user_queries(username):
     
     return True
 
+@time_calls(db_seconds, 'get_user_profile_pic')
 def get_user_profile_pic(username):
     """Get user's profile picture."""
     user_id = get_user_id(username)
@@ -226,6 +283,7 @@ def get_user_profile_pic(username):
         conn.close()
         return None
 
+@time_calls(db_seconds, 'update_user_profile_pic')
 def update_user_profile_pic(username, profile_pic):
     """Update a user's profile picture."""
     user_id = get_user_id(username)
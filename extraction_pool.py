@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from tracing import span
+
+# Number of worker processes; 0 runs extraction inline in the calling thread
+POOL_WORKERS = int(os.environ.get("SCRAPEGPT_EXTRACT_WORKERS", os.cpu_count() or 2))
+
+# Tasks a worker runs before it is replaced, so leaks in parsers don't accumulate
+MAX_TASKS_PER_WORKER = int(os.environ.get("SCRAPEGPT_EXTRACT_MAX_TASKS", 200))
+
+# Seconds to wait for a pooled task before giving up
+TASK_TIMEOUT = 30
+
+_pool = None
+_pool_lock = threading.Lock()
+
+WARM_UP_HTML = b"<html><body><article><p>" + b"Warm-up paragraph for the extraction worker. " * 5 + b"</p></article></body></html>"
+
+def _warm_up_worker():
+    """Import the parsers and run one extraction so the first real task isn't slow."""
+    import trafilatura
+    from bs4 import BeautifulSoup
+
+    trafilatura.extract(WARM_UP_HTML)
+    BeautifulSoup(WARM_UP_HTML, 'html.parser').find_all('p')
+
+def _noop():
+    return os.getpid()
+
+def get_pool():
+    """
+    Get the process-wide extraction pool, starting it if needed.
+
+    Returns:
+        ProcessPoolExecutor: The pool, or None if extraction runs inline.
+    """
+    global _pool
+    if POOL_WORKERS <= 0:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            # Worker recycling requires the spawn start method
+            _pool = ProcessPoolExecutor(
+                max_workers=POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up_worker,
+                max_tasks_per_child=MAX_TASKS_PER_WORKER
+            )
+        return _pool
+
+def warm_up():
+    """Start all worker processes ahead of the first request."""
+    pool = get_pool()
+    if pool is None:
+        return
+    try:
+        futures = [pool.submit(_noop) for _ in range(POOL_WORKERS)]
+        for future in futures:
+            future.result(timeout=TASK_TIMEOUT)
+    except Exception as e:
+        print(f"Error warming up extraction pool: {e}")
+
+def shutdown():
+    """Stop the worker processes."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def run_in_pool(func, *args):
+    """
+    Run a CPU-bound extraction function in a worker process.
+
+    `func` must be a module-level function; its arguments should be raw bytes
+    and simple values, and it should return a compact record (strings,
+    tuples, lists) rather than parser objects, to keep pickling cheap.
+    Falls back to running inline if the pool is disabled or broken.
+
+    Args:
+        func (callable): The extraction function.
+        *args: Arguments for func.
+
+    Returns:
+        The value returned by func.
+    """
+    global _pool
+    pool = get_pool()
+    if pool is None:
+        with span(f"extract.{func.__name__}", pooled=False):
+            return func(*args)
+
+    try:
+        with span(f"extract.{func.__name__}", pooled=True):
+            return pool.submit(func, *args).result(timeout=TASK_TIMEOUT)
+    except BrokenProcessPool as e:
+        print(f"Extraction pool is broken, restarting it: {e}")
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        return func(*args)
@@ -0,0 +1,148 @@
+import os
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from latency_tracker import latency_tracker
+from tracing import span
+from metrics import upstream_requests, upstream_seconds
+
+# One pooled session for all scrapers so connections to the same host are reused
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+session.mount('http://', _adapter)
+session.mount('https://', _adapter)
+
+# Base URL every upstream request is sent to instead, e.g. a local fixture server for load tests.
+# The original host becomes the first path segment: https://host/path?q -> BASE/host/path?q
+UPSTREAM_OVERRIDE = os.environ.get("SCRAPEGPT_UPSTREAM_OVERRIDE", "")
+
+def set_upstream_override(base_url):
+    """Redirect all upstream requests to base_url (None or '' to stop)."""
+    global UPSTREAM_OVERRIDE
+    UPSTREAM_OVERRIDE = (base_url or '').rstrip('/')
+
+def resolve_url(url):
+    """Return the URL actually requested for url (rewritten if UPSTREAM_OVERRIDE is set)."""
+    if not UPSTREAM_OVERRIDE:
+        return url
+    parts = urlsplit(url)
+    rewritten = f"{UPSTREAM_OVERRIDE.rstrip('/')}/{parts.hostname or ''}{parts.path or '/'}"
+    return f"{rewritten}?{parts.query}" if parts.query else rewritten
+
+def get_host(url):
+    """Return the lowercased host name of a URL (empty string if it has none)."""
+    try:
+        return (urlsplit(url).hostname or '').lower()
+    except ValueError:
+        return ''
+
+def http_get(url, headers=None, timeout=15, **kwargs):
+    """
+    GET a URL through the shared session with an adaptive per-host timeout.
+
+    The connect/read timeouts come from the host's observed latency (see
+    latency_tracker), capped at `timeout`. Every response time, and every
+    timeout that was hit, is fed back into the tracker.
+
+    Args:
+        url (str): The URL to fetch.
+        headers (dict): Request headers.
+        timeout (float): Maximum timeout in seconds; used as-is for hosts with little history.
+        **kwargs: Passed through to requests (e.g. stream=True).
+
+    Returns:
+        requests.Response: The response.
+
+    Raises:
+        requests.exceptions.RequestException: On connection errors and timeouts.
+    """
+    host = get_host(url)
+    timeouts = latency_tracker.get_timeouts(host, default=timeout)
+
+    with span('http.get', url=url, host=host) as current:
+        start = time.monotonic()
+        try:
+            # Latency and metrics stay keyed by the original host when redirected
+            response = session.get(resolve_url(url), headers=headers, timeout=timeouts, **kwargs)
+        except requests.exceptions.Timeout:
+            # Count the timeout as a slow sample so the host's timeouts grow back
+            latency_tracker.record(host, time.monotonic() - start)
+            upstream_requests.labels(host, 'timeout').inc()
+            current.set(timeout=True)
+            raise
+        except requests.exceptions.RequestException:
+            upstream_requests.labels(host, 'error').inc()
+            raise
+
+        # elapsed covers the time until the response headers were parsed
+        elapsed = response.elapsed.total_seconds()
+        latency_tracker.record(host, elapsed)
+        upstream_requests.labels(host, str(response.status_code)).inc()
+        upstream_seconds.observe(elapsed)
+        current.set(status=response.status_code)
+        if not kwargs.get('stream'):
+            current.set(bytes=len(response.content))
+        return response
+
+# Largest page body read for text extraction; anything beyond is ignored
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+
+# Content types worth extracting text from
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+class UnsupportedContentTypeError(ValueError):
+    """Raised when a response's Content-Type isn't one the caller accepts."""
+
+def fetch_bytes(url, headers=None, timeout=10, max_bytes=MAX_PAGE_BYTES,
+                allowed_types=None, on_chunk=None):
+    """
+    Download a page body once, streaming it and reading at most `max_bytes`.
+
+    The Content-Type header is checked before any of the body is read, so
+    PDFs, images and other large non-HTML responses cost only their headers.
+
+    Args:
+        url (str): The URL to fetch.
+        headers (dict): Request headers.
+        timeout (float): Maximum timeout in seconds (see http_get).
+        max_bytes (int): Maximum number of body bytes to read.
+        allowed_types (tuple): Accepted media types (default: any). Responses without a Content-Type are accepted.
+        on_chunk (callable): Called with each chunk as it arrives; returning True stops the download early.
+
+    Returns:
+        bytes: The (possibly truncated) response body.
+
+    Raises:
+        requests.exceptions.RequestException: On connection errors, timeouts and HTTP error statuses.
+        UnsupportedContentTypeError: If the Content-Type isn't in allowed_types.
+    """
+    with span('http.fetch', url=url, host=get_host(url)) as current:
+        response = http_get(url, headers=headers, timeout=timeout, stream=True)
+        try:
+            current.set(status=response.status_code)
+            response.raise_for_status()
+
+            if allowed_types:
+                content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                if content_type and content_type not in allowed_types:
+                    current.set(content_type=content_type)
+                    raise UnsupportedContentTypeError(f"Unsupported content type {content_type} for {url}")
+
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=16 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= max_bytes:
+                    break
+                if on_chunk and on_chunk(chunk):
+                    current.set(stopped_early=True)
+                    break
+            current.set(bytes=min(size, max_bytes))
+            return b''.join(chunks)[:max_bytes]
+        finally:
+            # Closing a partially read streamed response drops the rest of the body
+            response.close()
@@ -2,7 +2,10 @@ import requests
 from bs4 import BeautifulSoup
 import re
 import random
-import time
+from http_client import http_get
+from circuit_breaker import get_breaker, looks_blocked, is_upstream_failure
+from tracing import traced, traced_sleep, current_span
+from metrics import blocks, fallbacks
 
 # List of user agents to rotate
 USER_AGENTS = [
@@ -58,12 +61,20 @@ def get_images_from_bing(query, max_results=6):
         'Pragma': 'no-cache',
     }
     
+    # Shared across sessions so a blocked Bing Images fails fast for everyone
+    breaker = get_breaker('bing_images')
+    
     try:
         # Try with a longer timeout and multiple attempts
         max_attempts = 2
         for attempt in range(max_attempts):
+            # Skip Bing Images entirely while its circuit is open
+            if not breaker.allow_request():
+                print("Bing Images circuit is open. Skipping request.")
+                break
+            
             try:
-                response = requests.get(url, headers=headers, timeout=15)
+                response = http_get(url, headers=headers, timeout=15)
                 response.raise_for_status()
                 
                 # If we got a response, parse it
@@ -122,18 +133,32 @@ def get_images_from_bing(query, max_results=6):
                 
                 # If we found images, break the retry loop
                 if images:
+                    breaker.record_success()
                     break
+                
+                if looks_blocked(response.text):
+                    blocks.labels('bing_images').inc()
+                    breaker.record_failure('captcha')
+                    if breaker.is_open():
+                        break
                     
                 # If no images found, try another attempt with a different user agent
                 if attempt < max_attempts - 1:
                     headers['User-Agent'] = get_random_user_agent()
-                    time.sleep(2)  # Wait before retrying
+                    current_span().add('retries')
+                    traced_sleep(2)  # Wait before retrying
                     
             except requests.exceptions.RequestException as req_err:
                 print(f"Request error in attempt {attempt+1}: {req_err}")
+                if is_upstream_failure(req_err):
+                    breaker.record_failure(str(req_err))
+                # Give up at once if this failure opened the circuit
+                if breaker.is_open():
+                    break
                 # If we have more attempts left, try again
                 if attempt < max_attempts - 1:
-                    time.sleep(2)  # Wait before retrying
+                    current_span().add('retries')
+                    traced_sleep(2)  # Wait before retrying
                     headers['User-Agent'] = get_random_user_agent()
                 else:
                     raise  # Re-raise on last attempt
@@ -142,11 +167,15 @@ def get_images_from_bing(query, max_results=6):
         print(f"Error scraping Bing Images: {e}")
     
     # If we still don't have results, try an alternative approach
-    if not images:
+    if not images and breaker.allow_request():
         try:
             # Try an alternative URL format
             alt_url = f'https://www.bing.com/images/search?q={formatted_query}&qft=+filterui:aspect-square&form=IRFLTR'
-            response = requests.get(alt_url, headers=headers, timeout=15)
+            response = http_get(alt_url, headers=headers, timeout=15)
+            if response.status_code >= 500 or looks_blocked(response.text):
+                breaker.record_failure(f"HTTP {response.status_code}")
+            else:
+                breaker.record_success()
             soup = BeautifulSoup(response.text, 'html.parser')
             
             # Look for any images that might be available
@@ -158,11 +187,16 @@ def get_images_from_bing(query, max_results=6):
                 img_url = img.get('src')
                 if is_valid_image_url(img_url) and img_url not in images:
                     images.append(img_url)
+        except requests.exceptions.RequestException as e:
+            if is_upstream_failure(e):
+                breaker.record_failure(str(e))
+            print(f"Error with alternative image scraping approach: {e}")
         except Exception as e:
             print(f"Error with alternative image scraping approach: {e}")
             
     return images
 
+@traced('images')
 def get_images(query, max_results=6):
     """
     Get images from multiple sources if needed.
@@ -175,8 +209,9 @@ def get_images(query, max_results=6):
     Returns:
         list: List of image URLs.
     """
-    # Add a small delay to avoid rate limiting
-    time.sleep(1.5)
+    # Add a small delay to avoid rate limiting (pointless if Bing is being skipped)
+    if not get_breaker('bing_images').is_open():
+        traced_sleep(1.5)
     
     # Get images from Bing
     images = get_images_from_bing(query, max_results)
@@ -184,6 +219,7 @@ def get_images(query, max_results=6):
     # If no images were found, provide semantic fallback images based on the query
     if not images:
         print(f"No images found for query: {query}. Using fallback images.")
+        fallbacks.labels('images').inc()
         
         # Topic-specific fallback images
         formatted_query = query.lower()
@@ -0,0 +1,215 @@
+import os
+import queue
+import threading
+import time
+import uuid
+
+from tracing import trace
+from profiler import profile
+from metrics import registry
+
+# Number of worker threads running jobs
+JOB_WORKERS = int(os.environ.get("SCRAPEGPT_JOB_WORKERS", 4))
+
+# Seconds a finished job's result is kept for the session that submitted it
+RESULT_TTL = 600
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+class Job:
+    """A unit of work submitted to the job queue."""
+
+    def __init__(self, job_id, key, func, args, kwargs):
+        self.id = job_id
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def is_finished(self):
+        """Check if the job has completed, successfully or not."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the job finishes or the timeout elapses.
+
+        Returns:
+            bool: True if the job has finished.
+        """
+        return self._done.wait(timeout)
+
+class JobQueue:
+    """
+    In-process job queue with a fixed pool of worker threads.
+
+    Jobs live at module level rather than in a Streamlit script run, so
+    work keeps going when the user interacts or the websocket reconnects;
+    the next rerun just picks up the result by job id. Jobs submitted with
+    the same key while one is queued or running are coalesced into it.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        """
+        Args:
+            workers (int): Number of worker threads.
+        """
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start_workers(self):
+        # Called with the lock held
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.status = RUNNING
+            job.started_at = time.time()
+            try:
+                job.result = job.func(*job.args, **job.kwargs)
+                job.status = DONE
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = FAILED
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    if self._in_flight.get(job.key) is job:
+                        del self._in_flight[job.key]
+                job._done.set()
+                self._queue.task_done()
+
+    def _purge_finished(self):
+        # Called with the lock held
+        cutoff = time.time() - RESULT_TTL
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, func, *args, key=None, **kwargs):
+        """
+        Queue a function call to run on a worker thread.
+
+        Args:
+            func (callable): The function to run.
+            *args: Positional arguments for func.
+            key (hashable): Coalescing key; if a job with this key is queued or running, its id is returned instead.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            str: The job id.
+        """
+        with self._lock:
+            self._start_workers()
+            self._purge_finished()
+
+            if key is not None and key in self._in_flight:
+                return self._in_flight[key].id
+
+            job = Job(uuid.uuid4().hex, key, func, args, kwargs)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._in_flight[key] = job
+
+        self._queue.put(job)
+        return job.id
+
+    def get(self, job_id):
+        """
+        Look up a job by id.
+
+        Returns:
+            Job: The job, or None if it is unknown or its result has expired.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        """
+        Get queue statistics.
+
+        Returns:
+            dict: Counts of queued, running and finished jobs, and the worker count.
+        """
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            'workers': self.workers,
+            'queued': statuses.count(QUEUED),
+            'running': statuses.count(RUNNING),
+            'finished': statuses.count(DONE) + statuses.count(FAILED),
+        }
+
+# Queue shared by all sessions in the process
+job_queue = JobQueue()
+
+jobs_gauge = registry.gauge('scrapegpt_jobs', 'Response jobs by state.', ('state',))
+
+def _collect_job_stats():
+    stats = job_queue.stats()
+    for state in ('queued', 'running', 'finished'):
+        jobs_gauge.labels(state).set(stats[state])
+
+registry.register_collector('job_queue', _collect_job_stats)
+
+def traced_generate_response(query, **limits):
+    """Run generate_response as the root of a 'chat_turn' trace, sampled if profiling is on."""
+    from content_generator import generate_response
+
+    with trace('chat_turn', query=query), profile('turn', query=query):
+        return generate_response(query, **limits)
+
+def submit_response_job(query, links_limit=10, videos_limit=5, images_limit=12, search_limit=500):
+    """
+    Queue a generate_response call for a query.
+
+    Identical queries with the same limits that are already in flight share one job.
+
+    Args:
+        query (str): The search query
+        links_limit (int): Maximum number of links to display
+        videos_limit (int): Maximum number of videos to display
+        images_limit (int): Maximum number of images to display
+        search_limit (int): Maximum number of search results to retrieve
+
+    Returns:
+        str: The job id.
+    """
+    # Imported here so the queue itself doesn't pull in the scrapers
+    from content_generator import normalize_query
+
+    key = ('generate_response', normalize_query(query), links_limit, videos_limit, images_limit, search_limit)
+    return job_queue.submit(
+        traced_generate_response,
+        query=query,
+        links_limit=links_limit,
+        videos_limit=videos_limit,
+        images_limit=images_limit,
+        search_limit=search_limit,
+        key=key
+    )
@@ -0,0 +1,83 @@
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton matching many keywords in one pass over a text.
+
+    Matching costs O(len(text) + matches) however many keywords there are,
+    so it replaces loops of `keyword in text` checks. Keywords and texts
+    are compared case-insensitively.
+    """
+
+    def __init__(self, keywords):
+        """
+        Args:
+            keywords (iterable): The keywords; their positions are the ids reported by matches.
+        """
+        self.keywords = [keyword.lower() for keyword in keywords]
+        # Per state: transitions, failure link and ids of the keywords ending there
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for index, keyword in enumerate(self.keywords):
+            if not keyword:
+                continue
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            self._out[state] += (index,)
+
+        # Breadth-first, so every state's failure target is final before its children need it
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                # Keywords that are suffixes of this one end here too
+                self._out[child] += self._out[self._fail[child]]
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def iter_matches(self, text, whole_words=False):
+        """
+        Find every keyword occurrence in a text.
+
+        Args:
+            text (str): The text to scan (lowercase it first to skip a copy).
+            whole_words (bool): Only report occurrences not inside a longer word.
+
+        Yields:
+            tuple: (start, end, keyword id) with end exclusive, in order of end position.
+        """
+        if not text.islower():
+            text = text.lower()
+        goto, fail, out, keywords = self._goto, self._fail, self._out, self.keywords
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                end = position + 1
+                for index in out[state]:
+                    start = end - len(keywords[index])
+                    if whole_words and (
+                        (start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum())
+                    ):
+                        continue
+                    yield start, end, index
+
+    def matched_ids(self, text, whole_words=False):
+        """Return the set of ids of keywords occurring in a text."""
+        return {index for _, _, index in self.iter_matches(text, whole_words)}
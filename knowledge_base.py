@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+
+from keyword_automaton import KeywordAutomaton
+
+# JSON file with the curated topics (see knowledge_base.json for the format)
+KNOWLEDGE_BASE_FILE = os.environ.get(
+    "SCRAPEGPT_KNOWLEDGE_BASE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base.json")
+)
+
+# Seconds between checks of the file for changes (it is reloaded when its mtime changes)
+RELOAD_CHECK_INTERVAL = 5
+
+class KnowledgeBase:
+    """
+    Curated facts per topic, loaded from a JSON file and matched against queries.
+
+    All topic names and aliases are compiled into one keyword automaton,
+    so a lookup costs O(len(query)) however many topics there are. The file
+    is checked for changes at most every RELOAD_CHECK_INTERVAL seconds and
+    reloaded in place; if the new version can't be read, the old one stays.
+
+    File format:
+        {"topics": [{"topic": "solar system", "aliases": ["solar systems"], "facts": ["...", ...]}, ...]}
+    """
+
+    def __init__(self, path=KNOWLEDGE_BASE_FILE):
+        """
+        Args:
+            path (str): The JSON file.
+        """
+        self.path = path
+        # (automaton, facts per keyword id), swapped as one tuple on reload
+        self._index = (KeywordAutomaton([]), [])
+        self._mtime = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """
+        Load the file again if it changed since the last load.
+
+        Returns:
+            bool: True if a new version was loaded.
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                # No file: keep whatever was loaded (nothing, at startup)
+                return False
+            if mtime == self._mtime:
+                return False
+
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    topics = json.load(f).get('topics', [])
+                keywords = []
+                facts = []
+                for entry in topics:
+                    entry_facts = [fact for fact in entry.get('facts', []) if fact]
+                    for name in [entry.get('topic', '')] + list(entry.get('aliases', [])):
+                        name = ' '.join(str(name).lower().split())
+                        if name and entry_facts:
+                            keywords.append(name)
+                            facts.append(entry_facts)
+                index = (KeywordAutomaton(keywords), facts)
+            except (OSError, ValueError, AttributeError, TypeError) as e:
+                print(f"Error loading knowledge base {self.path}: {e}")
+                # Don't retry until the file changes again
+                self._mtime = mtime
+                return False
+
+            self._index = index
+            self._mtime = mtime
+            print(f"Loaded {len(keywords)} topic names from {self.path}")
+            return True
+
+    def _maybe_reload(self):
+        # Lookups keep using the current version while another thread reloads
+        if time.monotonic() - self._checked_at >= RELOAD_CHECK_INTERVAL and not self._lock.locked():
+            self.reload()
+
+    def lookup(self, query):
+        """
+        Find the curated facts for the most specific topic mentioned in a query.
+
+        Topics only match as whole words; when several match, the longest wins
+        (then the one mentioned first).
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            list: The topic's facts, or None if no topic matches.
+        """
+        self._maybe_reload()
+        automaton, facts = self._index
+        best = None
+        for start, end, index in automaton.iter_matches(' '.join(query.lower().split()), whole_words=True):
+            if best is None or (end - start, -start) > (best[1] - best[0], -best[0]):
+                best = (start, end, index)
+        return facts[best[2]] if best else None
+
+    def __len__(self):
+        return len(self._index[1])
+
+# Knowledge base shared by all sessions in the process
+knowledge_base = KnowledgeBase()
@@ -0,0 +1,134 @@
+import bisect
+import threading
+from collections import deque
+
+# Upper bounds (seconds) of the histogram buckets, roughly logarithmic
+BUCKET_BOUNDS = [
+    0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0, 1.5,
+    2.0, 3.0, 4.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, float('inf')
+]
+
+class HostHistogram:
+    """
+    Rolling latency histogram for one host.
+
+    Keeps bucket counts for the last `window` responses; the oldest sample
+    drops out of its bucket when a new one arrives.
+    """
+
+    def __init__(self, window=200):
+        self.counts = [0] * len(BUCKET_BOUNDS)
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        """Add a response time to the histogram."""
+        if len(self.samples) == self.samples.maxlen:
+            self.counts[self.samples[0]] -= 1
+        bucket = bisect.bisect_left(BUCKET_BOUNDS, seconds)
+        self.samples.append(bucket)
+        self.counts[bucket] += 1
+
+    def percentile(self, fraction):
+        """
+        Get an upper estimate of a latency percentile.
+
+        Args:
+            fraction (float): The percentile as a fraction (e.g. 0.99).
+
+        Returns:
+            float: The upper bound of the bucket containing the percentile.
+        """
+        target = fraction * len(self.samples)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return BUCKET_BOUNDS[bucket]
+        return BUCKET_BOUNDS[-1]
+
+class LatencyTracker:
+    """
+    Per-host latency histograms used to derive adaptive request timeouts.
+
+    A host that normally answers in 300ms gets a timeout of a second or two
+    instead of the fixed 15s, so one slow tail response can't hold up a whole
+    answer. Hosts without enough history get the caller's default timeout.
+    """
+
+    def __init__(self, window=200, min_samples=10, factor=3.0,
+                 min_connect=1.0, max_connect=5.0, min_read=2.0):
+        """
+        Args:
+            window (int): Responses kept per host.
+            min_samples (int): Samples needed before adaptive timeouts are used.
+            factor (float): Multiplier applied to the observed percentile.
+            min_connect (float): Lower clamp of the connect timeout.
+            max_connect (float): Upper clamp of the connect timeout.
+            min_read (float): Lower clamp of the read timeout.
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self.factor = factor
+        self.min_connect = min_connect
+        self.max_connect = max_connect
+        self.min_read = min_read
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, seconds):
+        """
+        Record how long a host took to respond.
+
+        Args:
+            host (str): The host name.
+            seconds (float): Time until the response headers arrived (or the timeout that was hit).
+        """
+        with self._lock:
+            histogram = self._hosts.get(host)
+            if histogram is None:
+                histogram = HostHistogram(self.window)
+                self._hosts[host] = histogram
+            histogram.add(seconds)
+
+    def get_timeouts(self, host, default=15):
+        """
+        Derive (connect, read) timeouts for a host from its latency history.
+
+        Args:
+            host (str): The host name.
+            default (float): Timeout to use (and never exceed) for hosts with little history.
+
+        Returns:
+            tuple: (connect_timeout, read_timeout) in seconds, as accepted by requests.
+        """
+        with self._lock:
+            histogram = self._hosts.get(host)
+            if histogram is None or len(histogram.samples) < self.min_samples:
+                return (min(self.max_connect, default), default)
+            p90 = histogram.percentile(0.90)
+            p99 = histogram.percentile(0.99)
+
+        connect = min(max(p90 * self.factor, self.min_connect), self.max_connect, default)
+        read = min(max(p99 * self.factor, self.min_read), default)
+        return (connect, read)
+
+    def snapshot(self):
+        """
+        Get a summary of the tracked hosts.
+
+        Returns:
+            dict: host -> {'samples', 'p50', 'p90', 'p99'} in seconds.
+        """
+        with self._lock:
+            return {
+                host: {
+                    'samples': len(histogram.samples),
+                    'p50': histogram.percentile(0.50),
+                    'p90': histogram.percentile(0.90),
+                    'p99': histogram.percentile(0.99),
+                }
+                for host, histogram in self._hosts.items()
+            }
+
+# Tracker shared by all sessions in the process
+latency_tracker = LatencyTracker()
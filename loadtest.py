@@ -0,0 +1,374 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Results served per search page by the fixture engines
+FIXTURE_RESULTS = 20
+
+# Paragraphs on each fixture article page
+FIXTURE_PARAGRAPHS = 6
+
+# Password given to every simulated user
+USER_PASSWORD = "loadtest-password"
+
+def _slug(query):
+    return '-'.join(query.lower().split()) or 'query'
+
+def _video_id(query, index):
+    # YouTube ids are 11 characters; derive stable ones from the query
+    return hashlib.md5(f"{query}:{index}".encode()).hexdigest()[:11]
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the upstreams: DuckDuckGo, Bing (web and images), YouTube and article pages.
+
+    Requests arrive rewritten by http_client (SCRAPEGPT_UPSTREAM_OVERRIDE),
+    so the original host is the first path segment.
+    """
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip('/').partition('/')
+        path = '/' + path
+        params = parse_qs(parts.query)
+        query = (params.get('q') or params.get('search_query') or [''])[0]
+
+        self.server.hits[host] += 1
+        if self.server.latency:
+            # Jitter so requests don't all complete in lockstep
+            time.sleep(self.server.latency * random.uniform(0.5, 1.5))
+
+        if host == 'html.duckduckgo.com':
+            body = self._duckduckgo(query)
+        elif host == 'www.bing.com' and path.startswith('/images'):
+            body = self._bing_images(query)
+        elif host == 'www.bing.com':
+            body = self._bing(query)
+        elif host == 'www.youtube.com' and path.startswith('/results'):
+            body = self._youtube(query)
+        else:
+            body = self._article(host, path)
+
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _result_url(self, query, index):
+        return f"https://fixture-pages.test/{_slug(query)}/{index}"
+
+    def _duckduckgo(self, query):
+        results = ''.join(
+            f'<div class="result"><h2><a class="result__a" href="{self._result_url(query, i)}">'
+            f'{query.title()} result {i}</a></h2>'
+            f'<a class="result__snippet">About {query}: detail number {i} explained at length for readers.</a></div>'
+            for i in range(FIXTURE_RESULTS)
+        )
+        return f"<html><body>{results}</body></html>"
+
+    def _bing(self, query):
+        results = ''.join(
+            f'<li class="b_algo"><h2><a href="{self._result_url(query, i + FIXTURE_RESULTS)}">'
+            f'{query.title()} overview {i}</a></h2>'
+            f'<div class="b_caption"><p>Everything about {query}, part {i}, summarised.</p></div></li>'
+            for i in range(FIXTURE_RESULTS)
+        )
+        return f"<html><body><ol>{results}</ol></body></html>"
+
+    def _bing_images(self, query):
+        images = ''.join(
+            f'<img class="mimg" src="https://fixture-images.test/{_slug(query)}/{i}.jpg">'
+            for i in range(FIXTURE_RESULTS)
+        )
+        return f"<html><body>{images}</body></html>"
+
+    def _youtube(self, query):
+        entries = ','.join(
+            f'{{"videoRenderer":{{"videoId":"{_video_id(query, i)}","title":{{"runs":[{{"text":"{query} video {i}"}}]}}}}}}'
+            for i in range(10)
+        )
+        return f"<html><body><script>var ytInitialData = {{\"contents\":[{entries}]}};</script></body></html>"
+
+    def _article(self, host, path):
+        segments = path.strip('/').split('/')
+        topic = segments[0].replace('-', ' ') or host
+        page = segments[-1]
+        paragraphs = ''.join(
+            f"<p>{topic.capitalize()} is covered here in paragraph {i} of page {page}. This fixture text is long "
+            f"enough to pass the extractor's length checks and reads like article {page} about {topic}.</p>"
+            for i in range(FIXTURE_PARAGRAPHS)
+        )
+        return f"<html><head><title>{topic}</title></head><body><article>{paragraphs}</article></body></html>"
+
+    def log_message(self, format, *args):
+        pass
+
+class FixtureUpstream:
+    """Local HTTP server standing in for every upstream, with configurable latency."""
+
+    def __init__(self, latency=0.05, host='127.0.0.1', port=0):
+        """
+        Args:
+            latency (float): Average seconds each response is delayed.
+            host (str): Address to bind.
+            port (int): Port to listen on (0 picks a free one).
+        """
+        self.server = ThreadingHTTPServer((host, port), _FixtureHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.hits = Counter()
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fixture-upstream", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def rss_bytes():
+    """Current resident memory of this process (peak if the current value isn't available)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in KB on Linux and bytes on macOS; close enough for growth trends
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+class LoadStats:
+    """Latencies and errors per operation for one concurrency level."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.locked = Counter()
+        self._lock = threading.Lock()
+
+    def timed(self, operation, func, *args, **kwargs):
+        """Call func, recording its latency (or its error) under operation."""
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            with self._lock:
+                self.errors[operation] += 1
+                if 'locked' in str(e):
+                    self.locked[operation] += 1
+            return None
+        except Exception as e:
+            print(f"Error in {operation}: {e}")
+            with self._lock:
+                self.errors[operation] += 1
+            return None
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.latencies[operation].append(elapsed)
+
+    def summary(self, operation):
+        values = self.latencies.get(operation, [])
+        return {
+            'count': len(values),
+            'p50_ms': round(_percentile(values, 0.50) * 1000, 1),
+            'p95_ms': round(_percentile(values, 0.95) * 1000, 1),
+            'p99_ms': round(_percentile(values, 0.99) * 1000, 1),
+            'errors': self.errors.get(operation, 0),
+            'locked': self.locked.get(operation, 0),
+        }
+
+# Operations of a simulated chat session, in report order
+OPERATIONS = ('login', 'save_query', 'generate_response', 'get_user_queries', 'turn')
+DB_OPERATIONS = ('login', 'save_query', 'get_user_queries')
+
+def simulate_user(index, queries, stats, think_time=0.0):
+    """
+    Run one user's session the way app.py does: log in, then per query save it,
+    answer it, keep it in a SessionStore and reload the history.
+    """
+    # Imported here so the upstream override and database path are set first
+    from database import verify_user, save_query, get_user_queries
+    from content_generator import generate_response
+    from session_store import SessionStore
+
+    user = stats.timed('login', verify_user, f"load{index}@example.test", USER_PASSWORD)
+    username = user['username'] if user else f"load{index}"
+
+    store = SessionStore()
+    try:
+        for query in queries:
+            start = time.perf_counter()
+            stats.timed('save_query', save_query, username, query)
+            response = stats.timed('generate_response', generate_response, query)
+            now = datetime.now().strftime("%H:%M")
+            store.add_message('user', query, now)
+            store.add_message('assistant', response, now)
+            stats.timed('get_user_queries', get_user_queries, username)
+            with stats._lock:
+                stats.latencies['turn'].append(time.perf_counter() - start)
+            if think_time:
+                time.sleep(random.uniform(0, 2 * think_time))
+    finally:
+        store.clear()
+
+def make_queries(count, seed=0):
+    """Build a pool of distinct queries."""
+    rng = random.Random(seed)
+    subjects = ['python', 'rust', 'volcano', 'jazz', 'coffee', 'orbit', 'bridge', 'tiger',
+                'glacier', 'opera', 'quantum', 'desert', 'bread', 'chess', 'violin', 'comet']
+    aspects = ['history', 'basics', 'facts', 'science', 'guide', 'tips', 'future', 'types']
+    queries = set()
+    while len(queries) < count:
+        queries.add(f"{rng.choice(subjects)} {rng.choice(aspects)} {rng.randint(1, 999)}")
+    return sorted(queries)
+
+def run_level(users, turns, query_pool, think_time=0.0, warm=False, seed=0):
+    """
+    Run `users` concurrent simulated users for `turns` chat turns each.
+
+    Returns:
+        dict: Throughput, per-operation latency percentiles and errors, and memory for the level.
+    """
+    from content_generator import response_cache
+    from web_scraper import page_text_cache
+
+    if not warm:
+        # Each level answers its queries from the (fixture) upstreams, not from the previous level's cache
+        response_cache.clear()
+        page_text_cache.clear()
+
+    rng = random.Random(seed + users)
+    stats = LoadStats()
+    threads = [
+        threading.Thread(
+            target=simulate_user,
+            args=(i, [rng.choice(query_pool) for _ in range(turns)], stats, think_time),
+            name=f"load-user-{i}",
+        )
+        for i in range(users)
+    ]
+
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    db = [value for op in DB_OPERATIONS for value in stats.latencies.get(op, [])]
+    return {
+        'users': users,
+        'turns': len(stats.latencies['turn']),
+        'seconds': round(elapsed, 2),
+        'turns_per_second': round(len(stats.latencies['turn']) / elapsed, 2) if elapsed else 0,
+        'operations': {op: stats.summary(op) for op in OPERATIONS},
+        'db_p95_ms': round(_percentile(db, 0.95) * 1000, 2),
+        'db_locked_errors': sum(stats.locked.values()),
+        'rss_mb': round(rss_bytes() / 2 ** 20, 1),
+        'rss_growth_mb': round((rss_bytes() - rss_before) / 2 ** 20, 1),
+    }
+
+def run_load_test(levels=(1, 2, 4, 8, 16), turns=3, distinct_queries=40, latency=0.05,
+                  think_time=0.0, warm=False, report=print):
+    """
+    Load-test the chat flow at increasing concurrency against local fixture upstreams.
+
+    A fresh temporary database (users load0..loadN), spill file and page
+    index are used, so the real scrapegpt.db is never touched.
+
+    Args:
+        levels (tuple): Numbers of concurrent users to run, in order.
+        turns (int): Chat turns per user.
+        distinct_queries (int): Size of the query pool users draw from (smaller means more cache hits).
+        latency (float): Average fixture response delay in seconds.
+        think_time (float): Average pause between a user's turns in seconds.
+        warm (bool): Keep the response and page caches between levels.
+        report (callable): Receives report lines (None to stay quiet).
+
+    Returns:
+        dict: The per-level results and the upstream request counts.
+    """
+    import database
+    import page_index
+    import session_store
+    from http_client import set_upstream_override
+
+    workdir = tempfile.mkdtemp(prefix="scrapegpt-load-")
+    database.DB_FILE = os.path.join(workdir, "load.db")
+    session_store.SPILL_DB_FILE = os.path.join(workdir, "spill.db")
+    page_index.PAGE_INDEX_DB = os.path.join(workdir, "page_index.db")
+    database.create_tables()
+    for i in range(max(levels)):
+        database.insert_user(f"load{i}", f"load{i}@example.test", USER_PASSWORD)
+
+    upstream = FixtureUpstream(latency=latency).start()
+    set_upstream_override(upstream.url)
+    query_pool = make_queries(distinct_queries)
+    baseline_rss = rss_bytes()
+
+    results = []
+    try:
+        if report:
+            report(f"{'users':>5} {'turns':>5} {'turns/s':>8} {'turn p50':>9} {'turn p95':>9} {'turn p99':>9} "
+                   f"{'db p95':>8} {'locked':>6} {'errors':>6} {'rss MB':>7} {'growth':>7}")
+        for users in levels:
+            level = run_level(users, turns, query_pool, think_time=think_time, warm=warm)
+            level['rss_growth_total_mb'] = round((rss_bytes() - baseline_rss) / 2 ** 20, 1)
+            results.append(level)
+            if report:
+                turn = level['operations']['turn']
+                errors = sum(op['errors'] for op in level['operations'].values())
+                report(f"{users:>5} {level['turns']:>5} {level['turns_per_second']:>8} "
+                       f"{turn['p50_ms']:>7.0f}ms {turn['p95_ms']:>7.0f}ms {turn['p99_ms']:>7.0f}ms "
+                       f"{level['db_p95_ms']:>6.1f}ms {level['db_locked_errors']:>6} {errors:>6} "
+                       f"{level['rss_mb']:>7} {level['rss_growth_total_mb']:>+7}")
+    finally:
+        set_upstream_override(None)
+        upstream.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'levels': results, 'upstream_requests': dict(upstream.server.hits)}
+
+if __name__ == "__main__":
+    # python loadtest.py --levels 1,2,4,8,16 --turns 3 [--json report.json]
+    parser = argparse.ArgumentParser(description="Simulate concurrent ScrapeGPT chat users against local fixture upstreams.")
+    parser.add_argument('--levels', default='1,2,4,8,16', help="Comma-separated numbers of concurrent users")
+    parser.add_argument('--turns', type=int, default=3, help="Chat turns per user")
+    parser.add_argument('--queries', type=int, default=40, help="Distinct queries users draw from")
+    parser.add_argument('--latency', type=float, default=0.05, help="Average fixture response delay in seconds")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Average pause between a user's turns")
+    parser.add_argument('--warm', action='store_true', help="Keep caches between levels")
+    parser.add_argument('--json', help="Also write the full report to this file")
+    args = parser.parse_args()
+
+    report = run_load_test(
+        levels=[int(level) for level in args.levels.split(',') if level.strip()],
+        turns=args.turns, distinct_queries=args.queries, latency=args.latency,
+        think_time=args.think_time, warm=args.warm,
+    )
+    print("Upstream requests: " + ", ".join(f"{host}={count}" for host, count in sorted(report['upstream_requests'].items())))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
@@ -0,0 +1,353 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Port of the side HTTP server exposing /metrics (0 disables it)
+METRICS_PORT = int(os.environ.get("SCRAPEGPT_METRICS_PORT", 9108))
+
+# Address the metrics server listens on
+METRICS_HOST = os.environ.get("SCRAPEGPT_METRICS_HOST", "127.0.0.1")
+
+# Distinct label sets kept per metric; further ones are folded into "other"
+MAX_LABEL_SETS = 500
+
+# Default histogram buckets in seconds (upstream fetches and turns range from ms to tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape_label(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    """Base for metrics with optional labels; one child per distinct label set."""
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+
+    def labels(self, *values):
+        """
+        Get the child for a set of label values (created on first use).
+
+        Args:
+            *values: One value per label name, in order.
+
+        Returns:
+            The child metric, with the same inc/observe/set methods.
+        """
+        child = self._children.get(values)
+        if child is not None:
+            return child
+        with self._lock:
+            if values not in self._children and len(self._children) >= MAX_LABEL_SETS:
+                # Bound the number of series when a label (e.g. host) is open-ended
+                values = ('other',) * len(self.labelnames)
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        if not self.labelnames:
+            return [((), self._default)]
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self):
+        """Return the metric in text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for values, child in self._items():
+            lines.extend(child.render_samples(self.name, self.labelnames, values))
+        return '\n'.join(lines)
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set_total(self, value):
+        # For collectors mirroring a count kept elsewhere
+        self.value = value
+
+    def render_samples(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    TYPE = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        """Increment the (unlabelled) counter."""
+        self._default.inc(amount)
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+class Gauge(_Metric):
+    """A value that can go up and down."""
+
+    TYPE = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        """Set the (unlabelled) gauge."""
+        self._default.set(value)
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render_samples(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(labelnames, values, extra=[('le', _format_value(float(bound)))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{name}_count{labels} {count}")
+        return lines
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(float(b) for b in buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        """Record an observation in the (unlabelled) histogram."""
+        self._default.observe(value)
+
+class Registry:
+    """
+    The set of metrics exposed on /metrics.
+
+    Metrics updated on hot paths are plain objects with a per-series lock.
+    Values that already live elsewhere (cache hit counts, breaker states,
+    queue sizes) are read by collectors only when metrics are scraped.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Modules may be reloaded (e.g. by Streamlit); keep the original series
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Create (or get) a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Create (or get) a gauge."""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create (or get) a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, name, collect):
+        """
+        Register a function that refreshes metrics right before a scrape.
+
+        Args:
+            name (str): Identifies the collector (registering a name again replaces it).
+            collect (callable): Called with no arguments; sets gauges or counters.
+        """
+        with self._lock:
+            self._collectors = [(n, c) for n, c in self._collectors if n != name]
+            self._collectors.append((name, collect))
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            collectors = list(self._collectors)
+        for name, collect in collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"Error in metrics collector {name}: {e}")
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+# Registry shared by the whole process
+registry = Registry()
+
+def time_calls(histogram, *label_values):
+    """
+    Decorator that observes how long each call takes in a histogram.
+
+    Args:
+        histogram (Histogram): The histogram.
+        *label_values: Label values of the series to observe into.
+
+    Returns:
+        callable: The decorator.
+    """
+    series = histogram.labels(*label_values) if label_values else histogram
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                series.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+# Metrics shared across the scrapers, caches and database
+upstream_requests = registry.counter(
+    'scrapegpt_upstream_requests_total', 'Upstream HTTP requests by host and status.', ('host', 'status'))
+upstream_seconds = registry.histogram(
+    'scrapegpt_upstream_request_seconds', 'Time until upstream response headers arrived.')
+blocks = registry.counter(
+    'scrapegpt_blocks_total', 'Captcha or block pages detected, by engine.', ('engine',))
+fallbacks = registry.counter(
+    'scrapegpt_fallback_results_total', 'Times static fallback results were served, by source.', ('source',))
+db_seconds = registry.histogram(
+    'scrapegpt_db_seconds', 'Database call latency by operation.', ('operation',))
+turn_seconds = registry.histogram(
+    'scrapegpt_turn_seconds', 'Time to produce a chat response, by response cache result.', ('cache',))
+
+cache_hits = registry.counter('scrapegpt_cache_hits_total', 'Cache hits by cache.', ('cache',))
+cache_misses = registry.counter('scrapegpt_cache_misses_total', 'Cache misses by cache.', ('cache',))
+cache_hit_ratio = registry.gauge('scrapegpt_cache_hit_ratio', 'Share of cache lookups that hit, by cache.', ('cache',))
+cache_entries = registry.gauge('scrapegpt_cache_entries', 'Entries held by cache.', ('cache',))
+
+def watch_cache(name, cache):
+    """
+    Expose a TTLCache's hit and miss counts, read at scrape time (no cost on lookups).
+
+    Args:
+        name (str): Value of the 'cache' label.
+        cache (TTLCache): The cache.
+    """
+    def collect():
+        hits, misses = cache.hits, cache.misses
+        cache_hits.labels(name).set_total(hits)
+        cache_misses.labels(name).set_total(misses)
+        cache_hit_ratio.labels(name).set(hits / (hits + misses) if hits + misses else 0)
+        cache_entries.labels(name).set(len(cache))
+    registry.register_collector(f"cache:{name}", collect)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the console
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serve /metrics from a daemon thread (once per process).
+
+    Args:
+        port (int): Port to listen on; 0 disables the server.
+        host (str): Address to bind.
+
+    Returns:
+        bool: True if the server is running.
+    """
+    global _server
+    if not port:
+        return False
+
+    with _server_lock:
+        if _server is not None:
+            return True
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            # Another process (e.g. a second Streamlit worker) may already serve the port
+            print(f"Could not start metrics server on {host}:{port}: {e}")
+            return False
+        _server.daemon_threads = True
+        thread = threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True)
+        thread.start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return True
@@ -0,0 +1,158 @@
+from html.parser import HTMLParser
+import codecs
+import re
+from http_client import fetch_bytes, MAX_PAGE_BYTES, HTML_CONTENT_TYPES
+from extraction_pool import run_in_pool
+
+def clean_text(text):
+    """Clean scraped text by removing extra whitespace and normalizing."""
+    # Remove extra whitespace
+    text = re.sub(r'\s+', ' ', text)
+    # Remove leading/trailing whitespace
+    text = text.strip()
+    return text
+
+def extract_with_trafilatura(html, max_paragraphs=3):
+    """
+    Extract the main text of a page with trafilatura.
+    
+    Args:
+        html (bytes): The page body.
+        max_paragraphs (int): Maximum number of paragraphs to keep.
+        
+    Returns:
+        str: The extracted text, or None if trafilatura found too little content.
+    """
+    import trafilatura
+    
+    extracted_text = trafilatura.extract(html)
+    if extracted_text and len(extracted_text) > 100:
+        # Take only a portion of the text to avoid overwhelming
+        paragraphs = extracted_text.split('\n\n')
+        return '\n\n'.join(paragraphs[:max_paragraphs])
+    return None
+
+class ParagraphCollector(HTMLParser):
+    """
+    Incremental <p> text collector fed with raw bytes as they download.
+    
+    Keeps the text of <p> elements over 20 characters, ignoring scripts and
+    styles, without building a full tree, and reports when `max_paragraphs` qualifying paragraphs have been collected so
+    the download can stop. Bytes are decoded as UTF-8 with replacement.
+    """
+    
+    def __init__(self, max_paragraphs=3):
+        super().__init__(convert_charrefs=True)
+        self.max_paragraphs = max_paragraphs
+        self.paragraphs = []
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._current = None
+        self._skip_depth = 0
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip_depth += 1
+        elif tag == 'p':
+            # An unclosed <p> ends where the next one starts
+            self._finish_paragraph()
+            self._current = []
+    
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == 'p':
+            self._finish_paragraph()
+    
+    def handle_data(self, data):
+        if self._current is not None and not self._skip_depth:
+            self._current.append(data)
+    
+    def _finish_paragraph(self):
+        if self._current is not None:
+            p_text = ''.join(self._current)
+            if len(p_text.strip()) > 20:  # Only include paragraphs with meaningful content
+                self.paragraphs.append(p_text)
+            self._current = None
+    
+    def is_done(self):
+        """Check if enough qualifying paragraphs have been collected."""
+        return len(self.paragraphs) >= self.max_paragraphs
+    
+    def feed_bytes(self, chunk):
+        """
+        Feed a chunk of the raw body.
+        
+        Returns:
+            bool: True once enough paragraphs have been collected (stop downloading).
+        """
+        self.feed(self._decoder.decode(chunk))
+        return self.is_done()
+    
+    def get_text(self):
+        """Return the collected paragraphs as cleaned text."""
+        return clean_text('\n\n'.join(self.paragraphs[:self.max_paragraphs]))
+
+# Set once trafilatura turns out not to be installed; the paragraph collector is then the only extractor
+_trafilatura_missing = False
+
+def stream_extract(url, max_paragraphs=3, headers=None, timeout=10, max_bytes=MAX_PAGE_BYTES):
+    """
+    Download a page in streaming mode and extract its main text.
+    
+    Non-HTML responses are rejected from their headers and the body is
+    capped at `max_bytes`. trafilatura needs the whole page to tell the main
+    text from navigation and teasers, so the body is read up to the cap and
+    trafilatura runs over it; the incremental paragraph collector is fed
+    along the way and its paragraphs are used if trafilatura finds too
+    little, without parsing the page again. Only when trafilatura is not
+    installed, so the collected paragraphs are the result, does the download
+    stop as soon as `max_paragraphs` qualifying paragraphs have been collected.
+    
+    Args:
+        url (str): The URL to scrape.
+        max_paragraphs (int): Maximum number of paragraphs to extract.
+        headers (dict): Request headers.
+        timeout (float): Maximum request timeout in seconds.
+        max_bytes (int): Maximum number of body bytes to read.
+        
+    Returns:
+        str: The extracted text (empty if nothing was found).
+        
+    Raises:
+        requests.exceptions.RequestException: If the download fails.
+        http_client.UnsupportedContentTypeError: If the page isn't HTML.
+    """
+    global _trafilatura_missing
+    collector = ParagraphCollector(max_paragraphs)
+    stop_early = _trafilatura_missing
+    
+    def on_chunk(chunk):
+        # Stop parsing once the fallback text is complete; stop downloading only if nothing else needs the page
+        if collector.is_done():
+            return stop_early
+        return collector.feed_bytes(chunk) and stop_early
+    
+    html = fetch_bytes(
+        url,
+        headers=headers,
+        timeout=timeout,
+        max_bytes=max_bytes,
+        allowed_types=HTML_CONTENT_TYPES,
+        on_chunk=on_chunk
+    )
+    
+    text = None
+    if not stop_early:
+        try:
+            # trafilatura is CPU-bound, so it runs in the extraction pool
+            text = run_in_pool(extract_with_trafilatura, html, max_paragraphs)
+        except ImportError as e:
+            print(f"trafilatura is not available, using the paragraph collector: {e}")
+            _trafilatura_missing = True
+        except Exception as e:
+            print(f"Extractor extract_with_trafilatura failed: {e}")
+    
+    if not text:
+        collector.close()
+        text = collector.get_text()
+    return text or ""
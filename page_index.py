@@ -0,0 +1,144 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from url_normalizer import url_key
+from tracing import span
+
+# Set SCRAPEGPT_PAGE_INDEX=0 to stop indexing pages and answering from the index
+PAGE_INDEX_ENABLED = os.environ.get("SCRAPEGPT_PAGE_INDEX", "1") == "1"
+
+# SQLite file holding the full-text index (separate from the user database)
+PAGE_INDEX_DB = os.environ.get("SCRAPEGPT_PAGE_INDEX_DB", "page_index.db")
+
+# Seconds an indexed page is used before it has to be fetched again
+PAGE_INDEX_TTL = 7 * 24 * 3600
+
+# Pages kept in the index; the oldest are dropped beyond this
+MAX_INDEXED_PAGES = 20000
+
+# Writes between prunes of expired and excess pages
+PRUNE_EVERY = 200
+
+# Matching pages required before an answer is built from the index alone
+MIN_LOCAL_PAGES = 2
+
+# BM25 score per query keyword a page needs to count as a match. A keyword that
+# is frequent in the page scores about 1, one passing mention in a long page (or a
+# word most indexed pages contain) far less, so weak matches still go to the web
+MIN_SCORE_PER_KEYWORD = float(os.environ.get("SCRAPEGPT_PAGE_INDEX_MIN_SCORE", 0.5))
+
+_write_lock = threading.Lock()
+_writes = 0
+
+def get_index_connection():
+    """Create a connection to the page index, creating its tables if needed."""
+    conn = sqlite3.connect(PAGE_INDEX_DB, timeout=10)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS pages (
+        id INTEGER PRIMARY KEY,
+        url_key TEXT UNIQUE NOT NULL,
+        url TEXT NOT NULL,
+        indexed_at REAL NOT NULL
+    )
+    ''')
+    # Only the text is tokenized; rows share their rowid with pages
+    conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(text, tokenize="unicode61")')
+    return conn
+
+def index_page(url, text):
+    """
+    Add (or replace) a page's extracted text in the index.
+
+    Args:
+        url (str): The page URL.
+        text (str): Text extracted from the page.
+    """
+    global _writes
+    if not PAGE_INDEX_ENABLED or not text or not text.strip():
+        return
+
+    key = url_key(url)
+    try:
+        with _write_lock, span('page_index.write'):
+            conn = get_index_connection()
+            try:
+                with conn:
+                    row = conn.execute("SELECT id FROM pages WHERE url_key = ?", (key,)).fetchone()
+                    if row:
+                        conn.execute("DELETE FROM pages_fts WHERE rowid = ?", (row[0],))
+                        conn.execute("UPDATE pages SET url = ?, indexed_at = ? WHERE id = ?", (url, time.time(), row[0]))
+                        page_id = row[0]
+                    else:
+                        page_id = conn.execute(
+                            "INSERT INTO pages (url_key, url, indexed_at) VALUES (?, ?, ?)", (key, url, time.time())
+                        ).lastrowid
+                    conn.execute("INSERT INTO pages_fts (rowid, text) VALUES (?, ?)", (page_id, text))
+
+                _writes += 1
+                if _writes % PRUNE_EVERY == 0:
+                    _prune(conn)
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Error indexing {url}: {e}")
+
+def _prune(conn):
+    # Called with the write lock held
+    cutoff = time.time() - PAGE_INDEX_TTL
+    with conn:
+        stale = {row[0] for row in conn.execute("SELECT id FROM pages WHERE indexed_at < ?", (cutoff,))}
+        stale.update(row[0] for row in conn.execute(
+            "SELECT id FROM pages ORDER BY indexed_at DESC LIMIT -1 OFFSET ?", (MAX_INDEXED_PAGES,)
+        ))
+        for page_id in stale:
+            conn.execute("DELETE FROM pages_fts WHERE rowid = ?", (page_id,))
+            conn.execute("DELETE FROM pages WHERE id = ?", (page_id,))
+
+def match_expression(keywords):
+    """Build an FTS5 query requiring every keyword (quoted, so punctuation can't break the syntax)."""
+    terms = []
+    for keyword in keywords:
+        for word in re.findall(r'\w+', keyword):
+            terms.append('"' + word.replace('"', '""') + '"')
+    return ' AND '.join(terms)
+
+def search_pages(keywords, limit=10, min_score_per_keyword=MIN_SCORE_PER_KEYWORD):
+    """
+    Find indexed pages that match all the keywords well, best BM25 match first.
+
+    Args:
+        keywords (list): Words every page must contain.
+        limit (int): Maximum number of pages.
+        min_score_per_keyword (float): BM25 score per keyword a page needs (see MIN_SCORE_PER_KEYWORD).
+
+    Returns:
+        list: (url, text) tuples; empty if the index is off, empty or unavailable.
+    """
+    expression = match_expression(keywords)
+    if not PAGE_INDEX_ENABLED or not expression:
+        return []
+
+    # Keywords with punctuation become several terms, each scored separately
+    terms = expression.count(' AND ') + 1
+    try:
+        with span('page_index.search') as current:
+            conn = get_index_connection()
+            try:
+                # FTS5's bm25() is negated: lower is a better match
+                rows = conn.execute(
+                    "SELECT pages.url, pages_fts.text FROM pages_fts "
+                    "JOIN pages ON pages.id = pages_fts.rowid "
+                    "WHERE pages_fts MATCH ? AND pages.indexed_at >= ? AND bm25(pages_fts) <= ? "
+                    "ORDER BY bm25(pages_fts) LIMIT ?",
+                    (expression, time.time() - PAGE_INDEX_TTL, -min_score_per_keyword * terms, limit)
+                ).fetchall()
+            finally:
+                conn.close()
+            current.set(pages=len(rows))
+            return rows
+    except sqlite3.Error as e:
+        print(f"Error searching page index: {e}")
+        return []
@@ -0,0 +1,138 @@
+import os
+import threading
+
+from database import get_popular_queries, get_user_queries
+from tracing import trace
+
+# Set SCRAPEGPT_PREFETCH=0 to disable background prefetching
+PREFETCH_ENABLED = os.environ.get("SCRAPEGPT_PREFETCH", "1") == "1"
+
+# Also warm a user's own recent queries after they log in
+PREFETCH_USER_HISTORY = os.environ.get("SCRAPEGPT_PREFETCH_USER_HISTORY", "1") == "1"
+
+# Seconds between prefetch cycles
+PREFETCH_INTERVAL = int(os.environ.get("SCRAPEGPT_PREFETCH_INTERVAL", 600))
+
+# Maximum number of responses regenerated per cycle (each costs a full crawl upstream)
+PREFETCH_BUDGET = int(os.environ.get("SCRAPEGPT_PREFETCH_BUDGET", 10))
+
+# Refresh entries that expire within this many seconds
+REFRESH_MARGIN = 900
+
+# Window used to spot trending queries
+TRENDING_HOURS = 6
+
+class Prefetcher:
+    """
+    Background thread that keeps responses for popular queries warm.
+
+    Each cycle mines the queries table for recently trending and all-time
+    frequent queries and regenerates the cached responses that are missing
+    or about to expire, spending at most `budget` crawls. User histories
+    queued after login are served first, from the same budget.
+    """
+
+    def __init__(self, interval=PREFETCH_INTERVAL, budget=PREFETCH_BUDGET):
+        """
+        Args:
+            interval (float): Seconds between prefetch cycles.
+            budget (int): Maximum responses regenerated per cycle.
+        """
+        self.interval = interval
+        self.budget = budget
+        self.refreshed = 0
+        self._user_queue = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background thread (once)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prefetcher", daemon=True)
+                self._thread.start()
+
+    def queue_user_history(self, username, limit=5):
+        """
+        Queue a user's recent queries to be warmed in the next cycle.
+
+        Args:
+            username (str): The user who just logged in.
+            limit (int): Number of recent queries to warm.
+        """
+        queries = [row['query'] for row in get_user_queries(username, limit=limit)]
+        with self._lock:
+            for query in queries:
+                if query not in self._user_queue:
+                    self._user_queue.append(query)
+        # Run a cycle now rather than waiting for the next interval
+        self._wake.set()
+
+    def candidates(self):
+        """
+        Get the queries worth keeping warm, most important first.
+
+        Returns:
+            list: Query strings (user histories, then trending, then all-time frequent).
+        """
+        with self._lock:
+            queries = list(self._user_queue)
+            self._user_queue.clear()
+
+        # Trending queries were asked several times recently; frequent ones at least twice overall
+        trending = [row['query'] for row in get_popular_queries(limit=self.budget, since_hours=TRENDING_HOURS) if row['count'] >= 2]
+        frequent = [row['query'] for row in get_popular_queries(limit=self.budget * 2) if row['count'] >= 2]
+
+        seen = set()
+        ordered = []
+        for query in queries + trending + frequent:
+            normalized = ' '.join(query.lower().split())
+            if normalized and normalized not in seen:
+                seen.add(normalized)
+                ordered.append(query)
+        return ordered
+
+    def run_cycle(self):
+        """
+        Refresh missing or expiring responses for the candidate queries.
+
+        Returns:
+            int: Number of responses regenerated.
+        """
+        # Imported here so importing the prefetcher doesn't pull in the scrapers
+        from content_generator import response_cache, response_key, refresh_response
+
+        refreshed = 0
+        for query in self.candidates():
+            if refreshed >= self.budget:
+                break
+
+            expires_in = response_cache.expires_in(response_key(query))
+            if expires_in is not None and expires_in > REFRESH_MARGIN:
+                continue
+
+            try:
+                # Default limits, which most sessions use
+                with trace('prefetch', query=query):
+                    refresh_response(query)
+                refreshed += 1
+            except Exception as e:
+                print(f"Error prefetching response for '{query}': {e}")
+
+        self.refreshed += refreshed
+        if refreshed:
+            print(f"Prefetched {refreshed} responses")
+        return refreshed
+
+    def _run(self):
+        while True:
+            try:
+                self.run_cycle()
+            except Exception as e:
+                print(f"Error in prefetch cycle: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+# Prefetcher shared by all sessions in the process
+prefetcher = Prefetcher()
@@ -0,0 +1,300 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+# Set SCRAPEGPT_PROFILE=1 to sample stacks from startup (admins can also toggle it in the sidebar)
+PROFILING_ENABLED = os.environ.get("SCRAPEGPT_PROFILE", "0") == "1"
+
+# Usernames allowed to toggle profiling from the sidebar (comma-separated)
+PROFILER_ADMINS = {
+    name.strip() for name in os.environ.get("SCRAPEGPT_PROFILER_ADMINS", "").split(",") if name.strip()
+}
+
+# Seconds between stack samples (100 Hz keeps overhead to a few percent of one core)
+SAMPLE_INTERVAL = float(os.environ.get("SCRAPEGPT_PROFILE_INTERVAL", 0.01))
+
+# Directory the collapsed-stack files are written to
+PROFILE_DIR = os.environ.get("SCRAPEGPT_PROFILE_DIR", "profiles")
+
+# Per-turn files kept on disk; the oldest are deleted beyond this
+MAX_PROFILE_FILES = 200
+
+# Frames kept per sample, innermost first
+MAX_STACK_DEPTH = 64
+
+# Profile a unit of work is sampled into, propagated to helper threads with the context
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+_enabled = PROFILING_ENABLED
+_lock = threading.Lock()
+# thread id -> profiles sampling it
+_active = {}
+_wake = threading.Event()
+_sampler = None
+
+# Samples of all finished profiles, for aggregation across turns
+aggregate = Counter()
+
+class Profile:
+    """Stack samples collected for one unit of work, e.g. a chat turn."""
+
+    def __init__(self, name, attrs=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.name = name
+        self.attrs = attrs or {}
+        self.samples = Counter()
+        self.started_at = time.time()
+
+def is_enabled():
+    """Check if profiling is currently on."""
+    return _enabled
+
+def set_enabled(enabled):
+    """Turn profiling on or off for the whole process."""
+    global _enabled
+    _enabled = bool(enabled)
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _collapse(frame):
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+def _sample_loop():
+    sampler_id = threading.get_ident()
+    while True:
+        with _lock:
+            idle = not _active
+        if idle:
+            _wake.wait()
+            _wake.clear()
+            continue
+
+        time.sleep(SAMPLE_INTERVAL)
+
+        # Only threads inside a profile are walked; other threads cost a dict lookup
+        frames = sys._current_frames()
+        with _lock:
+            targets = [(thread_id, list(profiles)) for thread_id, profiles in _active.items()]
+        stacks = []
+        for thread_id, profiles in targets:
+            frame = frames.get(thread_id)
+            if frame is not None and thread_id != sampler_id:
+                stacks.append((_collapse(frame), profiles))
+        del frames
+
+        with _lock:
+            for stack, profiles in stacks:
+                for profile in profiles:
+                    profile.samples[stack] += 1
+
+def _ensure_sampler():
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="profiler", daemon=True)
+            _sampler.start()
+
+def _attach(profile):
+    thread_id = threading.get_ident()
+    with _lock:
+        _active.setdefault(thread_id, []).append(profile)
+    _wake.set()
+    return thread_id
+
+def _detach(thread_id, profile):
+    with _lock:
+        profiles = _active.get(thread_id, [])
+        if profile in profiles:
+            profiles.remove(profile)
+        if not profiles:
+            _active.pop(thread_id, None)
+
+@contextmanager
+def profile(name, **attrs):
+    """
+    Sample the current thread's stacks while the block runs, if profiling is on.
+
+    When the block ends the samples are written to PROFILE_DIR as a
+    collapsed-stack file (flamegraph.pl / speedscope format) and added
+    to the process-wide aggregate.
+
+    Args:
+        name (str): Kind of work, used in the file name (e.g. 'turn', 'render').
+        **attrs: Details kept on the profile (e.g. the query).
+
+    Yields:
+        Profile: The profile, or None when profiling is off.
+    """
+    if not _enabled or _current_profile.get() is not None:
+        # Nested blocks are already covered by the outer profile
+        yield _current_profile.get()
+        return
+
+    _ensure_sampler()
+    current = Profile(name, attrs)
+    token = _current_profile.set(current)
+    thread_id = _attach(current)
+    try:
+        yield current
+    finally:
+        _detach(thread_id, current)
+        _current_profile.reset(token)
+        _finish(current)
+
+@contextmanager
+def join_profile():
+    """
+    Sample the current thread into the caller's profile, if there is one.
+
+    Used by helper threads that run work on behalf of a profiled turn
+    (the profile travels with the context, see tracing.wrap).
+    """
+    current = _current_profile.get()
+    if current is None:
+        yield
+        return
+
+    thread_id = _attach(current)
+    try:
+        yield
+    finally:
+        _detach(thread_id, current)
+
+def format_collapsed(samples):
+    """Format samples as collapsed stacks ('a;b;c count' lines, root first)."""
+    return ''.join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+def _finish(current):
+    with _lock:
+        samples = Counter(current.samples)
+        aggregate.update(samples)
+    if not samples:
+        return
+
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(current.started_at))
+        path = os.path.join(PROFILE_DIR, f"{current.name}-{stamp}-{current.id}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(format_collapsed(samples))
+        _prune_files()
+    except OSError as e:
+        print(f"Error writing profile: {e}")
+
+def _prune_files():
+    files = [
+        os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR)
+        if name.endswith('.folded') and not name.startswith('aggregate')
+    ]
+    if len(files) > MAX_PROFILE_FILES:
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - MAX_PROFILE_FILES]:
+            os.remove(path)
+
+def read_collapsed(path):
+    """
+    Read a collapsed-stack file.
+
+    Returns:
+        Counter: stack -> sample count.
+    """
+    samples = Counter()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                samples[stack] += int(count)
+    return samples
+
+def merge_profiles(paths, output=None):
+    """
+    Aggregate collapsed-stack files, e.g. every turn profiled over a day.
+
+    Args:
+        paths (list): Files to merge.
+        output (str): File to write the merged stacks to (optional).
+
+    Returns:
+        Counter: stack -> total sample count.
+    """
+    merged = Counter()
+    for path in paths:
+        merged.update(read_collapsed(path))
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(format_collapsed(merged))
+    return merged
+
+def write_aggregate(path=None):
+    """
+    Write the in-process aggregate of all finished profiles.
+
+    Args:
+        path (str): Output file (default: PROFILE_DIR/aggregate.folded).
+
+    Returns:
+        str: The path written.
+    """
+    path = path or os.path.join(PROFILE_DIR, "aggregate.folded")
+    with _lock:
+        samples = Counter(aggregate)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(format_collapsed(samples))
+    return path
+
+def top_frames(samples, limit=20):
+    """
+    Rank frames by the share of samples they appear in (inclusive) and sit on top of (self).
+
+    Args:
+        samples (Counter): stack -> sample count.
+        limit (int): Number of frames to return.
+
+    Returns:
+        list: (frame, self_share, total_share) tuples, highest self share first.
+    """
+    total = sum(samples.values())
+    if not total:
+        return []
+
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in samples.items():
+        frames = stack.split(';')
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+
+    return [
+        (frame, count / total, total_counts[frame] / total)
+        for frame, count in self_counts.most_common(limit)
+    ]
+
+if __name__ == "__main__":
+    # Merge collapsed-stack files and print the hottest frames:
+    #   python profiler.py profiles/turn-*.folded [-o merged.folded]
+    args = sys.argv[1:]
+    output = None
+    if '-o' in args:
+        index = args.index('-o')
+        output = args[index + 1]
+        del args[index:index + 2]
+    if not args:
+        print("Usage: python profiler.py FILE.folded... [-o MERGED.folded]")
+        sys.exit(1)
+
+    merged = merge_profiles(args, output)
+    print(f"{sum(merged.values())} samples from {len(args)} files")
+    for frame, self_share, total_share in top_frames(merged):
+        print(f"{self_share:6.1%} self {total_share:6.1%} total  {frame}")
@@ -0,0 +1,410 @@
+import heapq
+import json
+import math
+import os
+import queue
+import re
+import threading
+from collections import Counter
+from itertools import chain
+from operator import attrgetter
+
+import numpy as np
+
+from tracing import span
+
+# JSON file with document frequencies learned from past result sets
+IDF_FILE = os.environ.get("SCRAPEGPT_IDF_FILE", "idf_table.json")
+
+# Weight of relevance against domain diversity when picking the displayed links (1 disables diversity)
+MMR_LAMBDA = float(os.environ.get("SCRAPEGPT_RANK_MMR_LAMBDA", 0.8))
+
+# Candidates considered per displayed link when reranking for diversity
+CANDIDATES_PER_PICK = 3
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# A query term in the title counts this many times a term in the description
+TITLE_WEIGHT = 2.0
+
+# Share of the score coming from the search engine's own order
+POSITION_WEIGHT = 0.3
+
+# Bonus (relative to the best BM25 score) for results with the whole query in the title
+PHRASE_BONUS = 0.5
+
+# Terms kept in the IDF table; the rarest are dropped beyond this
+MAX_IDF_TERMS = 100000
+
+# Result sets learned between writes of the IDF table
+SAVE_EVERY = 20
+
+WORD = re.compile(r'\w+')
+
+def query_terms(query):
+    """Return the distinct lowercased words of a query, in order."""
+    return list(dict.fromkeys(WORD.findall(query.lower())))
+
+class IDFTable:
+    """
+    Document frequencies of words over all result sets seen so far, persisted to IDF_FILE.
+
+    Ranking only reads it (two dict lookups per query term). Learning a
+    result set means tokenizing every title and description, so that runs
+    on a background thread and never delays the ranking it came from.
+    """
+
+    def __init__(self, path=IDF_FILE):
+        self.path = path
+        self.documents = 0
+        self.df = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=100)
+        self._thread = None
+        self.load()
+
+    def load(self):
+        """Read the table from disk (an empty table if the file is missing or unreadable)."""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            with self._lock:
+                self.documents = int(data.get('documents', 0))
+                self.df = {term: int(count) for term, count in data.get('df', {}).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"Error loading IDF table {self.path}: {e}")
+
+    def save(self):
+        """Write the table to disk atomically."""
+        with self._lock:
+            data = {'documents': self.documents, 'df': dict(self.df)}
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving IDF table {self.path}: {e}")
+
+    def lookup(self, terms):
+        """
+        Get the historical document count and the frequency of each term.
+
+        Returns:
+            tuple: (documents, list of document frequencies, one per term).
+        """
+        with self._lock:
+            return self.documents, [self.df.get(term, 0) for term in terms]
+
+    def learn(self, results):
+        """Queue a result set to be counted in the background."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._learn_loop, name="idf-learner", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(results)
+        except queue.Full:
+            # Learning is best effort; skip sets while the learner is behind
+            pass
+
+    def _learn_loop(self):
+        while True:
+            results = self._queue.get()
+            try:
+                self._count(results)
+            except Exception as e:
+                print(f"Error learning IDF terms: {e}")
+
+    def _count(self, results):
+        texts = _texts(results)
+        counts = Counter()
+        # Each result (title plus description) is one document
+        for title, description in zip(texts[::2], texts[1::2]):
+            counts.update(set(WORD.findall(f"{title} {description}".lower())))
+
+        with self._lock:
+            self.documents += len(results)
+            df = self.df
+            for term, count in counts.items():
+                df[term] = df.get(term, 0) + count
+            if len(df) > MAX_IDF_TERMS:
+                # Dropping the rarest terms only makes their IDF look like an unseen word's
+                keep = sorted(df.items(), key=lambda item: item[1], reverse=True)[:MAX_IDF_TERMS * 9 // 10]
+                self.df = dict(keep)
+            self._pending += 1
+            save = self._pending >= SAVE_EVERY
+            if save:
+                self._pending = 0
+        if save:
+            self.save()
+
+# Table shared by all sessions in the process
+idf_table = IDFTable()
+
+def _domain(url):
+    # Cheaper than urlsplit for the hundreds of URLs in a result set
+    parts = url.split('/', 3)
+    host = parts[2] if len(parts) > 2 else url
+    return host.lower().removeprefix('www.')
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+def _occurrences(data, term):
+    """
+    Start offsets of whole-word occurrences of term in data.
+
+    Args:
+        data (bytes): Lowercased UTF-8 text.
+        term (bytes): Lowercased UTF-8 word.
+    """
+    # A leading \b would disable the engine's literal-prefix search, and bytes
+    # patterns only know ASCII word characters, so the few hits are checked here
+    # against their neighbouring characters
+    pattern = re.escape(term) + (rb'\b' if term[-1] < 0x80 else b'')
+    positions = []
+    for match in re.finditer(pattern, data):
+        start, end = match.span()
+        before = data[max(0, start - 4):start].decode('utf-8', 'ignore')[-1:]
+        after = data[end:end + 4].decode('utf-8', 'ignore')[:1]
+        if not (before and _is_word_char(before)) and not (after and _is_word_char(after)):
+            positions.append(start)
+    return positions
+
+def _phrase_starts(data, terms, hits):
+    """Start offsets where the terms (bytes) occur in order, separated by single spaces."""
+    starts = set(hits[0])
+    shift = 0
+    for previous, term, positions in zip(terms, terms[1:], hits[1:]):
+        shift += len(previous) + 1
+        starts &= {position - shift for position in positions if data[position - 1] == 0x20}
+        if not starts:
+            break
+    return sorted(starts)
+
+_title_and_description = attrgetter('title', 'description')
+
+def _texts(results):
+    # Title and description of each result, interleaved; attribute access
+    # avoids going through Record.get a thousand times
+    try:
+        texts = list(chain.from_iterable(map(_title_and_description, results)))
+    except AttributeError:
+        # Legacy dict results
+        return [result.get(field) or '' for result in results for field in ('title', 'description')]
+    if None in texts:
+        texts = [text or '' for text in texts]
+    return texts
+
+def score_results(query, results):
+    """
+    Score results against a query with BM25 over titles and descriptions.
+
+    All titles and descriptions are joined into one lowercased UTF-8 buffer
+    and each query term is found with a single regex scan over it; the hits
+    are mapped back to results with one binary search over the field bounds.
+    Only the few results a term occurs in get a BM25 score, so the formula
+    runs over the hits rather than over every result. IDF combines the
+    current result set with the document frequencies learned from earlier
+    ones (see IDFTable).
+
+    Args:
+        query (str): The search query.
+        results (list): SearchResult records (or dicts with title, description and url).
+
+    Returns:
+        numpy.ndarray: One score per result; higher is more relevant.
+    """
+    count = len(results)
+    if not count:
+        return np.zeros(0)
+
+    scores = POSITION_WEIGHT * (1.0 - np.arange(count) / count)
+    terms = query_terms(query)
+    if not terms:
+        return scores
+
+    texts = _texts(results)
+    # NUL-separated so no word spans two fields and the field bounds can be found with NumPy
+    raw = '\0'.join(texts)
+    if all(term.isascii() for term in terms):
+        # ASCII terms only need ASCII case folding, and bytes.lower() is far faster
+        # than str.lower(), especially once a curly quote or accent makes the text wide
+        data = raw.encode('utf-8', 'replace').lower()
+    else:
+        data = raw.lower().encode('utf-8', 'replace')
+    separators = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 0)
+    if len(separators) != 2 * count - 1:
+        # Some field contains a NUL itself
+        raw = '\0'.join(text.replace('\0', ' ') for text in texts)
+        data = raw.lower().encode('utf-8', 'replace')
+        separators = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 0)
+
+    encoded_terms = [term.encode('utf-8') for term in terms]
+    hits = [_occurrences(data, term) for term in encoded_terms]
+    if not any(hits):
+        return scores
+
+    # Field lengths in characters; even fields are titles, odd ones descriptions
+    lengths = list(map(len, texts))
+    # Field of every hit, all terms at once
+    fields = np.searchsorted(separators, list(chain.from_iterable(hits))).tolist()
+
+    # Field-weighted term frequencies, per term: result index -> tf
+    tf = []
+    position = 0
+    for positions in hits:
+        counts = {}
+        for field in fields[position:position + len(positions)]:
+            index = field >> 1
+            counts[index] = counts.get(index, 0) + (1.0 if field & 1 else TITLE_WEIGHT)
+        tf.append(counts)
+        position += len(positions)
+
+    documents, historical_df = idf_table.lookup(terms)
+    total = documents + count
+    # Field-weighted length in characters (a stand-in for word count; only the ratio to the mean matters)
+    average_length = (TITLE_WEIGHT * sum(lengths[0::2]) + sum(lengths[1::2])) / count or 1.0
+
+    bm25 = {}
+    for counts, seen in zip(tf, historical_df):
+        df = seen + len(counts)
+        idf = math.log1p((total - df + 0.5) / (df + 0.5))
+        for index, frequency in counts.items():
+            length = TITLE_WEIGHT * lengths[2 * index] + lengths[2 * index + 1]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+            bm25[index] = bm25.get(index, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+    best = max(bm25.values())
+    if best <= 0:
+        return scores
+    relevance = {index: value / best for index, value in bm25.items()}
+    if len(terms) > 1:
+        # Whole query as a phrase in the title, as the old ranking rewarded;
+        # found from the term hits rather than with another scan
+        phrases = _phrase_starts(data, encoded_terms, hits)
+        if phrases:
+            fields = np.searchsorted(separators, phrases).tolist()
+            for index in {field >> 1 for field in fields if not field & 1}:
+                relevance[index] += PHRASE_BONUS
+    scores[list(relevance)] += list(relevance.values())
+    return scores
+
+def mmr_select(scores, domains, limit, relevance_weight=MMR_LAMBDA):
+    """
+    Pick results by maximal marginal relevance, with sharing a domain as the redundancy.
+
+    Args:
+        scores (numpy.ndarray): Relevance scores.
+        domains (list): Domain of each result.
+        limit (int): Number of results to pick.
+        relevance_weight (float): 1 ranks by relevance only; lower values spread picks across domains.
+
+    Returns:
+        list: Indices of the picked results, in display order.
+    """
+    if relevance_weight >= 1 or limit <= 1 or domains is None:
+        return np.argsort(-scores, kind='stable')[:limit].tolist()
+
+    low, high = scores.min(), scores.max()
+    relevance = ((scores - low) / (high - low) if high > low else np.ones(len(scores))).tolist()
+    domain_ids = {}
+    domain_of = [domain_ids.setdefault(domain, len(domain_ids)) for domain in domains]
+    picked_per_domain = [0] * len(domain_ids)
+
+    # Lazy greedy: a result's value only drops as its domain gets picked, so an
+    # entry scored with a stale pick count overestimates it. If the best entry
+    # is current it beats everything else; if not, it is rescored and pushed back.
+    # Entries are (-value, index, redundancy level), so ties go to the lower index.
+    heap = [(-relevance_weight * value, index, 0) for index, value in enumerate(relevance)]
+    heapq.heapify(heap)
+    picks = []
+    while heap and len(picks) < limit:
+        _, index, level = heapq.heappop(heap)
+        domain = domain_of[index]
+        # Each earlier pick from the same domain makes a result more redundant (up to two)
+        current = min(picked_per_domain[domain], 2)
+        if current != level:
+            value = relevance_weight * relevance[index] - (1 - relevance_weight) * current / 2
+            heapq.heappush(heap, (-value, index, current))
+            continue
+        picks.append(index)
+        picked_per_domain[domain] += 1
+    return picks
+
+def rank_results(query, results, limit=10, diversify=True, learn=True):
+    """
+    Pick the results to display for a query.
+
+    Every result is scored (see score_results), then the top `limit` are
+    picked with domain-diversity reranking (see mmr_select) among the
+    limit * CANDIDATES_PER_PICK best scored.
+
+    Args:
+        query (str): The search query.
+        results (list): The search results, in the engines' order.
+        limit (int): Number of results to return.
+        diversify (bool): Spread the picks across domains (MMR_LAMBDA controls how much).
+        learn (bool): Add this result set to the persisted IDF table.
+
+    Returns:
+        list: The picked results, most relevant first.
+    """
+    if not results or limit <= 0:
+        return []
+
+    with span('rank', results=len(results)):
+        scores = score_results(query, results)
+        if diversify and MMR_LAMBDA < 1:
+            # Diversity only reorders the strongest candidates
+            candidates = np.argsort(-scores, kind='stable')[:limit * CANDIDATES_PER_PICK]
+            domains = [_domain(results[index].get('url') or '') for index in candidates.tolist()]
+            picks = candidates[mmr_select(scores[candidates], domains, limit)].tolist()
+        else:
+            picks = mmr_select(scores, None, limit, relevance_weight=1)
+
+    if learn:
+        idf_table.learn(list(results))
+    return [results[index] for index in picks]
+
+def benchmark(results=500, repeats=200):
+    """
+    Time rank_results on a synthetic result set.
+
+    Returns:
+        dict: Milliseconds per call for 'score' and 'rank' (scoring plus diversity).
+    """
+    import random
+    import statistics
+    import timeit
+
+    from records import SearchResult
+
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(2000)] + ['solar', 'panel', 'panels', 'energy', 'cost']
+    items = [
+        SearchResult(
+            ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(4, 10))),
+            ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(15, 35))),
+            f"https://site{rng.randint(0, 60)}.example.com/page/{i}",
+        )
+        for i in range(results)
+    ]
+    query = "solar panels cost"
+    # Median of seven rounds: steadier than one run, without hiding a loaded machine like the best would
+    return {
+        'score': statistics.median(timeit.repeat(lambda: score_results(query, items), number=repeats, repeat=7)) / repeats * 1000,
+        'rank': statistics.median(timeit.repeat(lambda: rank_results(query, items, learn=False), number=repeats, repeat=7)) / repeats * 1000,
+    }
+
+if __name__ == "__main__":
+    for size in (50, 500):
+        timings = benchmark(results=size)
+        print(f"{size:>4} results: score {timings['score']:.3f} ms, rank with diversity {timings['rank']:.3f} ms")
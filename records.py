@@ -0,0 +1,126 @@
+import sys
+
+class Record:
+    """
+    Base class for compact, slotted result records.
+
+    Records replace the per-result dicts that used to travel through the
+    scrapers, the caches and st.session_state. Slots avoid a per-instance
+    __dict__, fields that can be derived from others are computed on access
+    instead of stored, and to_tuple/from_tuple give a compact form for
+    serialization. get() and [] keep the old dict-style access working.
+    """
+
+    __slots__ = ()
+
+    # Stored fields, in constructor and tuple order
+    FIELDS = ()
+
+    # Fields computed from the stored ones
+    DERIVED = ()
+
+    def get(self, key, default=None):
+        """Return a field by name, or default if the record has no such field."""
+        if key in self.FIELDS or key in self.DERIVED:
+            value = getattr(self, key)
+            return default if value is None else value
+        return default
+
+    def __getitem__(self, key):
+        if key in self.FIELDS or key in self.DERIVED:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS or key in self.DERIVED
+
+    def keys(self):
+        """Return all field names, stored and derived."""
+        return self.FIELDS + self.DERIVED
+
+    def to_tuple(self):
+        """Return the stored fields as a tuple (the compact serialized form)."""
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    @classmethod
+    def from_tuple(cls, values):
+        """Rebuild a record from to_tuple() output."""
+        return cls(*values)
+
+    def to_dict(self):
+        """Return all fields, stored and derived, as a dict (for JSON output)."""
+        return {name: getattr(self, name) for name in self.keys()}
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return type(self) is type(other) and self.to_tuple() == other.to_tuple()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((type(self).__name__,) + self.to_tuple())
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+    def __reduce__(self):
+        # Pickle as the class plus the stored-field tuple
+        return (type(self).from_tuple, (self.to_tuple(),))
+
+class SearchResult(Record):
+    """A web search result."""
+
+    __slots__ = ('title', 'description', 'url')
+    FIELDS = ('title', 'description', 'url')
+
+    def __init__(self, title, description, url):
+        self.title = title
+        self.description = description
+        self.url = url
+
+class Video(Record):
+    """A YouTube video; its page, thumbnail and embed URLs are derived from the id."""
+
+    __slots__ = ('id', 'title')
+    FIELDS = ('id', 'title')
+    DERIVED = ('url', 'thumbnail', 'embed_url')
+
+    def __init__(self, id, title):
+        # Video ids repeat across cached responses and sessions, so share one copy
+        self.id = sys.intern(id)
+        self.title = title
+
+    @property
+    def url(self):
+        return f'https://www.youtube.com/watch?v={self.id}'
+
+    @property
+    def thumbnail(self):
+        return f'https://i.ytimg.com/vi/{self.id}/hqdefault.jpg'
+
+    @property
+    def embed_url(self):
+        return f'https://www.youtube.com/embed/{self.id}'
+
+def to_jsonable(value):
+    """
+    Convert a response (or any part of one) into plain JSON-serializable values.
+
+    Records become dicts with their derived fields included; dicts, lists and
+    tuples are converted recursively.
+
+    Args:
+        value: The value to convert.
+
+    Returns:
+        The converted value.
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    return value
@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from url_normalizer import url_key
+from web_scraper import get_duckduckgo_results, get_bing_results
+from tracing import wrap, annotate
+
+# Constant k of reciprocal rank fusion; dampens the weight of top ranks
+RRF_K = 60
+
+# Hedge delay used until a provider has enough latency samples
+DEFAULT_HEDGE_DELAY = 4.0
+
+# Minimum number of samples before the observed p90 is trusted
+MIN_LATENCY_SAMPLES = 5
+
+# Threads shared by all sessions for running provider searches
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+class SearchProvider:
+    """
+    Base class for a search engine that can take part in federated search.
+
+    Subclasses set `name` and implement `fetch`. Each provider keeps a rolling
+    window of its own response times so the federation layer knows when to
+    hedge with the next provider.
+    """
+
+    name = "provider"
+
+    def __init__(self, window=50):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def fetch(self, query, max_results):
+        """
+        Scrape results for a query.
+
+        Returns:
+            list: List of SearchResult records (title, description, and URL).
+        """
+        raise NotImplementedError
+
+    def search(self, query, max_results):
+        """Run fetch and record how long it took."""
+        start = time.monotonic()
+        try:
+            return self.fetch(query, max_results)
+        finally:
+            self.record_latency(time.monotonic() - start)
+
+    def record_latency(self, seconds):
+        """Add a response time to the rolling window."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self):
+        """
+        Seconds to wait for this provider before starting the next one.
+
+        Returns:
+            float: The p90 of recent response times, or DEFAULT_HEDGE_DELAY if too few samples exist.
+        """
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+
+class DuckDuckGoProvider(SearchProvider):
+    """DuckDuckGo HTML search."""
+
+    name = "duckduckgo"
+
+    def fetch(self, query, max_results):
+        # Fallback links are added once, after federation, not per provider
+        return get_duckduckgo_results(query, max_results, use_fallback=False)
+
+class BingProvider(SearchProvider):
+    """Bing web search."""
+
+    name = "bing"
+
+    def fetch(self, query, max_results):
+        return get_bing_results(query, max_results)
+
+# Providers in order of preference; the first is always queried, the others are hedges
+PROVIDERS = [DuckDuckGoProvider(), BingProvider()]
+
+def register_provider(provider, position=None):
+    """
+    Add a search provider to the federation.
+
+    Args:
+        provider (SearchProvider): The provider instance.
+        position (int): Index in the preference order (default: last).
+    """
+    if position is None:
+        PROVIDERS.append(provider)
+    else:
+        PROVIDERS.insert(position, provider)
+
+def reciprocal_rank_fusion(result_lists, max_results=500, k=RRF_K):
+    """
+    Merge ranked result lists into one, deduplicating by canonical URL.
+
+    Each result scores sum(1 / (k + rank)) over the lists it appears in, so
+    results found by several engines move up.
+
+    Args:
+        result_lists (list): Ranked lists of SearchResult records, most preferred provider first.
+        max_results (int): Maximum number of merged results to return.
+        k (int): RRF damping constant.
+
+    Returns:
+        list: Merged list of SearchResult records, best first.
+    """
+    scores = {}
+    merged = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, 1):
+            key = url_key(result.get('url', ''))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            # Keep the title/description from the most preferred provider
+            if key not in merged:
+                merged[key] = result
+
+    # Python's sort is stable, so ties keep the preferred provider's order
+    ranked_keys = sorted(merged, key=lambda key: scores[key], reverse=True)
+    return [merged[key] for key in ranked_keys[:max_results]]
+
+def federated_search(query, max_results=500, providers=None, timeout=30):
+    """
+    Search several engines with hedged requests and merge their results.
+
+    The first provider is started immediately. If it hasn't answered within
+    its p90 latency (or fails or comes back empty), the next provider is
+    started, and so on. As soon as any provider returns results, those and
+    any other already finished result lists are merged with reciprocal rank
+    fusion; providers still running are left to finish in the background.
+
+    Args:
+        query (str): The search query.
+        max_results (int): Maximum number of results to return.
+        providers (list): Providers in preference order (default: PROVIDERS).
+        timeout (float): Overall seconds to wait for any provider.
+
+    Returns:
+        list: List of SearchResult records (title, description, and URL) (empty if every provider failed).
+    """
+    providers = list(providers or PROVIDERS)
+    if not providers:
+        return []
+
+    deadline = time.monotonic() + timeout
+    pending = {}
+    finished = []
+    next_provider = 0
+
+    def start_next():
+        nonlocal next_provider
+        provider = providers[next_provider]
+        next_provider += 1
+        # Provider spans join the caller's trace
+        future = _executor.submit(wrap(provider.search), query, max_results)
+        pending[future] = provider
+        return provider
+
+    current = start_next()
+
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        # Wait up to the current provider's p90 before hedging with the next one
+        can_hedge = next_provider < len(providers)
+        wait_time = min(current.hedge_delay(), remaining) if can_hedge else remaining
+        done, _ = wait(list(pending), timeout=wait_time, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Search provider {provider.name} failed: {e}")
+                results = []
+            finished.append((providers.index(provider), results))
+
+        if any(results for _, results in finished):
+            break
+
+        # Hedge: the current provider is slow, failed or returned nothing
+        if can_hedge:
+            current = start_next()
+            annotate(hedged=current.name)
+
+    # Merge in provider preference order
+    finished.sort(key=lambda item: item[0])
+    result_lists = [results for _, results in finished if results]
+    if len(result_lists) > 1:
+        print(f"Merged results from {len(result_lists)} search providers for query: {query}")
+    return reciprocal_rank_fusion(result_lists, max_results)
@@ -0,0 +1,403 @@
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from collections import OrderedDict
+
+from metrics import registry
+from records import Record
+
+# Approximate bytes of message and cache content each session may keep in memory
+SESSION_MEMORY_BUDGET = int(os.environ.get("SCRAPEGPT_SESSION_BUDGET_KB", 2048)) * 1024
+
+# SQLite file holding spilled session content (separate from the user database)
+SPILL_DB_FILE = os.environ.get("SCRAPEGPT_SPILL_DB", "session_spill.db")
+
+# Seconds spilled content is kept after it was last written or read (sessions don't
+# announce their end); content of sessions still open in this process is never purged
+SPILL_TTL = 24 * 3600
+
+# Text shown in place of an answer whose spilled content is gone
+EXPIRED_TEXT = "(expired)"
+
+# Spilled items kept decoded after loading, so one render doesn't reload an item per field
+LOAD_CACHE_SIZE = 8
+
+# Item kinds
+MESSAGE = "message"
+CACHE = "cache"
+
+# Stores of live sessions, for metrics
+_stores = weakref.WeakValueDictionary()
+
+def get_spill_connection():
+    """Create a connection to the spill database, creating its table if needed."""
+    conn = sqlite3.connect(SPILL_DB_FILE, timeout=10)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS spilled_items (
+        session_id TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        item_key TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (session_id, item_key)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_spilled_chat ON spilled_items (session_id, chat_id)')
+    return conn
+
+def estimate_size(obj, _seen=None):
+    """
+    Estimate the memory held by an object and everything it references.
+
+    Args:
+        obj: A message content value (dicts, lists, strings, records).
+
+    Returns:
+        int: Approximate size in bytes.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, _seen) + estimate_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += estimate_size(item, _seen)
+    elif isinstance(obj, Record):
+        for name in obj.FIELDS:
+            size += estimate_size(getattr(obj, name), _seen)
+    return size
+
+def content_length(content, field):
+    """
+    Get the number of items in a content field without loading spilled content.
+
+    Args:
+        content (dict or SpilledContent): An assistant message's content.
+        field (str): The field, e.g. 'search_results' or 'videos'.
+
+    Returns:
+        int: The number of items (0 if the field is missing).
+    """
+    if isinstance(content, SpilledContent):
+        return content.lengths.get(field, 0)
+    return len(content.get(field) or ())
+
+class SpilledContent:
+    """
+    Placeholder for content that was moved to disk.
+
+    Supports the dict reads the UI does (get, [], in) by loading the
+    content back from the spill database on access. Field lengths are kept
+    in memory so collapsed turns can be summarized without a load.
+    """
+
+    __slots__ = ('store', 'key', 'lengths')
+
+    def __init__(self, store, key, lengths):
+        self.store = store
+        self.key = key
+        self.lengths = lengths
+
+    def load(self):
+        """Load the content from disk (an "(expired)" answer if it is gone)."""
+        return self.store.load(self.key) or {"text": EXPIRED_TEXT}
+
+    def get(self, field, default=None):
+        return self.load().get(field, default)
+
+    def __getitem__(self, field):
+        return self.load()[field]
+
+    def __contains__(self, field):
+        return field in self.load()
+
+class SessionStore:
+    """
+    Per-session message list and response cache with a memory budget.
+
+    Once the estimated size of the content held in memory goes over the
+    budget, the oldest assistant responses and cache entries are pickled,
+    compressed and written to a SQLite spill file keyed by session and
+    chat id, and replaced by SpilledContent placeholders that load them
+    back when they are rendered.
+    """
+
+    def __init__(self, session_id=None, budget=SESSION_MEMORY_BUDGET):
+        """
+        Args:
+            session_id (str): Id of the browser session (default: a new random id).
+            budget (int): Bytes of content kept in memory before spilling.
+        """
+        self.session_id = session_id or uuid.uuid4().hex
+        self.budget = budget
+        self.chat_id = 1  # For tracking multiple chat sessions
+        self.messages = []
+        self.cache = {}
+        self.spills = 0
+        self.loads = 0
+        # item key -> (estimated size, content), oldest first
+        self._resident = OrderedDict()
+        # item key -> compressed size on disk
+        self._spilled = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        _stores[self.session_id] = self
+        purge_expired()
+
+    def add_message(self, role, content, time):
+        """
+        Append a message to the chat with a unique id (used to cache its rendered HTML).
+
+        Returns:
+            dict: The message.
+        """
+        message = {
+            "id": uuid.uuid4().hex,
+            "role": role,
+            "content": content,
+            "time": time
+        }
+        self.messages.append(message)
+        # User messages are short strings; only responses are worth tracking and spilling
+        if isinstance(content, dict):
+            self._track(message["id"], content)
+        return message
+
+    def cache_get(self, query):
+        """Return the cached response for a query (possibly a SpilledContent), or None."""
+        return self.cache.get(query)
+
+    def cache_set(self, query, response):
+        """Cache a response for a query."""
+        key = f"cache:{query}"
+        self.cache[query] = response
+        if isinstance(response, dict):
+            self._track(key, response)
+
+    def new_chat(self):
+        """Start a new chat; the messages of the old one are dropped from memory and disk."""
+        # Spilled responses that the cache still points at stay on disk
+        cached_keys = {c.key for c in self.cache.values() if isinstance(c, SpilledContent)}
+        dropped = [m["id"] for m in self.messages if m["id"] not in cached_keys]
+        with self._lock:
+            for key in dropped:
+                self._resident.pop(key, None)
+                self._spilled.pop(key, None)
+            self._loaded.clear()
+        self._delete(dropped)
+        self.messages = []
+        self.chat_id += 1
+
+    def clear(self):
+        """Drop all messages and cached responses, in memory and on disk."""
+        with self._lock:
+            self._resident.clear()
+            self._spilled.clear()
+            self._loaded.clear()
+        self._delete()
+        self.messages = []
+        self.cache = {}
+        self.chat_id += 1
+
+    def load(self, key):
+        """
+        Load spilled content back from disk.
+
+        Args:
+            key (str): The item key (message id, or 'cache:' + query).
+
+        Returns:
+            dict: The content, or an empty dict if it is no longer on disk.
+        """
+        with self._lock:
+            content = self._loaded.get(key)
+            if content is not None:
+                self._loaded.move_to_end(key)
+                return content
+
+        try:
+            conn = get_spill_connection()
+            row = conn.execute(
+                'SELECT data, created_at FROM spilled_items WHERE session_id = ? AND item_key = ?',
+                (self.session_id, key)
+            ).fetchone()
+            now = time.time()
+            if row is not None and now - row[1] > SPILL_TTL / 2:
+                # Content that is still being read counts as fresh for purge_expired
+                conn.execute(
+                    'UPDATE spilled_items SET created_at = ? WHERE session_id = ? AND item_key = ?',
+                    (now, self.session_id, key)
+                )
+                conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Error loading spilled content: {e}")
+            row = None
+
+        if row is None:
+            return {}
+
+        content = pickle.loads(zlib.decompress(row[0]))
+        with self._lock:
+            self.loads += 1
+            self._loaded[key] = content
+            while len(self._loaded) > LOAD_CACHE_SIZE:
+                self._loaded.popitem(last=False)
+        return content
+
+    def stats(self):
+        """
+        Get memory metrics for the session.
+
+        Returns:
+            dict: Bytes and item counts in memory and on disk, the budget, and spill/load counts.
+        """
+        with self._lock:
+            return {
+                'session_id': self.session_id,
+                'budget_bytes': self.budget,
+                'memory_bytes': self._memory_bytes(),
+                'memory_items': len(self._resident),
+                'disk_bytes': sum(self._spilled.values()),
+                'disk_items': len(self._spilled),
+                'messages': len(self.messages),
+                'spills': self.spills,
+                'loads': self.loads,
+            }
+
+    def _memory_bytes(self):
+        # Called with the lock held; a response that is both cached and in a message counts once
+        sizes = {id(content): size for size, content in self._resident.values()}
+        return sum(sizes.values())
+
+    def _track(self, key, content):
+        size = estimate_size(content)
+        with self._lock:
+            self._resident[key] = (size, content)
+            self._resident.move_to_end(key)
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        while True:
+            with self._lock:
+                if self._memory_bytes() <= self.budget or len(self._resident) <= 1:
+                    return
+                # Oldest first; the newest item always stays in memory
+                key, (_, content) = next(iter(self._resident.items()))
+            if not self._spill(key, content):
+                return
+
+    def _spill(self, key, content):
+        kind = CACHE if key.startswith("cache:") else MESSAGE
+
+        data = zlib.compress(pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL))
+        try:
+            conn = get_spill_connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO spilled_items VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.session_id, self.chat_id, key, kind, data, len(data), time.time())
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            # Stop spilling and keep the content in memory rather than lose it
+            print(f"Error spilling session content: {e}")
+            return False
+
+        # Replace every reference to the content (the same response may be cached and in a message)
+        lengths = {field: len(value) for field, value in content.items() if isinstance(value, (list, tuple))}
+        placeholder = SpilledContent(self, key, lengths)
+        for message in self.messages:
+            if message["content"] is content:
+                message["content"] = placeholder
+        for query, cached in self.cache.items():
+            if cached is content:
+                self.cache[query] = placeholder
+
+        with self._lock:
+            for other_key in [k for k, (_, c) in self._resident.items() if c is content]:
+                del self._resident[other_key]
+            self._spilled[key] = len(data)
+            self.spills += 1
+        return True
+
+    def _delete(self, keys=None):
+        # Delete the given items from disk, or all of the session's items
+        try:
+            conn = get_spill_connection()
+            if keys is None:
+                conn.execute('DELETE FROM spilled_items WHERE session_id = ?', (self.session_id,))
+            else:
+                conn.executemany(
+                    'DELETE FROM spilled_items WHERE session_id = ? AND item_key = ?',
+                    [(self.session_id, key) for key in keys]
+                )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Error deleting spilled content: {e}")
+
+def purge_expired(ttl=SPILL_TTL):
+    """
+    Delete spilled content left behind by ended sessions.
+
+    Items not written or read for ttl seconds are deleted, except those of
+    sessions still open in this process.
+    """
+    live_sessions = list(_stores.keys())
+    try:
+        conn = get_spill_connection()
+        conn.execute(
+            f'DELETE FROM spilled_items WHERE created_at < ? AND session_id NOT IN ({", ".join("?" * len(live_sessions))})',
+            [time.time() - ttl] + live_sessions
+        )
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"Error purging spilled content: {e}")
+
+def session_memory_stats():
+    """
+    Get memory metrics for every live session in the process.
+
+    Returns:
+        list: SessionStore.stats() dicts, largest in-memory footprint first.
+    """
+    stats = [store.stats() for store in list(_stores.values())]
+    return sorted(stats, key=lambda s: s['memory_bytes'], reverse=True)
+
+sessions_gauge = registry.gauge('scrapegpt_sessions', 'Live chat sessions in the process.')
+session_bytes_gauge = registry.gauge(
+    'scrapegpt_session_content_bytes', 'Bytes of session content summed over live sessions.', ('location',)
+)
+session_items_gauge = registry.gauge(
+    'scrapegpt_session_content_items', 'Session content items summed over live sessions.', ('location',)
+)
+largest_session_gauge = registry.gauge(
+    'scrapegpt_session_max_memory_bytes', 'In-memory content bytes of the largest live session.'
+)
+
+def _collect_session_stats():
+    # Totals rather than one series per session: session ids are short-lived and unbounded
+    stats = session_memory_stats()
+    sessions_gauge.set(len(stats))
+    for location in ('memory', 'disk'):
+        session_bytes_gauge.labels(location).set(sum(s[f'{location}_bytes'] for s in stats))
+        session_items_gauge.labels(location).set(sum(s[f'{location}_items'] for s in stats))
+    largest_session_gauge.set(stats[0]['memory_bytes'] if stats else 0)
+
+registry.register_collector('sessions', _collect_session_stats)
@@ -0,0 +1,74 @@
+import threading
+
+from tracing import annotate
+
+class _Call:
+    """An in-flight computation that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is running wait for it and get the same result (or the same exception).
+    Nothing is cached once the call completes - pair it with a cache for that.
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) unless a call with the same key is in flight.
+
+        Args:
+            key (hashable): Identifies equivalent calls.
+            func (callable): The function to run.
+
+        Returns:
+            The result of the (possibly shared) call.
+
+        Raises:
+            Exception: Whatever the shared call raised.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            # Shows up on the waiting caller's span
+            annotate(coalesced=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """Return the number of keys currently being computed."""
+        with self._lock:
+            return len(self._calls)
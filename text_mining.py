@@ -0,0 +1,286 @@
+import re
+
+from text_sanitizer import sanitize_text
+
+# Sentence boundary: whitespace after terminal punctuation
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+# Sentences this short are never used as facts
+MIN_SENTENCE_LENGTH = 30
+
+def iter_sentence_spans(text):
+    """
+    Lazily yield the (start, end) span of each sentence in a text.
+
+    Splits exactly where re.split(SENTENCE_BOUNDARY, text) would, without
+    building the list of sentences.
+    """
+    start = 0
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        yield start, boundary.start()
+        start = boundary.end()
+    yield start, len(text)
+
+def _sentence_start(text, position, floor=0):
+    # In normalized text a boundary is terminal punctuation and a single space;
+    # searching back only to floor (the previous sentence's end) keeps a page linear
+    boundary = max(
+        text.rfind('. ', floor, position), text.rfind('! ', floor, position), text.rfind('? ', floor, position)
+    )
+    return boundary + 2 if boundary >= 0 else floor
+
+def _sentence_end(text, position):
+    boundary = SENTENCE_BOUNDARY.search(text, position)
+    return boundary.start() if boundary else len(text)
+
+def iter_sentences(text):
+    """Lazily yield the sentences of a text (see iter_sentence_spans)."""
+    for start, end in iter_sentence_spans(text):
+        yield text[start:end]
+
+class FactMiner:
+    """
+    Picks fact sentences about a query out of page texts.
+
+    The definition phrases ("<query> is", "<query> refers to", ...) and the
+    query keywords are compiled once per query into a single regex
+    alternation, which the re engine runs as one C-level pass over the
+    lowercased page. Sentences are then located around the matches only,
+    and streamed in page order, so sentences without a match are never
+    split out, sliced, lowercased or cleaned.
+    """
+
+    def __init__(self, query, keywords):
+        """
+        Args:
+            query (str): The search query.
+            keywords (list): Lowercased words a fact sentence must mention.
+        """
+        query = query.lower()
+        self.definition_patterns = [
+            f"{query} is",
+            f"{query} are",
+            f"{query} refers to",
+            f"definition of {query}",
+        ]
+        self.keywords = [keyword for keyword in keywords if keyword]
+        # Definition phrases come first so they win where they overlap a keyword
+        alternatives = self.definition_patterns + sorted(set(self.keywords), key=len, reverse=True)
+        self._pattern = re.compile('|'.join(re.escape(alternative) for alternative in alternatives))
+        # Keywords whose tail can be the head of a definition phrase ("panels" in
+        # "panelsolar panels is"): a match on them can hide a definition starting inside it
+        self._hiding = {
+            keyword for keyword in self.keywords
+            if any(
+                keyword.endswith(definition[:size])
+                for definition in self.definition_patterns
+                for size in range(1, min(len(keyword), len(definition) + 1))
+            )
+        }
+        self._definitions = set(self.definition_patterns)
+        self._keywords = set(self.keywords)
+
+    def classify(self, text):
+        """
+        Stream the sentences of a text with what they mention.
+
+        Args:
+            text (str): The text, whitespace-normalized (as sanitize_text returns it).
+
+        Yields:
+            tuple: (sentence, is_definition, has_keyword) for each sentence
+            longer than MIN_SENTENCE_LENGTH that matches anything.
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Lowercasing changed some characters' lengths, so positions in lowered
+            # don't line up with text; match sentence by sentence instead
+            for start, end in iter_sentence_spans(text):
+                if end - start > MIN_SENTENCE_LENGTH:
+                    sentence = text[start:end]
+                    lowered_sentence = sentence.lower()
+                    if self._pattern.search(lowered_sentence):
+                        is_definition, has_keyword = self._mentions(lowered_sentence, 0, len(lowered_sentence))
+                        yield sentence, is_definition, has_keyword
+            return
+
+        current = None
+        position = 0
+        while True:
+            match = self._pattern.search(lowered, position)
+            if match is None:
+                break
+            position, match_end = match.span()
+            if current is None or position >= current[1]:
+                if current is not None:
+                    yield from self._emit(text, current)
+                # Only sentences with a match are located, with C-level searches around it
+                # The previous sentence ended at its boundary's space, just after the punctuation
+                floor = current[1] - 1 if current is not None else 0
+                current = [_sentence_start(text, position, floor), _sentence_end(text, position), False, False]
+            if match_end > current[1]:
+                # A phrase running into the next sentence (the query has a period, as in
+                # "mr. smithson") hides whatever starts inside it: check the rest of this
+                # sentence directly and resume the scan at its end
+                is_definition, has_keyword = self._mentions(lowered, position, current[1])
+                current[2] = current[2] or is_definition
+                current[3] = current[3] or has_keyword
+                position = current[1]
+                continue
+            found = match.group()
+            if found in self._definitions:
+                current[2] = True
+            else:
+                current[3] = True
+                if found in self._hiding and not current[2]:
+                    current[2] = self._mentions(lowered, position + 1, current[1])[0]
+            position = match_end
+        if current is not None:
+            yield from self._emit(text, current)
+
+    def _emit(self, text, current):
+        start, end, is_definition, has_keyword = current
+        # A definition phrase contains the query, so the sentence names a keyword too
+        has_keyword = has_keyword or (is_definition and bool(self._keywords))
+        if (is_definition or has_keyword) and end - start > MIN_SENTENCE_LENGTH:
+            yield text[start:end], is_definition, has_keyword
+
+    def _mentions(self, lowered, start, end):
+        # Exact substring tests over lowered[start:end], as the old per-sentence code did
+        is_definition = any(lowered.find(pattern, start, end) >= 0 for pattern in self.definition_patterns)
+        has_keyword = any(lowered.find(keyword, start, end) >= 0 for keyword in self._keywords)
+        return is_definition, has_keyword
+
+    def extract(self, text, facts, num_facts=5):
+        """
+        Append definition-like sentences, then other sentences mentioning the
+        keywords, from a page's text to facts.
+
+        Produces the same facts, in the same order, as the previous two passes
+        over the page (definitions until there are 2 facts, then keyword
+        sentences until there are num_facts * 2), in one pass that stops
+        reading the page as soon as later sentences can no longer change the result.
+
+        Args:
+            text (str): Text extracted from the page.
+            facts (list): Facts collected so far; extended in place.
+            num_facts (int): Number of facts the caller will return.
+        """
+        limit = num_facts * 2
+        # Keyword sentences seen while definitions are still being collected;
+        # they go after the definitions, as in the old second pass
+        pending = []
+        definitions_open = True
+
+        for sentence, is_definition, has_keyword in self.classify(sanitize_text(text)):
+            if definitions_open and is_definition and _add_fact(facts, sentence):
+                if len(facts) >= 2:  # Get up to 2 definition sentences
+                    definitions_open = False
+                    for earlier in pending:
+                        if _add_fact(facts, earlier) and len(facts) >= limit:
+                            return
+                    pending = None
+            if has_keyword:
+                if definitions_open:
+                    pending.append(sentence)
+                elif _add_fact(facts, sentence) and len(facts) >= limit:
+                    return
+
+        for sentence in pending or ():
+            # Get more than we need so we can select the best
+            if _add_fact(facts, sentence) and len(facts) >= limit:
+                return
+
+def _add_fact(facts, sentence):
+    clean_sentence = sanitize_text(sentence)
+    if clean_sentence and clean_sentence not in facts:  # Avoid duplicates and empty strings
+        facts.append(clean_sentence)
+        return True
+    return False
+
+def _legacy_extract(text, query, facts, num_facts=5):
+    """The two-pass per-page extraction previously inlined in generate_facts_and_tips."""
+    text = sanitize_text(text)
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    keywords = [word.lower() for word in query.split() if len(word) > 3]
+    if not keywords:
+        keywords = [word.lower() for word in query.split()]
+    definition_patterns = [
+        f"{query.lower()} is",
+        f"{query.lower()} are",
+        f"{query.lower()} refers to",
+        f"definition of {query.lower()}"
+    ]
+    for sentence in sentences:
+        if len(sentence) > 30 and any(pattern in sentence.lower() for pattern in definition_patterns):
+            clean_sentence = sanitize_text(sentence)
+            if clean_sentence and clean_sentence not in facts:
+                facts.append(clean_sentence)
+                if len(facts) >= 2:
+                    break
+    for sentence in sentences:
+        if len(sentence) > 30 and any(keyword in sentence.lower() for keyword in keywords):
+            clean_sentence = sanitize_text(sentence)
+            if clean_sentence and clean_sentence not in facts:
+                facts.append(clean_sentence)
+                if len(facts) >= num_facts * 2:
+                    break
+
+def benchmark(sentences=400, repeats=20, query="solar panels"):
+    """
+    Compare the legacy two-pass extraction with FactMiner on a synthetic page.
+
+    Args:
+        sentences (int): Sentences in the page; about one in twenty mentions the query.
+        repeats (int): Timing repetitions.
+        query (str): The query to mine for.
+
+    Returns:
+        dict: Seconds per page for 'legacy' and 'miner', and whether both picked the same facts.
+    """
+    import timeit
+
+    filler = (
+        "The committee met on Tuesday to review the budget for the coming year in detail.",
+        "Several members raised questions about maintenance costs and the schedule.",
+        "Short one.",
+        "Residents were invited to comment on the proposal before the end of the month!",
+    )
+    parts = []
+    for i in range(sentences):
+        if i % 20 == 19:
+            parts.append(f"{query.capitalize()} are covered in section {i}, with figures on cost and output.")
+        else:
+            parts.append(filler[i % len(filler)])
+    page = ' '.join(parts)
+
+    keywords = [word.lower() for word in query.split() if len(word) > 3] or [word.lower() for word in query.split()]
+    miner = FactMiner(query, keywords)
+
+    def run_legacy():
+        facts = []
+        _legacy_extract(page, query, facts)
+        return facts
+
+    def run_miner():
+        facts = []
+        miner.extract(page, facts)
+        return facts
+
+    return {
+        'legacy': timeit.timeit(run_legacy, number=repeats) / repeats,
+        'miner': timeit.timeit(run_miner, number=repeats) / repeats,
+        'same_facts': run_legacy() == run_miner(),
+    }
+
+if __name__ == "__main__":
+    # The second query has a period, so its definition phrases run across sentence boundaries
+    for query in ("solar panels", "mr. smithson"):
+        print(f"{query}:")
+        for size in (50, 400, 2000):
+            timings = benchmark(sentences=size, query=query)
+            print(
+                f"{size:>5} sentences: legacy {timings['legacy'] * 1000:.3f} ms, "
+                f"miner {timings['miner'] * 1000:.3f} ms "
+                f"({timings['legacy'] / timings['miner']:.1f}x, same facts: {timings['same_facts']})"
+            )
@@ -0,0 +1,106 @@
+import html
+import re
+
+from cache import TTLCache
+
+# Complete HTML tags (the legacy second pattern, </?\w+.*?>, never matched anything this one leaves)
+TAG_PATTERN = re.compile(r'<[^>]*>')
+
+# Sanitized text per message id, shared by all sessions
+_memo = TTLCache(maxsize=5000, ttl=3600)
+
+def sanitize_text(text):
+    """
+    Turn scraped or generated text into clean plain text.
+
+    HTML tags are stripped, entities are decoded (so "AT&amp;T" becomes
+    "AT&T" rather than "ATT"), and whitespace runs, including decoded
+    non-breaking spaces, collapse to one space with the ends trimmed.
+    The result is plain text: escape it before embedding it in HTML.
+
+    Args:
+        text (str): The text to clean.
+
+    Returns:
+        str: The sanitized text.
+    """
+    if not text:
+        return ""
+
+    # Each step is a single C-level scan and is skipped when it can't apply,
+    # which is faster than a fused regex with a Python callback per match
+    if '<' in text:
+        text = TAG_PATTERN.sub('', text)
+    if '&' in text:
+        text = html.unescape(text)
+    # str.split() treats all Unicode whitespace (including decoded &nbsp;) as separators
+    return ' '.join(text.split())
+
+def sanitize_html(text):
+    """Sanitize text and escape it for embedding in HTML markup."""
+    return html.escape(sanitize_text(text), quote=False)
+
+def sanitize_message(message_id, text):
+    """
+    Sanitize a chat message, memoized by message id.
+
+    Args:
+        message_id (hashable): Stable id of the message (and field, if a message has several texts).
+        text (str): The message text.
+
+    Returns:
+        str: The sanitized plain text (see sanitize_text).
+    """
+    if message_id is None:
+        return sanitize_text(text)
+
+    cached = _memo.get(message_id)
+    # Guard against an id being reused for different text
+    if cached is not None and cached[0] == text:
+        return cached[1]
+
+    result = sanitize_text(text)
+    _memo.set(message_id, (text, result))
+    return result
+
+def _legacy_clean(text):
+    """The four-pass cleanup previously inlined in ui_components and content_generator."""
+    text = re.sub(r'<[^>]*>', '', text)
+    text = re.sub(r'</?\w+.*?>', '', text)
+    text = re.sub(r'&[a-z]+;', '', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def benchmark(paragraphs=200, repeats=20):
+    """
+    Compare the legacy four-pass cleanup with sanitize_text on long responses.
+
+    Args:
+        paragraphs (int): Paragraphs in the synthetic response.
+        repeats (int): Timing repetitions.
+
+    Returns:
+        dict: Seconds per call for 'legacy', 'sanitize_text' and 'sanitize_message' (memoized).
+    """
+    import timeit
+
+    paragraph = (
+        "<p>Photosynthesis is the process by which <b>green plants</b> &amp; algae convert "
+        "light&nbsp;energy into chemical energy.</p>\n\n   <span class=\"x\">6CO2 + 6H2O &rarr; C6H12O6</span> "
+    )
+    response = paragraph * paragraphs
+
+    sanitize_message("benchmark", response)
+    return {
+        'legacy': timeit.timeit(lambda: _legacy_clean(response), number=repeats) / repeats,
+        'sanitize_text': timeit.timeit(lambda: sanitize_text(response), number=repeats) / repeats,
+        'sanitize_message': timeit.timeit(lambda: sanitize_message("benchmark", response), number=repeats) / repeats,
+    }
+
+if __name__ == "__main__":
+    for size in (10, 200, 1000):
+        timings = benchmark(paragraphs=size)
+        print(
+            f"{size:>5} paragraphs: legacy {timings['legacy'] * 1000:.3f} ms, "
+            f"sanitize_text {timings['sanitize_text'] * 1000:.3f} ms, "
+            f"memoized {timings['sanitize_message'] * 1000:.4f} ms"
+        )
@@ -0,0 +1,284 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from profiler import join_profile
+
+# Set SCRAPEGPT_TRACING=0 to turn tracing off entirely
+TRACING_ENABLED = os.environ.get("SCRAPEGPT_TRACING", "1") == "1"
+
+# JSONL file finished traces are appended to, e.g. traces.jsonl (default: memory only)
+TRACE_FILE = os.environ.get("SCRAPEGPT_TRACE_FILE", "")
+
+# Size at which the trace file is rotated to TRACE_FILE + ".1" (one old file is kept)
+TRACE_FILE_MAX_BYTES = int(os.environ.get("SCRAPEGPT_TRACE_FILE_MAX_MB", 50)) * 1024 * 1024
+
+# Set SCRAPEGPT_DEBUG_PANEL=1 to show the tracing panel in the app sidebar
+DEBUG_PANEL = os.environ.get("SCRAPEGPT_DEBUG_PANEL", "0") == "1"
+
+# Finished traces kept in memory for the debug panel
+RECENT_TRACES = 20
+
+# Durations kept per stage for the percentiles
+STAGE_WINDOW = 500
+
+# Innermost open span of the current thread or task
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_lock = threading.Lock()
+# Held while writing the trace file, so readers of the recent traces never wait on disk
+_file_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_TRACES)
+_stage_durations = defaultdict(lambda: deque(maxlen=STAGE_WINDOW))
+
+class Span:
+    """
+    One timed stage of a trace, with attributes and child spans.
+
+    Attributes describe the work (url, host, bytes, status, retries, sleep,
+    cache hit/miss...); numeric ones such as retries and sleep accumulate
+    through add().
+    """
+
+    __slots__ = ('trace_id', 'name', 'attrs', 'children', 'start', 'end', 'error')
+
+    def __init__(self, trace_id, name, attrs):
+        self.trace_id = trace_id
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        """Seconds the span took (so far, if it is still open)."""
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attrs):
+        """Set attributes on the span."""
+        self.attrs.update(attrs)
+
+    def add(self, name, amount=1):
+        """Add to a numeric attribute (e.g. retries, sleep, bytes)."""
+        self.attrs[name] = self.attrs.get(name, 0) + amount
+
+    def to_dict(self):
+        """Return the span and its children as JSON-serializable dicts."""
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 2),
+            'attrs': self.attrs,
+            'error': self.error,
+            'children': [child.to_dict() for child in list(self.children)],
+        }
+
+class _NullSpan:
+    """Stands in for a span when tracing is off or there is no trace to attach to."""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, name, amount=1):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+@contextmanager
+def _run_span(span, parent):
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.end = time.time()
+        _current_span.reset(token)
+        with _lock:
+            _stage_durations[span.name].append(span.duration)
+        if parent is None:
+            _finish_trace(span)
+
+@contextmanager
+def trace(name, **attrs):
+    """
+    Start a trace (or, inside one, a child span) for a unit of work such as a chat turn.
+
+    Args:
+        name (str): Stage name of the root span.
+        **attrs: Initial attributes.
+
+    Yields:
+        Span: The root span (a no-op stand-in when tracing is off).
+    """
+    if not TRACING_ENABLED:
+        yield _NULL_SPAN
+        return
+
+    parent = _current_span.get()
+    trace_id = parent.trace_id if parent else uuid.uuid4().hex
+    new_span = Span(trace_id, name, attrs)
+    if parent is not None:
+        parent.children.append(new_span)
+    with _run_span(new_span, parent) as current:
+        yield current
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a stage as a child of the current span.
+
+    Outside of a trace this does nothing, so library code can be
+    instrumented unconditionally.
+
+    Args:
+        name (str): Stage name, e.g. 'http.get' or 'search.duckduckgo'.
+        **attrs: Initial attributes.
+
+    Yields:
+        Span: The span (a no-op stand-in outside of a trace).
+    """
+    parent = _current_span.get() if TRACING_ENABLED else None
+    if parent is None:
+        yield _NULL_SPAN
+        return
+
+    new_span = Span(parent.trace_id, name, attrs)
+    parent.children.append(new_span)
+    with _run_span(new_span, parent) as current:
+        yield current
+
+def traced(name):
+    """
+    Decorator that runs a function inside span(name).
+
+    Args:
+        name (str): Stage name.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_span():
+    """Return the innermost open span (a no-op stand-in outside of a trace)."""
+    return _current_span.get() or _NULL_SPAN
+
+def annotate(**attrs):
+    """Set attributes on the current span."""
+    current_span().set(**attrs)
+
+def traced_sleep(seconds):
+    """time.sleep that adds the time slept to the current span's 'sleep' attribute."""
+    time.sleep(seconds)
+    current_span().add('sleep', seconds)
+
+def wrap(func):
+    """
+    Bind a function to the current trace context, for running it on another thread.
+
+    The thread also joins the caller's profile, if one is being sampled.
+
+    Args:
+        func (callable): The function to hand to an executor or thread.
+
+    Returns:
+        callable: A function that runs func inside a copy of the caller's context.
+    """
+    context = contextvars.copy_context()
+
+    def run_joined(*args, **kwargs):
+        with join_profile():
+            return func(*args, **kwargs)
+
+    def run(*args, **kwargs):
+        return context.run(run_joined, *args, **kwargs)
+    return run
+
+def _finish_trace(root):
+    record = root.to_dict()
+    with _lock:
+        _recent.append(record)
+    if TRACE_FILE:
+        line = json.dumps(record, default=str) + '\n'
+        with _file_lock:
+            try:
+                with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                    size = f.tell()
+                if size >= TRACE_FILE_MAX_BYTES:
+                    os.replace(TRACE_FILE, TRACE_FILE + '.1')
+            except OSError as e:
+                print(f"Error writing trace: {e}")
+
+def recent_traces():
+    """
+    Get the most recently finished traces.
+
+    Returns:
+        list: Trace dicts (see Span.to_dict), newest first.
+    """
+    with _lock:
+        return list(reversed(_recent))
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def stage_stats():
+    """
+    Get latency percentiles per stage over the recent spans.
+
+    Returns:
+        dict: stage name -> {'count', 'p50_ms', 'p95_ms'}, slowest p95 first.
+    """
+    with _lock:
+        durations = {name: sorted(values) for name, values in _stage_durations.items() if values}
+
+    stats = {
+        name: {
+            'count': len(values),
+            'p50_ms': round(_percentile(values, 0.50) * 1000, 1),
+            'p95_ms': round(_percentile(values, 0.95) * 1000, 1),
+        }
+        for name, values in durations.items()
+    }
+    return dict(sorted(stats.items(), key=lambda item: item[1]['p95_ms'], reverse=True))
+
+def format_trace(record, indent=0):
+    """
+    Render a trace dict as an indented text tree.
+
+    Args:
+        record (dict): A trace (see recent_traces).
+        indent (int): Starting depth.
+
+    Returns:
+        str: One line per span with its duration and attributes.
+    """
+    attrs = ' '.join(f"{key}={value}" for key, value in record['attrs'].items())
+    line = f"{'  ' * indent}{record['name']} {record['duration_ms']:.0f}ms {attrs}".rstrip()
+    if record.get('error'):
+        line += f" !{record['error']}"
+    lines = [line]
+    for child in record['children']:
+        lines.append(format_trace(child, indent + 1))
+    return '\n'.join(lines)
@@ -1,6 +1,50 @@
 import streamlit as st
+from collections import OrderedDict
+from html import escape
+from text_sanitizer import sanitize_text, sanitize_html, sanitize_message
+from session_store import content_length, SpilledContent, EXPIRED_TEXT
 
-def render_chat_message(message, is_user=False, avatar_url=None, time=None):
+# Number of most recent assistant messages whose videos and images are rendered
+MEDIA_WINDOW = 2
+
+# Number of most recent turns (question + answer) rendered in full
+TURN_WINDOW = 5
+
+# HTML fragments kept per session (a turn renders up to three); least recently used ones are dropped
+FRAGMENT_CACHE_SIZE = 8 * TURN_WINDOW
+
+def get_cached_fragment(cache_key, build):
+    """
+    Return an HTML fragment from the session's fragment cache, building it on a miss.
+    
+    The cache is a small LRU (FRAGMENT_CACHE_SIZE entries), so fragments of
+    turns that scrolled out of the rendered window don't pile up in memory.
+    
+    Args:
+        cache_key (hashable): Identifies the fragment (e.g. message id and section), or None to skip caching.
+        build (callable): Builds the fragment when it isn't cached.
+        
+    Returns:
+        str: The HTML fragment.
+    """
+    if cache_key is None:
+        return build()
+    
+    if "fragment_cache" not in st.session_state:
+        st.session_state.fragment_cache = OrderedDict()
+    cache = st.session_state.fragment_cache
+    
+    fragment = cache.get(cache_key)
+    if fragment is None:
+        fragment = build()
+        cache[cache_key] = fragment
+        while len(cache) > FRAGMENT_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(cache_key)
+    return fragment
+
+def render_chat_message(message, is_user=False, avatar_url=None, time=None, cache_key=None):
     """
     Render a chat message in the UI.
     
@@ -9,6 +53,7 @@ def render_chat_message(message, is_user=False, avatar_url=None, time=None):
         is_user (bool): True if the message is from the user, False if from the assistant.
         avatar_url (str): URL to the avatar image.
         time (str): Time the message was sent.
+        cache_key (hashable): Message id under which the sanitized text is memoized (default: no memoization).
     """
     # Calculate column widths for layout
     avatar_col_width = 1
@@ -27,17 +72,8 @@ def render_chat_message(message, is_user=False, avatar_url=None, time=None):
         bg_color = "#3b4453"
         border_radius = "0px 15px 15px 15px"
     
-    # Clean message of any unexpected HTML
-    import re
-    # More comprehensive HTML tag cleaning
-    # First remove complete HTML tags
-    message = re.sub(r'<[^>]*>', '', message)
-    # Then remove any leftover partial HTML tags
-    message = re.sub(r'</?\w+.*?>', '', message)
-    # Clean any HTML entities
-    message = re.sub(r'&[a-z]+;', '', message)
-    # Normalize whitespace
-    message = re.sub(r'\s+', ' ', message).strip()
+    # Clean message of any unexpected HTML (memoized per message id) and escape it for the markup below
+    message = escape(sanitize_message(cache_key, message), quote=False)
     
     # Render the message
     if is_user:
@@ -83,12 +119,49 @@ def render_chat_message(message, is_user=False, avatar_url=None, time=None):
             if time:
                 st.markdown(f"<div style='color: #7f8694; font-size: 0.8em; text-align: center; padding-top: 10px;'>{time}</div>", unsafe_allow_html=True)
 
-def render_search_results(results):
+def build_search_results_html(results):
+    """
+    Build the HTML for a list of search result cards.
+    
+    Args:
+        results (list): List of SearchResult records.
+        
+    Returns:
+        str: The cards as one HTML fragment.
+    """
+    cards = []
+    for result in results:
+        # Clean all text fields of HTML tags and escape them for the card markup
+        title = sanitize_html(result.get('title', 'No title'))
+        url = escape(result.get('url', '#'))
+        description = sanitize_html(result.get('description', 'No description available'))
+        
+        # Create card-like container for each result
+        cards.append(
+            f"""
+            <div style="
+                background-color: #2b313e;
+                border-radius: 10px;
+                padding: 15px;
+                margin-bottom: 10px;
+            ">
+                <a href="{url}" style="color: #4287f5; text-decoration: none; font-weight: bold; font-size: 1.1em;" target="_blank">
+                    {title}
+                </a>
+                <p style="color: #7f8694; font-size: 0.8em; margin: 5px 0;">{url}</p>
+                <p style="margin-top: 10px;">{description}</p>
+            </div>
+            """
+        )
+    return "".join(cards)
+
+def render_search_results(results, cache_key=None):
     """
     Render search results in the UI.
     
     Args:
-        results (list): List of dictionaries containing search results.
+        results (list): List of SearchResult records.
+        cache_key (hashable): Key under which the built HTML is cached (default: no caching).
     """
     if not results:
         st.info("No search results found.")
@@ -96,58 +169,28 @@ def render_search_results(results):
     
     with st.container():
         st.markdown("### 🔍 Search Results")
-        
-        for result in results:
-            # Clean all text fields of HTML tags
-            import re
-            
-            # Clean title
-            title = result.get('title', 'No title')
-            title = re.sub(r'<[^>]*>', '', title)
-            title = re.sub(r'</?\w+.*?>', '', title)
-            title = re.sub(r'&[a-z]+;', '', title)
-            title = re.sub(r'\s+', ' ', title).strip()
-            
-            # Clean URL
-            url = result.get('url', '#')
-            
-            # Clean description
-            description = result.get('description', 'No description available')
-            description = re.sub(r'<[^>]*>', '', description)
-            description = re.sub(r'</?\w+.*?>', '', description)
-            description = re.sub(r'&[a-z]+;', '', description)
-            description = re.sub(r'\s+', ' ', description).strip()
-            
-            # Create card-like container for each result
-            with st.container():
-                st.markdown(
-                    f"""
-                    <div style="
-                        background-color: #2b313e;
-                        border-radius: 10px;
-                        padding: 15px;
-                        margin-bottom: 10px;
-                    ">
-                        <a href="{url}" style="color: #4287f5; text-decoration: none; font-weight: bold; font-size: 1.1em;" target="_blank">
-                            {title}
-                        </a>
-                        <p style="color: #7f8694; font-size: 0.8em; margin: 5px 0;">{url}</p>
-                        <p style="margin-top: 10px;">{description}</p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+        st.markdown(
+            get_cached_fragment(cache_key, lambda: build_search_results_html(results)),
+            unsafe_allow_html=True
+        )
 
-def render_videos_section(videos):
+def render_videos_section(videos, lazy=True, key_prefix="videos"):
     """
     Render video results in the UI.
     
     Args:
-        videos (list): List of dictionaries containing video information.
+        videos (list): List of Video records.
+        lazy (bool): Show lazily loaded thumbnails and only create a video's
+            player iframe once the user asks to play it.
+        key_prefix (str): Prefix for widget keys, unique per message.
     """
     if not videos:
         return
     
+    # Videos whose player the user has opened, kept across reruns
+    if "open_videos" not in st.session_state:
+        st.session_state.open_videos = set()
+    
     with st.container():
         st.markdown("### 📹 Videos")
         
@@ -155,18 +198,14 @@ def render_videos_section(videos):
         cols = st.columns(min(len(videos), 3))
         
         for i, video in enumerate(videos):
-            # Clean HTML tags from video title
-            import re
-            title = video.get('title', 'Video')
-            title = re.sub(r'<[^>]*>', '', title)
-            title = re.sub(r'</?\w+.*?>', '', title)
-            title = re.sub(r'&[a-z]+;', '', title)
-            title = re.sub(r'\s+', ' ', title).strip()
+            # Clean HTML tags from video title (expander labels are plain text)
+            title = sanitize_text(video.get('title', 'Video')) or 'Video'
             
             # Get other video properties
             url = video.get('url', '#')
             thumbnail = video.get('thumbnail', '')
             embed_url = video.get('embed_url', '')
+            player_key = f"{key_prefix}_{i}_{video.get('id', '')}"
             
             with cols[i % len(cols)]:
                 # Create expandable section for each video
@@ -175,34 +214,47 @@ def render_videos_section(videos):
                     if thumbnail:
                         st.markdown(
                             f"""
-                            <a href="{url}" target="_blank">
-                                <img src="{thumbnail}" style="width: 100%; border-radius: 5px;">
+                            <a href="{escape(url)}" target="_blank">
+                                <img src="{escape(thumbnail)}" loading="lazy" decoding="async"
+                                     width="480" height="360"
+                                     style="width: 100%; height: auto; aspect-ratio: 4 / 3; object-fit: cover;
+                                            background-color: #2b313e; border-radius: 5px;">
                             </a>
                             """,
                             unsafe_allow_html=True
                         )
                     
-                    # Show embedded player if available
-                    if embed_url:
-                        try:
-                            st.components.v1.iframe(
-                                src=embed_url,
-                                height=200,
-                                scrolling=False
-                            )
-                        except Exception as e:
-                            st.error(f"Failed to load video player: {e}")
-                            # Provide a direct link as fallback
-                            st.markdown(f"[Watch on YouTube]({url})")
-                    else:
+                    if not embed_url:
+                        st.markdown(f"[Watch on YouTube]({url})")
+                        continue
+                    
+                    # Defer creating the player until the user opens it
+                    if lazy and player_key not in st.session_state.open_videos:
+                        if st.button("▶ Play here", key=f"play_{player_key}"):
+                            st.session_state.open_videos.add(player_key)
+                        else:
+                            continue
+                    
+                    # Show embedded player
+                    try:
+                        st.components.v1.iframe(
+                            src=embed_url,
+                            height=200,
+                            scrolling=False
+                        )
+                    except Exception as e:
+                        st.error(f"Failed to load video player: {e}")
+                        # Provide a direct link as fallback
                         st.markdown(f"[Watch on YouTube]({url})")
 
-def render_images_section(images):
+def render_images_section(images, lazy=True):
     """
     Render image results in the UI.
     
     Args:
         images (list): List of image URLs.
+        lazy (bool): Emit a single grid of lazily loaded thumbnails with fixed
+            placeholder dimensions instead of one st.image element per image.
     """
     if not images:
         return
@@ -210,6 +262,19 @@ def render_images_section(images):
     with st.container():
         st.markdown("### 🖼️ Images")
         
+        if lazy:
+            # The browser only downloads images as they scroll into view, and the
+            # fixed aspect ratio keeps the layout from jumping while they load
+            tiles = "".join(
+                f"""<a href="{escape(img_url)}" target="_blank"><img src="{escape(img_url)}" loading="lazy" decoding="async" width="320" height="240" style="width: 100%; height: auto; aspect-ratio: 4 / 3; object-fit: cover; background-color: #2b313e; border-radius: 5px;"></a>"""
+                for img_url in images
+            )
+            st.markdown(
+                f"""<div style="display: grid; grid-template-columns: repeat({min(3, len(images))}, 1fr); gap: 8px;">{tiles}</div>""",
+                unsafe_allow_html=True
+            )
+            return
+        
         # Calculate number of columns based on number of images
         num_cols = min(3, len(images))
         cols = st.columns(num_cols)
@@ -221,3 +286,171 @@ def render_images_section(images):
                     st.image(img_url, use_container_width=True)
                 except Exception as e:
                     st.error(f"Failed to load image: {e}")
+
+def render_media_placeholder(videos, images):
+    """
+    Render a one-line summary in place of the media of an older message.
+    
+    Args:
+        videos (list): The message's videos.
+        images (list): The message's images.
+    """
+    parts = []
+    if videos:
+        parts.append(f"📹 {len(videos)} videos")
+    if images:
+        parts.append(f"🖼️ {len(images)} images")
+    if parts:
+        st.caption(" · ".join(parts) + " (shown for recent messages only)")
+
+def group_turns(messages):
+    """
+    Group chat messages into turns, each starting with a user message.
+    
+    Args:
+        messages (list): The chat messages.
+        
+    Returns:
+        list: Lists of (index, message) pairs, one list per turn.
+    """
+    turns = []
+    for index, message in enumerate(messages):
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append((index, message))
+    return turns
+
+def get_message_id(index, message):
+    """Return a message's id, falling back to its position for messages stored without one."""
+    return message.get("id") or f"idx{index}"
+
+def render_message(index, message, user_avatar, assistant_avatar, show_media):
+    """
+    Render one chat message in full, including an answer's results and media.
+    
+    Args:
+        index (int): Position of the message in the chat.
+        message (dict): The message.
+        user_avatar (str): Avatar URL for user messages.
+        assistant_avatar (str): Avatar URL for assistant messages.
+        show_media (bool): Render videos and images (otherwise a one-line summary).
+    """
+    message_id = get_message_id(index, message)
+    
+    if message["role"] == "user":
+        render_chat_message(
+            message["content"],
+            is_user=True,
+            avatar_url=user_avatar,
+            time=message.get("time", ""),
+            cache_key=(message_id, "text")
+        )
+        return
+    
+    content = message["content"]
+    if isinstance(content, SpilledContent):
+        # One load for all the fields below
+        content = content.load()
+    render_chat_message(
+        content.get("text") or EXPIRED_TEXT,
+        is_user=False,
+        avatar_url=assistant_avatar,
+        time=message.get("time", ""),
+        cache_key=(message_id, "text")
+    )
+    
+    # Display search results if any
+    if "search_results" in content:
+        render_search_results(content["search_results"], cache_key=(message_id, "search_results"))
+    
+    if show_media:
+        # Display videos if any
+        if "videos" in content:
+            render_videos_section(content["videos"], key_prefix=message_id)
+        
+        # Display images if any
+        if "images" in content:
+            render_images_section(content["images"])
+    else:
+        render_media_placeholder(content.get("videos"), content.get("images"))
+
+def summarize_turn(turn):
+    """
+    Build a one-line summary of a turn for the collapsed view.
+    
+    Args:
+        turn (list): (index, message) pairs of the turn.
+        
+    Returns:
+        str: The summary.
+    """
+    from utils import truncate_text
+    
+    question = next((m["content"] for _, m in turn if m["role"] == "user"), "")
+    answer = next((m["content"] for _, m in turn if m["role"] == "assistant"), None)
+    
+    summary = f"**{truncate_text(question, 80)}**"
+    if answer:
+        counts = []
+        for label, field in (("links", "search_results"), ("videos", "videos"), ("images", "images")):
+            # Counted without loading answers that were spilled to disk
+            count = content_length(answer, field)
+            if count:
+                counts.append(f"{count} {label}")
+        if counts:
+            summary += " — " + ", ".join(counts)
+    else:
+        summary += " — waiting for an answer"
+    return summary
+
+def render_chat_history(messages, user_avatar, assistant_avatar, turn_window=TURN_WINDOW, media_window=MEDIA_WINDOW):
+    """
+    Render the chat with only the most recent turns in full.
+    
+    Older turns are collapsed into one-line summaries and rendered in full
+    only after the user expands them, so render cost stays flat as the
+    conversation grows. Cleaned message text and search result HTML are
+    cached per message id, so unchanged messages aren't rebuilt on reruns.
+    
+    Args:
+        messages (list): The chat messages.
+        user_avatar (str): Avatar URL for user messages.
+        assistant_avatar (str): Avatar URL for assistant messages.
+        turn_window (int): Number of recent turns rendered in full.
+        media_window (int): Number of recent assistant messages whose media is rendered.
+    """
+    # Turns the user has expanded, kept across reruns
+    if "expanded_turns" not in st.session_state:
+        st.session_state.expanded_turns = set()
+    
+    # Only the most recent assistant messages render their media
+    assistant_indices = [i for i, m in enumerate(messages) if m["role"] == "assistant"]
+    if media_window:
+        media_start = assistant_indices[-media_window] if len(assistant_indices) >= media_window else 0
+    else:
+        media_start = len(messages)
+    
+    turns = group_turns(messages)
+    first_full_turn = max(0, len(turns) - turn_window)
+    
+    for turn_number, turn in enumerate(turns):
+        turn_id = get_message_id(*turn[0])
+        
+        if turn_number < first_full_turn and turn_id not in st.session_state.expanded_turns:
+            # Collapsed: a summary line and a button to expand it
+            cols = st.columns([10, 2])
+            with cols[0]:
+                st.markdown(summarize_turn(turn))
+            with cols[1]:
+                if st.button("Expand", key=f"expand_{turn_id}"):
+                    st.session_state.expanded_turns.add(turn_id)
+                    st.rerun()
+            continue
+        
+        if turn_id in st.session_state.expanded_turns:
+            if st.button("Collapse", key=f"collapse_{turn_id}"):
+                st.session_state.expanded_turns.discard(turn_id)
+                st.rerun()
+        
+        for index, message in turn:
+            render_message(index, message, user_avatar, assistant_avatar, show_media=index >= media_start)
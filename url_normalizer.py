@@ -0,0 +1,171 @@
+import base64
+import binascii
+import hashlib
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote, unquote
+
+# Query parameters that only carry tracking information and never change the page content
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'ref_src', 'ref_url',
+    'spm', 'vero_id', 'oly_anon_id', 'oly_enc_id', 'rb_clickid', 's_cid', 'srsltid'
+}
+
+# Prefixes of tracking parameter families (utm_source, utm_medium, ...)
+TRACKING_PREFIXES = ('utm_', 'pk_', 'mtm_', 'hsa_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Characters that never need percent-encoding (RFC 3986 "unreserved")
+UNRESERVED = set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+
+# Characters that can stay literal in a path
+PATH_SAFE = "/:@!$&'()*+,;=-._~%"
+
+PERCENT_ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+
+# Redirect wrappers used by the search engines we scrape: host suffix -> (path prefix, target parameter)
+REDIRECT_WRAPPERS = [
+    ('duckduckgo.com', '/l/', 'uddg'),
+    ('google.com', '/url', 'q'),
+    ('google.com', '/url', 'url'),
+    ('youtube.com', '/redirect', 'q'),
+]
+
+def _normalize_escape(match):
+    """Decode escapes of unreserved characters and uppercase all others."""
+    char = chr(int(match.group(1), 16))
+    if char in UNRESERVED:
+        return char
+    return '%' + match.group(1).upper()
+
+def _normalize_percent_encoding(component, safe):
+    """Give a URL component one canonical percent-encoded form."""
+    # Encode characters that should have been escaped (spaces, non-ASCII, ...)
+    component = quote(component, safe=safe)
+    # Decode needlessly escaped characters and uppercase the remaining escapes
+    return PERCENT_ESCAPE.sub(_normalize_escape, component)
+
+def _is_tracking_param(name):
+    """Check if a query parameter is a known tracking parameter."""
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def unwrap_redirect(url):
+    """
+    Extract the target URL from a search engine redirect link.
+
+    Handles DuckDuckGo (/l/?uddg=...), Google (/url?q=...), YouTube
+    (/redirect?q=...) and Bing (/ck/a?u=a1...) wrappers, including relative
+    and protocol-relative forms.
+
+    Args:
+        url (str): The possibly wrapped URL.
+
+    Returns:
+        str: The decoded target URL, or the input unchanged if it isn't a redirect.
+    """
+    if not url:
+        return url
+
+    # Protocol-relative links (//duckduckgo.com/l/?uddg=...) are treated as https
+    if url.startswith('//'):
+        url = 'https:' + url
+
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    params = dict(parse_qsl(parts.query, keep_blank_values=True))
+
+    # Bing click-tracking links carry the target base64-encoded as u=a1<base64url>
+    if (host == 'bing.com' or host.endswith('.bing.com')) and parts.path.startswith('/ck/'):
+        encoded = params.get('u', '')
+        if encoded.startswith('a1'):
+            encoded = encoded[2:]
+            try:
+                target = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode('utf-8')
+                if target.startswith(('http://', 'https://')):
+                    return target
+            except (binascii.Error, UnicodeDecodeError):
+                pass
+
+    for host_suffix, path_prefix, param in REDIRECT_WRAPPERS:
+        # Relative redirect links have no host at all
+        host_matches = not host or host == host_suffix or host.endswith('.' + host_suffix)
+        if host_matches and parts.path.startswith(path_prefix) and params.get(param):
+            target = params[param]
+            # parse_qsl already decoded one level; some targets are encoded twice
+            if target.lower().startswith(('http%3a', 'https%3a')):
+                target = unquote(target)
+            # Wrappers can be nested (e.g. a Google redirect inside a DuckDuckGo one)
+            return unwrap_redirect(target)
+
+    return url
+
+def canonicalize_url(url):
+    """
+    Produce the canonical form of a URL so equivalent links compare equal.
+
+    Redirect wrappers are decoded, scheme and host are lowercased, default
+    ports are dropped, percent-encoding is normalized, tracking parameters are
+    removed, the remaining query parameters are sorted and the fragment is dropped.
+
+    Args:
+        url (str): The URL to canonicalize.
+
+    Returns:
+        str: The canonical URL. Non-HTTP URLs (and placeholders like '#') are returned unchanged.
+    """
+    if not url:
+        return url
+
+    url = unwrap_redirect(url.strip())
+
+    try:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.hostname:
+            return url
+
+        host = parts.hostname.lower().rstrip('.')
+        port = parts.port
+    except ValueError:
+        # Malformed netloc or port
+        return url
+
+    netloc = host
+    if ':' in host:
+        # IPv6 literal
+        netloc = f'[{host}]'
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f'{netloc}:{port}'
+
+    path = _normalize_percent_encoding(parts.path or '/', PATH_SAFE)
+
+    # Drop tracking parameters and sort the rest for a stable order
+    query_params = [
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    ]
+    query = urlencode(sorted(query_params), quote_via=quote, safe='-._~')
+
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+def url_key(url):
+    """
+    Get a stable cache/dedup key for a URL.
+
+    Two URLs that only differ in redirect wrapping, encoding, tracking
+    parameters, host case, default port or http/https share the same key.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: A hex digest identifying the canonical URL.
+    """
+    canonical = canonicalize_url(url) or ''
+    # http and https almost always serve the same document
+    if canonical.startswith('http://'):
+        canonical = 'https://' + canonical[len('http://'):]
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
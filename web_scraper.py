@@ -1,9 +1,18 @@
 import requests
 from bs4 import BeautifulSoup
 import html2text
-import re
 import random
-import time
+from url_normalizer import unwrap_redirect, url_key
+from records import SearchResult
+from cache import TTLCache
+from single_flight import SingleFlight
+from http_client import http_get, UnsupportedContentTypeError
+from page_extractor import stream_extract
+from extraction_pool import run_in_pool
+from circuit_breaker import get_breaker, looks_blocked, is_upstream_failure
+from tracing import traced, traced_sleep, current_span, annotate
+from metrics import blocks, fallbacks, watch_cache
+from page_index import index_page
 
 # List of user agents to rotate and avoid being blocked
 USER_AGENTS = [
@@ -14,19 +23,134 @@ USER_AGENTS = [
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 11_5_1) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Safari/605.1.15'
 ]
 
+# Extracted page text shared by all sessions, keyed by canonical URL
+page_text_cache = TTLCache(maxsize=2000, ttl=6 * 3600)
+watch_cache('page_text', page_text_cache)
+
+# Concurrent requests for the same page or query share one download
+page_flight = SingleFlight("page")
+search_flight = SingleFlight("search")
+
 def get_random_user_agent():
     """Return a random user agent from the list."""
     return random.choice(USER_AGENTS)
 
-def clean_text(text):
-    """Clean scraped text by removing extra whitespace and normalizing."""
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text)
-    # Remove leading/trailing whitespace
-    text = text.strip()
-    return text
+def get_fallback_search_results(query):
+    """
+    Build static search links for a query, used when no engine returned results.
+    
+    Args:
+        query (str): The search query.
+        
+    Returns:
+        list: List of SearchResult records (title, description, and URL).
+    """
+    formatted_query = query.replace(' ', '+')
+    return [
+        SearchResult(
+            f"Search for '{query}'",
+            f"Search the web for information about '{query}' using your favorite search engine.",
+            f"https://www.google.com/search?q={formatted_query}"
+        ),
+        SearchResult(
+            f"Wikipedia - {query}",
+            f"Find information about '{query}' on Wikipedia, the free encyclopedia.",
+            f"https://en.wikipedia.org/wiki/Special:Search?search={formatted_query}"
+        ),
+        SearchResult(
+            f"YouTube - {query}",
+            f"Watch videos related to '{query}' on YouTube.",
+            f"https://www.youtube.com/results?search_query={formatted_query}"
+        )
+    ]
+
+def parse_duckduckgo_page(html):
+    """
+    Parse one DuckDuckGo HTML results page.
+    Runs in the extraction pool, so it takes raw bytes and returns plain tuples.
+    
+    Args:
+        html (bytes): The results page body.
+        
+    Returns:
+        tuple: (entries, next_action, blocked) where entries is a list of
+        (title, description, canonical URL) tuples, next_action is the
+        "More Results" form action (or None) and blocked is True if the
+        page looks like a captcha/block page.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Try different selectors for search results
+    search_results = soup.find_all('div', class_='result')
+    
+    # If the primary selector doesn't work, try alternative selectors
+    if not search_results:
+        # Try alternative class for results
+        search_results = soup.find_all('div', class_='result__body')
+    
+    if not search_results:
+        # Try another alternative structure
+        search_results = soup.find_all('div', class_='links_main')
+    
+    if not search_results:
+        # As a last resort, get all article tags
+        search_results = soup.find_all('article')
+    
+    # If we still have no results, check if we're being blocked
+    if not search_results:
+        text = html.decode('utf-8', errors='replace')
+        if looks_blocked(text) or 'blocked' in text.lower():
+            return [], None, True
+    
+    entries = []
+    for result in search_results:
+        # Try different selectors for title and description
+        title_elem = result.find('a', class_='result__a')
+        if not title_elem:
+            title_elem = result.find('a', class_='result-link')
+        if not title_elem:
+            title_elem = result.find('h2').find('a') if result.find('h2') else None
+            
+        description_elem = result.find('a', class_='result__snippet')
+        if not description_elem:
+            description_elem = result.find('div', class_='result__snippet')
+        if not description_elem:
+            description_elem = result.find('p')
+        
+        if title_elem:
+            title = title_elem.text.strip()
+            try:
+                url = title_elem.get('href')
+            except:
+                # If we can't get href directly, look for other url patterns
+                url_elem = result.find('a', href=True)
+                url = url_elem.get('href') if url_elem else '#'
+            
+            # Extract description, falling back to a default if necessary
+            description = description_elem.text.strip() if description_elem else "No description available."
+            
+            # Decode the real URL from the DuckDuckGo redirect; it is shown and
+            # fetched as is, and only its url_key is canonical (for dedup and caching)
+            url = unwrap_redirect(url)
+            
+            # Check if the result is valid
+            if title and url and url != '#':
+                entries.append((title, description, url))
+    
+    # Try to find the "More Results" button for the next page
+    next_action = None
+    more_button = soup.find('input', {'class': 'btn', 'value': 'More Results'})
+    if more_button:
+        form = more_button.find_parent('form')
+        if form:
+            action = form.get('action')
+            if action and isinstance(action, str):
+                next_action = action
+    
+    return entries, next_action, False
 
-def get_duckduckgo_results(query, max_results=500):
+@traced('search.duckduckgo')
+def get_duckduckgo_results(query, max_results=500, use_fallback=True):
     """
     Scrape DuckDuckGo search results for a given query.
     Increased maximum results to 500 for more comprehensive search.
@@ -35,11 +159,14 @@ def get_duckduckgo_results(query, max_results=500):
     Args:
         query (str): The search query.
         max_results (int): Maximum number of results to return (up to 500).
+        use_fallback (bool): Return static fallback links when nothing was scraped.
         
     Returns:
-        list: List of dictionaries containing title, description, and URL.
+        list: List of SearchResult records (title, description, and URL).
     """
     results = []
+    # Canonical keys of the URLs already collected, for deduplication
+    seen_keys = set()
     # Initialize pages counter to track pages fetched
     pages_fetched = 0
     
@@ -63,89 +190,55 @@ def get_duckduckgo_results(query, max_results=500):
         'Sec-Fetch-User': '?1',
     }
     
+    # Shared across sessions so a blocked DuckDuckGo fails fast for everyone
+    breaker = get_breaker('duckduckgo')
+    
     try:
         # Keep track of pages we've fetched
         max_pages = 5  # Lower safety limit to prevent too many requests
+        # Failed requests tolerated before giving up, so a block fails fast
+        max_attempts = 2
+        failed_attempts = 0
         current_url = url
         
         # Continue fetching pages until we reach max results or max pages
         while len(results) < max_results and pages_fetched < max_pages:
+            # Skip DuckDuckGo entirely while its circuit is open
+            if not breaker.allow_request():
+                print("DuckDuckGo circuit is open. Skipping request.")
+                break
+            
             # Fetch current page with a longer timeout
             try:
-                response = requests.get(current_url, headers=headers, timeout=15)
+                response = http_get(current_url, headers=headers, timeout=15)
                 response.raise_for_status()
                 
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Try different selectors for search results
-                search_results = soup.find_all('div', class_='result')
+                # Parse the page in the extraction pool (BeautifulSoup is CPU-bound)
+                entries, next_action, blocked = run_in_pool(parse_duckduckgo_page, response.content)
                 
-                # If the primary selector doesn't work, try alternative selectors
-                if not search_results:
-                    # Try alternative class for results
-                    search_results = soup.find_all('div', class_='result__body')
-                
-                if not search_results:
-                    # Try another alternative structure
-                    search_results = soup.find_all('div', class_='links_main')
+                # If we have no results, check if we're being blocked
+                if blocked:
+                    print("DuckDuckGo may be blocking our requests. Adding fallback results.")
+                    blocks.labels('duckduckgo').inc()
+                    breaker.record_failure('captcha')
+                    break
                 
-                if not search_results:
-                    # As a last resort, get all article tags
-                    search_results = soup.find_all('article')
-                
-                # If we still have no results, check if we're being blocked
-                if not search_results:
-                    if 'captcha' in response.text.lower() or 'blocked' in response.text.lower():
-                        print("DuckDuckGo may be blocking our requests. Adding fallback results.")
-                        break
+                breaker.record_success()
                 
                 # Track if we found any new results on this page
                 new_results_found = False
                 
                 # Process all results on the page
-                for result in search_results:
+                for title, description, url in entries:
                     if len(results) >= max_results:
                         break
                     
-                    # Try different selectors for title and description
-                    title_elem = result.find('a', class_='result__a')
-                    if not title_elem:
-                        title_elem = result.find('a', class_='result-link')
-                    if not title_elem:
-                        title_elem = result.find('h2').find('a') if result.find('h2') else None
-                        
-                    description_elem = result.find('a', class_='result__snippet')
-                    if not description_elem:
-                        description_elem = result.find('div', class_='result__snippet')
-                    if not description_elem:
-                        description_elem = result.find('p')
-                    
-                    if title_elem:
-                        title = title_elem.text.strip()
-                        try:
-                            url = title_elem.get('href')
-                        except:
-                            # If we can't get href directly, look for other url patterns
-                            url_elem = result.find('a', href=True)
-                            url = url_elem.get('href') if url_elem else '#'
-                        
-                        # Extract description, falling back to a default if necessary
-                        description = description_elem.text.strip() if description_elem else "No description available."
-                        
-                        # Get real URL from DuckDuckGo redirect
-                        if url and url.startswith('/'):
-                            url_parts = url.split('uddg=')
-                            if len(url_parts) > 1:
-                                url = url_parts[1].split('&')[0]
-                        
-                        # Check if the result is valid and not a duplicate
-                        if title and url and url != '#' and not any(r['url'] == url for r in results):
-                            results.append({
-                                'title': title,
-                                'description': description,
-                                'url': url
-                            })
-                            new_results_found = True
+                    # Check if the result is not a duplicate
+                    key = url_key(url)
+                    if key not in seen_keys:
+                        seen_keys.add(key)
+                        results.append(SearchResult(title, description, url))
+                        new_results_found = True
                 
                 # Increment page counter
                 pages_fetched += 1
@@ -154,70 +247,141 @@ def get_duckduckgo_results(query, max_results=500):
                 if len(results) >= max_results or not new_results_found:
                     break
                     
-                # Try to find the "More Results" button for the next page
-                more_button = soup.find('input', {'class': 'btn', 'value': 'More Results'})
-                if more_button:
-                    form = more_button.find_parent('form')
-                    if form:
-                        # Get the form data
-                        action = form.get('action')
-                        if action and isinstance(action, str):
-                            current_url = 'https://html.duckduckgo.com/html/' + action
-                            
-                            # Small delay to avoid rate limiting
-                            time.sleep(2)  # Increased delay
-                        else:
-                            # If no action attribute, we can't continue
-                            break
-                    else:
-                        # If no form, we can't continue
-                        break
+                # Follow the "More Results" form to the next page
+                if next_action:
+                    current_url = 'https://html.duckduckgo.com/html/' + next_action
+                    
+                    # Small delay to avoid rate limiting
+                    traced_sleep(2)  # Increased delay
                 else:
                     # If no more button, we can't continue
                     break
             
             except requests.exceptions.RequestException as e:
                 print(f"Request error while scraping DuckDuckGo: {e}")
-                # Add longer delay before retrying
-                time.sleep(3)
-                # If we've had multiple failures, break the loop
-                if pages_fetched > 0:
+                if is_upstream_failure(e):
+                    breaker.record_failure(str(e))
+                failed_attempts += 1
+                # Give up at once if this failure opened the circuit, a later page
+                # failed, or the first page failed too many times
+                if breaker.is_open() or pages_fetched > 0 or failed_attempts >= max_attempts:
                     break
+                # Add longer delay before retrying
+                current_span().add('retries')
+                traced_sleep(3)
                                     
     except Exception as e:
         print(f"Error scraping DuckDuckGo: {e}")
     
     # Generate fallback results if we couldn't get any real search results
-    if not results:
+    if not results and use_fallback:
         print("Using fallback search results for query: " + query)
-        # Create some fallback results based on the query
-        results = [
-            {
-                'title': f"Search for '{query}'",
-                'description': f"Search the web for information about '{query}' using your favorite search engine.",
-                'url': f"https://www.google.com/search?q={formatted_query}"
-            },
-            {
-                'title': f"Wikipedia - {query}",
-                'description': f"Find information about '{query}' on Wikipedia, the free encyclopedia.",
-                'url': f"https://en.wikipedia.org/wiki/Special:Search?search={formatted_query}"
-            },
-            {
-                'title': f"YouTube - {query}",
-                'description': f"Watch videos related to '{query}' on YouTube.",
-                'url': f"https://www.youtube.com/results?search_query={formatted_query}"
-            }
-        ]
+        fallbacks.labels('duckduckgo').inc()
+        results = get_fallback_search_results(query)
     
     # Get page count safely, defaulting to 0 if undefined
     pages = pages_fetched if 'pages_fetched' in locals() else 0
+    annotate(pages=pages, results=len(results))
     print(f"Found {len(results)} search results for query: {query} across {pages} pages")
     return results
 
+@traced('search.bing')
+def get_bing_results(query, max_results=50):
+    """
+    Scrape Bing web search results for a given query.
+    
+    Args:
+        query (str): The search query.
+        max_results (int): Maximum number of results to return.
+        
+    Returns:
+        list: List of SearchResult records (title, description, and URL).
+    """
+    results = []
+    seen_keys = set()
+    
+    formatted_query = query.replace(' ', '+')
+    
+    headers = {
+        'User-Agent': get_random_user_agent(),
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Referer': 'https://www.bing.com/',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+    }
+    
+    breaker = get_breaker('bing')
+    
+    try:
+        # Bing serves 10 results per page; "first" is the 1-based offset of the page
+        max_pages = 5
+        for page in range(max_pages):
+            if len(results) >= max_results:
+                break
+            
+            if not breaker.allow_request():
+                print("Bing circuit is open. Skipping request.")
+                break
+            
+            url = f'https://www.bing.com/search?q={formatted_query}&first={page * 10 + 1}'
+            try:
+                response = http_get(url, headers=headers, timeout=15)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                if is_upstream_failure(e):
+                    breaker.record_failure(str(e))
+                raise
+            
+            soup = BeautifulSoup(response.text, 'html.parser')
+            search_results = soup.select('li.b_algo')
+            
+            if not search_results:
+                if looks_blocked(response.text):
+                    print("Bing may be blocking our requests.")
+                    blocks.labels('bing').inc()
+                    breaker.record_failure('captcha')
+                break
+            
+            breaker.record_success()
+            
+            new_results_found = False
+            for result in search_results:
+                if len(results) >= max_results:
+                    break
+                
+                title_elem = result.select_one('h2 a')
+                if not title_elem or not title_elem.get('href'):
+                    continue
+                
+                description_elem = result.select_one('.b_caption p') or result.find('p')
+                title = title_elem.text.strip()
+                description = description_elem.text.strip() if description_elem else "No description available."
+                url = unwrap_redirect(title_elem.get('href'))
+                
+                key = url_key(url)
+                if title and key not in seen_keys:
+                    seen_keys.add(key)
+                    results.append(SearchResult(title, description, url))
+                    new_results_found = True
+            
+            if not new_results_found:
+                break
+            
+            # Small delay to avoid rate limiting
+            traced_sleep(1)
+    except Exception as e:
+        print(f"Error scraping Bing: {e}")
+    
+    print(f"Found {len(results)} Bing results for query: {query}")
+    return results
+
+@traced('search')
 def get_search_results(query, max_results=500):
     """
-    Get search results from multiple search engines if needed.
-    Currently using only DuckDuckGo for simplicity.
+    Get search results from multiple search engines.
+    Engines are queried through the federation layer in search_providers,
+    which hedges slow engines and merges their rankings.
     Increased max_results to 500 for more comprehensive results.
     
     Args:
@@ -225,30 +389,39 @@ def get_search_results(query, max_results=500):
         max_results (int): Maximum number of results to return, up to 500.
         
     Returns:
-        list: List of dictionaries containing title, description, and URL.
+        list: List of SearchResult records (title, description, and URL).
     """
+    # Imported here to avoid a circular import (providers wrap the scrapers above)
+    from search_providers import federated_search
+    
     # Add a small delay to avoid rate limiting
-    time.sleep(1)
+    traced_sleep(1)
     
     # Limit max_results to 500 to prevent excessive requests
     effective_max = min(max_results, 500)
     
-    # Get results from DuckDuckGo
-    results = get_duckduckgo_results(query, effective_max)
+    # Query the engines, hedging against a slow or blocked one;
+    # concurrent identical searches share one crawl
+    key = (' '.join(query.lower().split()), effective_max)
+    results = search_flight.do(key, federated_search, query, effective_max)
+    annotate(results=len(results))
     
-    # If no results were found, include a fallback that explains how to search
+    # Fall back to static search links if no engine returned anything
     if not results:
-        results = [{
-            'title': 'No results found',
-            'description': 'Try rephrasing your query or using different search terms.',
-            'url': '#'
-        }]
+        print("Using fallback search results for query: " + query)
+        fallbacks.labels('search').inc()
+        results = get_fallback_search_results(query)
     
     return results
 
+@traced('page_text')
 def get_website_text(url, max_paragraphs=3):
     """
     Extract main text content from a website.
+    The page is downloaded once in streaming mode: non-HTML responses are
+    skipped from their headers and the body is capped before trafilatura
+    extracts the main text (see page_extractor.stream_extract).
+    Extracted text is also added to the local full-text index (see page_index).
     
     Args:
         url (str): The URL to scrape.
@@ -257,45 +430,32 @@ def get_website_text(url, max_paragraphs=3):
     Returns:
         str: Extracted text content.
     """
-    import trafilatura
-    
     headers = {'User-Agent': get_random_user_agent()}
     
+    # Equivalent URLs share one cache entry
+    cache_key = (url_key(url), max_paragraphs)
+    cached_text = page_text_cache.get(cache_key)
+    annotate(url=url, cache='hit' if cached_text is not None else 'miss')
+    if cached_text is not None:
+        return cached_text
+    
     try:
-        # First try with trafilatura for better content extraction
-        downloaded = trafilatura.fetch_url(url)
-        if downloaded:
-            extracted_text = trafilatura.extract(downloaded)
-            if extracted_text and len(extracted_text) > 100:
-                # Take only a portion of the text to avoid overwhelming
-                paragraphs = extracted_text.split('\n\n')
-                selected_paragraphs = paragraphs[:max_paragraphs]
-                return '\n\n'.join(selected_paragraphs)
-        
-        # Fallback to BeautifulSoup method
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.extract()
-        
-        # Get paragraphs
-        paragraphs = soup.find_all('p')
-        
-        # Get plain text from paragraphs
-        text = ""
-        for i, p in enumerate(paragraphs):
-            if i >= max_paragraphs:
-                break
-            
-            p_text = p.get_text()
-            if len(p_text.strip()) > 20:  # Only include paragraphs with meaningful content
-                text += p_text + "\n\n"
+        def extract():
+            text = stream_extract(url, max_paragraphs, headers=headers, timeout=10)
+            # Feed the local full-text index so later queries can be answered without a crawl
+            index_page(url, text)
+            return text
         
-        return clean_text(text)
+        # Concurrent callers for the same page wait on one download
+        text = page_flight.do(cache_key, extract)
+        page_text_cache.set(cache_key, text)
+        return text
+    except UnsupportedContentTypeError as e:
+        print(f"Skipping {url}: {e}")
+        text = "Information could not be retrieved from this website."
+        # Remember non-HTML pages so they aren't requested again
+        page_text_cache.set(cache_key, text)
+        return text
     except Exception as e:
         print(f"Error extracting text from {url}: {e}")
         return "Information could not be retrieved from this website."
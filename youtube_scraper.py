@@ -2,7 +2,11 @@ import requests
 from bs4 import BeautifulSoup
 import re
 import random
-import time
+from http_client import http_get
+from circuit_breaker import get_breaker, looks_blocked, is_upstream_failure, CircuitOpenError
+from records import Video
+from tracing import traced, traced_sleep, current_span
+from metrics import blocks, fallbacks
 
 # List of user agents to rotate
 USER_AGENTS = [
@@ -26,6 +30,7 @@ def extract_video_id(url):
         video_id = url.split('youtu.be/')[1].split('?')[0]
     return video_id
 
+@traced('videos')
 def get_youtube_videos(query, max_results=3):
     """
     Scrape YouTube search results for a given query.
@@ -35,7 +40,7 @@ def get_youtube_videos(query, max_results=3):
         max_results (int): Maximum number of results to return.
         
     Returns:
-        list: List of dictionaries containing video info.
+        list: List of Video records.
     """
     videos = []
     
@@ -52,14 +57,21 @@ def get_youtube_videos(query, max_results=3):
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
     }
     
+    # Shared across sessions so a blocked YouTube fails fast for everyone
+    breaker = get_breaker('youtube')
+    
     # Try multiple methods to extract video information
     try:
         # Method 1: Scrape YouTube search results page
         max_attempts = 2
         for attempt in range(max_attempts):
+            # Skip YouTube entirely while its circuit is open
+            if not breaker.allow_request():
+                raise CircuitOpenError("YouTube circuit is open. Skipping request.")
+            
             try:
                 # Get search results page with increased timeout
-                response = requests.get(url, headers=headers, timeout=15)
+                response = http_get(url, headers=headers, timeout=15)
                 response.raise_for_status()
                 
                 # Extract video IDs using regex patterns (try multiple patterns)
@@ -81,17 +93,27 @@ def get_youtube_videos(query, max_results=3):
                 
                 # If we found video IDs, break the retry loop
                 if unique_video_ids:
+                    breaker.record_success()
                     break
+                
+                if looks_blocked(response.text):
+                    blocks.labels('youtube').inc()
+                    breaker.record_failure('captcha')
                     
                 # If no video IDs found and we have another attempt, try with a different user agent
                 if attempt < max_attempts - 1:
                     headers['User-Agent'] = get_random_user_agent()
-                    time.sleep(2)  # Wait before retry
+                    current_span().add('retries')
+                    traced_sleep(2)  # Wait before retry
                     
             except requests.exceptions.RequestException as req_err:
                 print(f"Request error in attempt {attempt+1}: {req_err}")
-                if attempt < max_attempts - 1:
-                    time.sleep(2)  # Wait before retry
+                if is_upstream_failure(req_err):
+                    breaker.record_failure(str(req_err))
+                # Retry only if this failure didn't open the circuit
+                if attempt < max_attempts - 1 and not breaker.is_open():
+                    current_span().add('retries')
+                    traced_sleep(2)  # Wait before retry
                     headers['User-Agent'] = get_random_user_agent()
                 else:
                     raise  # Re-raise on last attempt
@@ -120,14 +142,7 @@ def get_youtube_videos(query, max_results=3):
                                 break
                                 
                             if video_id and title:
-                                video_url = f'https://www.youtube.com/watch?v={video_id}'
-                                videos.append({
-                                    'id': video_id,
-                                    'title': title,
-                                    'url': video_url,
-                                    'thumbnail': f'https://i.ytimg.com/vi/{video_id}/hqdefault.jpg',
-                                    'embed_url': f'https://www.youtube.com/embed/{video_id}'
-                                })
+                                videos.append(Video(video_id, title))
                 except Exception as e:
                     print(f"Error parsing YouTube initial data: {e}")
         
@@ -144,13 +159,23 @@ def get_youtube_videos(query, max_results=3):
             # Get video details
             video_url = f'https://www.youtube.com/watch?v={video_id}'
             
+            # Stop fetching video pages once YouTube starts failing
+            if breaker.is_open():
+                break
+            
             try:
                 # Add longer delay between video requests
-                time.sleep(1)  # Increased delay to avoid rate limiting
+                traced_sleep(1)  # Increased delay to avoid rate limiting
                 
                 # Get video page
-                video_response = requests.get(video_url, headers=headers, timeout=15)
-                video_response.raise_for_status()
+                try:
+                    video_response = http_get(video_url, headers=headers, timeout=15)
+                    video_response.raise_for_status()
+                except requests.exceptions.RequestException as video_err:
+                    # A dead or removed video is not a YouTube failure
+                    if is_upstream_failure(video_err):
+                        breaker.record_failure(f"video page {video_id}: {video_err}")
+                    raise
                 
                 soup = BeautifulSoup(video_response.text, 'html.parser')
                 
@@ -195,13 +220,7 @@ def get_youtube_videos(query, max_results=3):
                 if title:
                     # Make sure this video ID isn't already in our results
                     if not any(v['id'] == video_id for v in videos):
-                        videos.append({
-                            'id': video_id,
-                            'title': title,
-                            'url': video_url,
-                            'thumbnail': f'https://i.ytimg.com/vi/{video_id}/hqdefault.jpg',
-                            'embed_url': f'https://www.youtube.com/embed/{video_id}'
-                        })
+                        videos.append(Video(video_id, title))
                         count += 1
             except Exception as e:
                 print(f"Error getting video details for {video_id}: {e}")
@@ -213,42 +232,19 @@ def get_youtube_videos(query, max_results=3):
     # Generate topic-specific fallbacks if no videos were found
     if not videos:
         print(f"No videos found for query: {query}. Using fallback sources.")
+        fallbacks.labels('videos').inc()
         formatted_query = query.lower()
         
         # Topic-based fallbacks with real YouTube video IDs
         if any(word in formatted_query for word in ['nature', 'wildlife', 'animals']):
-            videos = [{
-                'id': 'eCEG4QyQbF4',
-                'title': 'Animals and Wildlife Nature Documentary',
-                'url': 'https://www.youtube.com/watch?v=eCEG4QyQbF4',
-                'thumbnail': 'https://i.ytimg.com/vi/eCEG4QyQbF4/hqdefault.jpg',
-                'embed_url': 'https://www.youtube.com/embed/eCEG4QyQbF4'
-            }]
+            videos = [Video('eCEG4QyQbF4', 'Animals and Wildlife Nature Documentary')]
         elif any(word in formatted_query for word in ['tech', 'technology', 'ai', 'artificial intelligence']):
-            videos = [{
-                'id': 'oV_ByjNhOtA',
-                'title': 'The Insane Future of AI Technology',
-                'url': 'https://www.youtube.com/watch?v=oV_ByjNhOtA',
-                'thumbnail': 'https://i.ytimg.com/vi/oV_ByjNhOtA/hqdefault.jpg',
-                'embed_url': 'https://www.youtube.com/embed/oV_ByjNhOtA'
-            }]
+            videos = [Video('oV_ByjNhOtA', 'The Insane Future of AI Technology')]
         elif any(word in formatted_query for word in ['history', 'historical', 'ancient']):
-            videos = [{
-                'id': 'xuCn8ux2gbs',
-                'title': 'History of the World',
-                'url': 'https://www.youtube.com/watch?v=xuCn8ux2gbs',
-                'thumbnail': 'https://i.ytimg.com/vi/xuCn8ux2gbs/hqdefault.jpg',
-                'embed_url': 'https://www.youtube.com/embed/xuCn8ux2gbs'
-            }]
+            videos = [Video('xuCn8ux2gbs', 'History of the World')]
         else:
             # Generic fallback
-            videos = [{
-                'id': 'dQw4w9WgXcQ',
-                'title': 'Top ranked YouTube video for your search',
-                'url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
-                'thumbnail': 'https://i.ytimg.com/vi/dQw4w9WgXcQ/hqdefault.jpg',
-                'embed_url': 'https://www.youtube.com/embed/dQw4w9WgXcQ'
-            }]
+            videos = [Video('dQw4w9WgXcQ', 'Top ranked YouTube video for your search')]
     
     # Limit to requested number of results
     return videos[:max_results]